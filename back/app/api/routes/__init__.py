@@ -1,6 +1,7 @@
 from .auth import router as auth_router
 from .diary import router as diary_router
 from .friend import router as friend_router
+from .job import router as job_router
 from .user import router as user_router
 
-__all__ = ["auth_router", "diary_router", "friend_router", "user_router"]
\ No newline at end of file
+__all__ = ["auth_router", "diary_router", "friend_router", "job_router", "user_router"]
\ No newline at end of file
@@ -1,11 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
 from datetime import timedelta
-from ...core.database import get_db
-from ...core.security import create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from ...core.database import get_async_db
+from ...core.security import create_access_token, get_password_hash_async, ACCESS_TOKEN_EXPIRE_MINUTES
 from ...schemas.user import UserCreate, UserResponse, Token
-from ...crud.user import get_user_by_username, get_user_by_email, create_user, authenticate_user
+from ...crud.user import get_user_by_username, get_user_by_email, create_user, authenticate_user_async
 
 router = APIRouter(
     prefix="/auth",
@@ -14,10 +13,10 @@ router = APIRouter(
 )
 
 @router.post("/register", response_model=UserResponse)
-async def register_user(user: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: UserCreate, db = Depends(get_async_db)):
     """新規ユーザー登録"""
     # ユーザー名が既に存在するか確認
-    db_user = get_user_by_username(db, username=user.username)
+    db_user = await db.run_sync(get_user_by_username, username=user.username)
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -25,20 +24,21 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
         )
     
     # メールアドレスが既に存在するか確認
-    db_user = get_user_by_email(db, email=user.email)
+    db_user = await db.run_sync(get_user_by_email, email=user.email)
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="このメールアドレスは既に使用されています"
         )
     
-    # ユーザーを作成
-    return create_user(db=db, user=user)
+    # ユーザーを作成（bcryptの計算はイベントループをブロックしないよう専用のプールで行う）
+    hashed_password = await get_password_hash_async(user.password)
+    return await db.run_sync(create_user, user=user, hashed_password=hashed_password)
 
 @router.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db = Depends(get_async_db)):
     """アクセストークンを取得（ログイン）"""
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user_async(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -49,7 +49,7 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     # アクセストークンを生成
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": user.username, "uid": user.id}, expires_delta=access_token_expires
     )
     
     return {"access_token": access_token, "token_type": "bearer"}
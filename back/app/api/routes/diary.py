@@ -1,19 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
 from sqlalchemy.orm import Session
-from typing import List
-from ...core.database import get_db
+from ...core.database import get_async_db
 from ...core.security import get_current_user
-from ...models.user import User
-from ...schemas.diary import DiaryCreate, DiaryResponse, DiaryDetail, DiaryRules, DiaryLikeResponse, OwnDiaryResponse
+from ...schemas.user import CurrentUser
+from ...schemas.diary import DiaryCreate, DiaryResponse, DiaryDetail, DiaryRules, DiaryLikeResponse, DiaryLikeStatusRequest, OwnDiaryResponse, DiaryPage, OwnDiaryPage
 from ...crud.diary import (
     get_diary, get_diary_by_user, get_user_diaries, get_public_diaries,
-    get_friend_diaries, get_specific_friend_diaries, create_diary, increment_view_count, like_diary, unlike_diary, delete_diary
+    get_specific_friend_diaries, create_diary, increment_view_count, like_diary, unlike_diary, delete_diary,
+    get_liked_diary_ids, check_user_liked_diary, get_user_diaries_by_period,
+    get_diary_feedback as get_diary_feedback_record, get_monthly_feedback as get_monthly_feedback_record
 )
-from ...crud.friend import get_friend_ids, create_notification, are_friends
+from ...crud.friend import are_friends
+from ...services.timeline_service import get_timeline
 from ...utils.diary_rules import generate_random_rules
-from app.services.gemini_service import generate_feedback_from_diary, generate_monthly_feedback_from_diaries
-from app.crud import diary as crud_diary
-from app.models.diary import Feedback
+from ...services.feedback_jobs import enqueue_diary_feedback, enqueue_monthly_feedback
+from ...services.feedback_stream import stream_diary_feedback_events, stream_monthly_feedback_events
+from ...services.monthly_feedback import month_range
 
 router = APIRouter(
     prefix="/diary",
@@ -21,104 +25,103 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+# SSEのレスポンスをキャッシュ・バッファリングさせない
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
 @router.post("", response_model=DiaryResponse)
-def create_new_diary(
+async def create_new_diary(
     diary: DiaryCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """新しい日記を投稿する"""
-    return create_diary(db=db, diary=diary, user_id=current_user.id)
+    return await db.run_sync(create_diary, diary, current_user.id)
 
 @router.get("/random_rules", response_model=DiaryRules)
-def get_random_rules(current_user: User = Depends(get_current_user)):
+async def get_random_rules(current_user: CurrentUser = Depends(get_current_user)):
     """次の投稿時のランダム制限ルールを取得する"""
     return generate_random_rules()
 
-@router.get("/my", response_model=List[OwnDiaryResponse])
-def read_own_diaries(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+@router.get("/my", response_model=OwnDiaryPage)
+async def read_own_diaries(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=100),
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """自分の全日記一覧を取得する（is_viewable関係なく全件）"""
-    diaries = crud_diary.get_user_diaries(db, user_id=current_user.id, skip=skip, limit=limit)
-    return diaries
+    try:
+        diaries, next_cursor = await db.run_sync(get_user_diaries, current_user.id, cursor, limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="カーソルが不正です")
+    return {"items": diaries, "next_cursor": next_cursor}
 
-@router.get("/public", response_model=List[DiaryResponse])
-def read_public_diaries(
-    skip: int = 0,
-    limit: int = 20,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+@router.get("/public", response_model=DiaryPage)
+async def read_public_diaries(
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """公開中の日記一覧を取得する（閲覧可能時間内のもの）"""
-    diaries = get_public_diaries(db, skip=skip, limit=limit)
-    return diaries
+    try:
+        diaries, next_cursor = await db.run_sync(get_public_diaries, cursor, limit, current_user.id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="カーソルが不正です")
+    return {"items": diaries, "next_cursor": next_cursor}
 
-@router.get("/feed", response_model=List[DiaryResponse])
-def read_friend_diaries(
-    skip: int = 0,
-    limit: int = 20,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+@router.get("/feed", response_model=DiaryPage)
+async def read_friend_diaries(
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """フレンドの公開中の日記一覧を取得する（閲覧可能時間内のもの）"""
-    print(f"=== フレンド日記取得開始 ===")
-    print(f"ユーザーID: {current_user.id}, ユーザー名: {current_user.username}")
-    
-    friend_ids = get_friend_ids(db, current_user.id)
-    print(f"フレンドID一覧: {friend_ids}")
-    
-    diaries = get_friend_diaries(db, current_user.id, friend_ids, skip=skip, limit=limit)
-    print(f"取得した日記数: {len(diaries)}")
-    
-    # 各日記の詳細情報をログ出力
-    for diary in diaries:
-        print(f"日記詳細 - ID: {diary.id}, ユーザー: {diary.user.username if diary.user else 'Unknown'}, タイトル: {diary.title}, is_viewable: {diary.is_viewable}")
-    
-    print(f"=== フレンド日記取得完了 ===")
-    return diaries
+    try:
+        # フレンドの日記は投稿時にタイムラインへ書き込み済みなので、範囲読み込みだけで取得できる
+        diaries, next_cursor = await db.run_sync(get_timeline().read, current_user.id, cursor, limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="カーソルが不正です")
+    return {"items": diaries, "next_cursor": next_cursor}
 
-@router.get("/friend/{friend_id}", response_model=List[DiaryResponse])
-def read_specific_friend_diaries(
+@router.get("/friend/{friend_id}", response_model=DiaryPage)
+async def read_specific_friend_diaries(
     friend_id: int,
-    skip: int = 0,
-    limit: int = 20,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """特定のフレンドの公開中の日記一覧を取得する（閲覧可能時間内のもの）"""
-    print(f"=== 特定フレンド日記取得開始 ===")
-    print(f"ユーザーID: {current_user.id}, ユーザー名: {current_user.username}")
-    print(f"対象フレンドID: {friend_id}")
-    
     # フレンド関係をチェック
-    are_friends_result = are_friends(db, current_user.id, friend_id)
-    print(f"フレンド関係チェック結果: {are_friends_result}")
-    
-    if not are_friends_result:
+    if not await db.run_sync(are_friends, current_user.id, friend_id):
         raise HTTPException(status_code=403, detail="このユーザーの日記を閲覧する権限がありません")
     
-    diaries = get_specific_friend_diaries(db, friend_id, skip=skip, limit=limit)
-    print(f"取得した日記数: {len(diaries)}")
-    
-    # 各日記の詳細情報をログ出力
-    for diary in diaries:
-        print(f"日記詳細 - ID: {diary.id}, ユーザー: {diary.user.username if diary.user else 'Unknown'}, タイトル: {diary.title}, is_viewable: {diary.is_viewable}")
-    
-    print(f"=== 特定フレンド日記取得完了 ===")
-    return diaries
+    try:
+        diaries, next_cursor = await db.run_sync(get_specific_friend_diaries, friend_id, cursor, limit, current_user.id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="カーソルが不正です")
+    return {"items": diaries, "next_cursor": next_cursor}
+
+@router.post("/like-status", summary="複数の日記のいいね状態を確認")
+async def check_like_statuses(
+    request: DiaryLikeStatusRequest,
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """複数の日記のいいね状態を1回のクエリでまとめて確認する"""
+    liked_ids = await db.run_sync(get_liked_diary_ids, current_user.id, request.diary_ids)
+    return {"is_liked": {diary_id: diary_id in liked_ids for diary_id in request.diary_ids}}
 
 @router.get("/{diary_id}", response_model=DiaryDetail)
-def read_diary(
+async def read_diary(
     diary_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """特定の日記を取得する（閲覧可能時間のチェック付き）"""
-    diary = get_diary(db, diary_id=diary_id)
+    diary = await db.run_sync(get_diary, diary_id)
     if diary is None:
         raise HTTPException(status_code=404, detail="日記が見つかりません")
     
@@ -131,133 +134,131 @@ def read_diary(
         raise HTTPException(status_code=403, detail="この日記はもう閲覧できません")
     
     # 閲覧カウントを増やす（自分の日記でない場合のみ）
-    increment_view_count(db, diary_id)
+    await db.run_sync(increment_view_count, diary_id)
     
     return diary
 
 @router.post("/{diary_id}/view", response_model=DiaryResponse)
-def view_diary(
+async def view_diary(
     diary_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """日記の閲覧記録を残す（閲覧カウントを増やす）"""
-    diary = get_diary(db, diary_id=diary_id)
+    diary = await db.run_sync(get_diary, diary_id)
     if diary is None:
         raise HTTPException(status_code=404, detail="日記が見つかりません")
     
     # 自分の日記ではない場合のみカウントを増やす
     if diary.user_id != current_user.id:
-        diary = increment_view_count(db, diary_id)
+        diary = await db.run_sync(increment_view_count, diary_id)
         if diary is None:
             raise HTTPException(status_code=404, detail="日記が見つかりません")
     
     return diary
 
 @router.post("/{diary_id}/like", response_model=DiaryLikeResponse)
-def like_diary_endpoint(
+async def like_diary_endpoint(
     diary_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """日記にいいねを付ける"""
-    diary = get_diary(db, diary_id=diary_id)
-    if diary is None:
-        raise HTTPException(status_code=404, detail="日記が見つかりません")
-    
-    like = like_diary(db, diary_id, current_user.id)
-    if like is None:
+    result = await db.run_sync(like_diary, diary_id, current_user.id)
+    if result is None:
         raise HTTPException(status_code=400, detail="すでにいいね済みか、日記が存在しません")
-    
-    # いいね通知を作成（自分の日記でない場合のみ）
-    if diary.user_id != current_user.id:
-        create_notification(
-            db,
-            diary.user_id,
-            "あなたの日記にいいねがつきました",
-            "like",
-            diary_id
-        )
-    
+    # いいね通知（自分の日記でない場合のみ。同じ日記への未読のいいねは1件にまとめる）もlike_diaryが同じトランザクションで作成する
+    like, _ = result
     return like
 
 @router.delete("/{diary_id}/like", status_code=204)
-def unlike_diary_endpoint(
+async def unlike_diary_endpoint(
     diary_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """日記のいいねを取り消す"""
-    result = unlike_diary(db, diary_id, current_user.id)
+    result = await db.run_sync(unlike_diary, diary_id, current_user.id)
     if not result:
         raise HTTPException(status_code=404, detail="いいねが見つかりません")
 
 @router.get("/{diary_id}/like", summary="いいね状態を確認")
-def check_like_status(
+async def check_like_status(
     diary_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """日記のいいね状態を確認する"""
-    from ...crud.diary import check_user_liked_diary
-    is_liked = check_user_liked_diary(db, diary_id, current_user.id)
+    is_liked = await db.run_sync(check_user_liked_diary, diary_id, current_user.id)
     return {"is_liked": is_liked}
 
 @router.delete("/{diary_id}", status_code=204)
-def delete_diary_endpoint(
+async def delete_diary_endpoint(
     diary_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """日記を削除する（自分の日記のみ）"""
-    result = delete_diary(db, diary_id, current_user.id)
+    result = await db.run_sync(delete_diary, diary_id, current_user.id)
     if not result:
         raise HTTPException(status_code=404, detail="日記が見つからないか、削除権限がありません")
 
 @router.post("/{diary_id}/feedback", summary="日記のフィードバックを生成")
 async def create_diary_feedback(
     diary_id: int,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """
     日記の内容を元にGemini APIでフィードバックを生成し、DBに保存する。
-    API呼び出しに時間がかかる可能性があるため、バックグラウンドタスクとして実行する。
+    API呼び出しに時間がかかる可能性があるため、ジョブとしてワーカーが実行する。
+    生成中に再度呼び出した場合は新しいジョブを追加せず、生成中のジョブを返す。
     """
-    db_diary = crud_diary.get_diary_by_user(db, user_id=current_user.id, diary_id=diary_id)
+    db_diary = await db.run_sync(get_diary_by_user, current_user.id, diary_id)
     if not db_diary:
         raise HTTPException(status_code=404, detail="日記が見つかりません")
 
     # 既存のフィードバックがあればそれを返す
-    existing_feedback = db.query(Feedback).filter(Feedback.diary_id == diary_id).first()
+    existing_feedback = await db.run_sync(get_diary_feedback_record, diary_id)
     if existing_feedback:
         return {"message": "フィードバックは既に存在します。"}
 
-    def task():
-        feedback_content = generate_feedback_from_diary(db_diary.content)
-        db_feedback = Feedback(
-            diary_id=diary_id,
-            user_id=current_user.id,
-            content=feedback_content
-        )
-        db.add(db_feedback)
-        db.commit()
+    job = await db.run_sync(enqueue_diary_feedback, diary_id, current_user.id)
 
-    background_tasks.add_task(task)
-    
-    return {"message": "フィードバックの生成を開始しました。少し時間をおいてから再度確認してください。"}
+    return {
+        "message": "フィードバックの生成を開始しました。少し時間をおいてから再度確認してください。",
+        "job_id": job.id,
+        "status": job.status,
+    }
+
+@router.get("/{diary_id}/feedback/stream", summary="日記のフィードバックを生成しながら受け取る")
+async def stream_diary_feedback(
+    diary_id: int,
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    日記のフィードバックを生成しながら、Server-Sent Eventsで少しずつ返す。
+    生成が終わったらフィードバックを保存する。保存済みの場合はその全文を返す。
+    """
+    db_diary = await db.run_sync(get_diary_by_user, current_user.id, diary_id)
+    if not db_diary:
+        raise HTTPException(status_code=404, detail="日記が見つかりません")
+    # yieldの依存関係はストリームが終わるまで閉じられないため、ここで接続をプールに返しておく
+    await db.run_sync(Session.close)
+    return StreamingResponse(
+        stream_diary_feedback_events(diary_id, current_user.id),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
 
 @router.get("/{diary_id}/feedback", summary="日記のフィードバックを取得")
-def get_diary_feedback(
+async def get_diary_feedback(
     diary_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    feedback = db.query(Feedback).filter(
-        Feedback.diary_id == diary_id,
-        Feedback.user_id == current_user.id
-    ).first()
+    feedback = await db.run_sync(get_diary_feedback_record, diary_id, current_user.id)
     if not feedback:
         raise HTTPException(status_code=404, detail="フィードバックが見つかりません")
     return feedback
@@ -266,77 +267,73 @@ def get_diary_feedback(
 async def create_monthly_feedback(
     year: int,
     month: int,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    regenerate: bool = False,
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """
-    指定された年月の日記を全て取得し、月ごとのフィードバックを生成する。
-    API呼び出しに時間がかかる可能性があるため、バックグラウンドタスクとして実行する。
+    指定された年月の日記の要約から、月ごとのフィードバックを生成する。
+    API呼び出しに時間がかかる可能性があるため、ジョブとしてワーカーが実行する。
+    生成中に再度呼び出した場合は新しいジョブを追加せず、生成中のジョブを返す。
+    regenerate=trueの場合は既存のフィードバックを作り直す（要約がまだの日記だけを要約する）。
     """
-    # 指定された年月の日記を取得（日本時間で処理）
-    from datetime import datetime, timezone, timedelta
-    # 日本時間のタイムゾーンを定義
-    jst = timezone(timedelta(hours=9))
-    
-    # 指定された年月の開始日と終了日を日本時間で設定
-    start_date = datetime(year, month, 1, tzinfo=jst)
-    if month == 12:
-        end_date = datetime(year + 1, 1, 1, tzinfo=jst)
-    else:
-        end_date = datetime(year, month + 1, 1, tzinfo=jst)
-    
-    # UTCに変換してデータベースクエリに使用
-    start_date_utc = start_date.astimezone(timezone.utc)
-    end_date_utc = end_date.astimezone(timezone.utc)
+    # 指定された年月の開始日と終了日（日本時間）をUTCに変換してデータベースクエリに使用
+    start_date_utc, end_date_utc = month_range(year, month)
     
     # ユーザーの日記を取得
-    user_diaries = crud_diary.get_user_diaries_by_period(db, current_user.id, start_date_utc, end_date_utc)
+    user_diaries = await db.run_sync(get_user_diaries_by_period, current_user.id, start_date_utc, end_date_utc)
     
     if not user_diaries:
         raise HTTPException(status_code=404, detail="指定された月に日記が見つかりません")
     
     # 既存の月ごとフィードバックがあればそれを返す
-    existing_feedback = db.query(Feedback).filter(
-        Feedback.user_id == current_user.id,
-        Feedback.period == f"{year}-{month:02d}",
-        Feedback.diary_id.is_(None)  # 月ごとフィードバックはdiary_idがnull
-    ).first()
+    period = f"{year}-{month:02d}"
+    existing_feedback = await db.run_sync(get_monthly_feedback_record, current_user.id, period)
     
-    if existing_feedback:
+    if existing_feedback and not regenerate:
         return {"message": "月ごとフィードバックは既に存在します。"}
 
-    def task():
-        # 全ての日記の内容を結合
-        all_content = "\n\n".join([diary.content for diary in user_diaries])
-        feedback_content = generate_monthly_feedback_from_diaries(all_content, year, month)
-        
-        db_feedback = Feedback(
-            diary_id=None,  # 月ごとフィードバックはdiary_idがnull
-            user_id=current_user.id,
-            period=f"{year}-{month:02d}",
-            content=feedback_content
-        )
-        db.add(db_feedback)
-        db.commit()
+    job = await db.run_sync(enqueue_monthly_feedback, current_user.id, period)
 
-    background_tasks.add_task(task)
-    
-    return {"message": "月ごとフィードバックの生成を開始しました。少し時間をおいてから再度確認してください。"}
+    return {
+        "message": "月ごとフィードバックの生成を開始しました。少し時間をおいてから再度確認してください。",
+        "job_id": job.id,
+        "status": job.status,
+    }
+
+@router.get("/monthly-feedback/{year}/{month}/stream", summary="月ごとのフィードバックを生成しながら受け取る")
+async def stream_monthly_feedback(
+    year: int,
+    month: int,
+    regenerate: bool = False,
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    月ごとのフィードバックを生成しながら、Server-Sent Eventsで少しずつ返す。
+    生成が終わったらフィードバックを保存する。保存済みの場合はその全文を返す
+    （regenerate=trueの場合は作り直す）。
+    """
+    start_date_utc, end_date_utc = month_range(year, month)
+    user_diaries = await db.run_sync(get_user_diaries_by_period, current_user.id, start_date_utc, end_date_utc)
+    if not user_diaries:
+        raise HTTPException(status_code=404, detail="指定された月に日記が見つかりません")
+    await db.run_sync(Session.close)
+    return StreamingResponse(
+        stream_monthly_feedback_events(current_user.id, year, month, regenerate),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
 
 @router.get("/monthly-feedback/{year}/{month}", summary="月ごとのフィードバックを取得")
-def get_monthly_feedback(
+async def get_monthly_feedback(
     year: int,
     month: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """指定された年月の月ごとフィードバックを取得する"""
-    feedback = db.query(Feedback).filter(
-        Feedback.user_id == current_user.id,
-        Feedback.period == f"{year}-{month:02d}",
-        Feedback.diary_id.is_(None)  # 月ごとフィードバックはdiary_idがnull
-    ).first()
+    feedback = await db.run_sync(get_monthly_feedback_record, current_user.id, f"{year}-{month:02d}")
     
     if not feedback:
         raise HTTPException(status_code=404, detail="月ごとフィードバックが見つかりません")
@@ -1,21 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
-from ...core.database import get_db
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, Depends, HTTPException, status, Query, WebSocket, WebSocketDisconnect
+from typing import List, Optional
+from ...core.database import get_async_db
 from ...core.security import get_current_user
-from ...models.user import User
-from ...schemas.user import UserResponse
+from ...schemas.user import UserResponse, CurrentUser
 from ...schemas.friend import (
-    FriendRequestResponse, FriendRequestDetail, NotificationResponse, FeedbackResponse
+    FriendRequestResponse, FriendRequestDetail, NotificationResponse, NotificationPage, NotificationCount, FeedbackResponse
 )
-from ...schemas.diary import DiaryResponse
+from ...schemas.diary import DiaryPage
 from ...crud.friend import (
     get_friend_request, get_friend_requests, get_sent_friend_requests, 
     create_friend_request, update_friend_request, get_friends, 
-    get_notifications, mark_notification_as_read, mark_all_notifications_as_read,
-    get_latest_feedback, create_feedback
+    get_notifications, get_unread_notification_count, mark_notification_as_read, mark_all_notifications_as_read,
+    get_latest_feedback, create_feedback, are_friends, count_pending_friend_requests
 )
-from ...crud.diary import get_user_diaries
+from ...crud.diary import get_user_diaries, get_specific_friend_diaries
+from ...services.notification_broker import get_broker, Subscription
 
 router = APIRouter(
     prefix="/friend",
@@ -24,27 +25,27 @@ router = APIRouter(
 )
 
 @router.post("/request/{user_id}", response_model=FriendRequestResponse)
-def send_friend_request(
+async def send_friend_request(
     user_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """フレンド申請を送信する"""
-    request = create_friend_request(db, current_user.id, user_id)
+    request = await db.run_sync(create_friend_request, current_user.id, user_id)
     if request is None:
         raise HTTPException(status_code=400, detail="フレンドリクエストを作成できませんでした")
     
     return request
 
 @router.post("/accept/{request_id}", response_model=FriendRequestResponse)
-def accept_friend_request(
+async def accept_friend_request(
     request_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """フレンド申請を承認する"""
     # リクエストが存在し、自分宛てであることを確認
-    request = get_friend_request(db, request_id)
+    request = await db.run_sync(get_friend_request, request_id)
     if not request or request.to_user_id != current_user.id:
         raise HTTPException(status_code=404, detail="フレンドリクエストが見つかりません")
     
@@ -53,21 +54,22 @@ def accept_friend_request(
         raise HTTPException(status_code=400, detail="このリクエストは既に処理済みです")
     
     # リクエストを承認
-    updated_request = update_friend_request(db, request_id, "accepted")
+    updated_request = await db.run_sync(update_friend_request, request_id, "accepted")
     if updated_request is None:
-        raise HTTPException(status_code=404, detail="フレンドリクエストが見つかりません")
+        # 同時に承認・拒否された
+        raise HTTPException(status_code=400, detail="このリクエストは既に処理済みです")
     
     return updated_request
 
 @router.post("/reject/{request_id}", response_model=FriendRequestResponse)
-def reject_friend_request(
+async def reject_friend_request(
     request_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """フレンド申請を拒否する"""
     # リクエストが存在し、自分宛てであることを確認
-    request = get_friend_request(db, request_id)
+    request = await db.run_sync(get_friend_request, request_id)
     if not request or request.to_user_id != current_user.id:
         raise HTTPException(status_code=404, detail="フレンドリクエストが見つかりません")
     
@@ -76,111 +78,173 @@ def reject_friend_request(
         raise HTTPException(status_code=400, detail="このリクエストは既に処理済みです")
     
     # リクエストを拒否
-    updated_request = update_friend_request(db, request_id, "rejected")
+    updated_request = await db.run_sync(update_friend_request, request_id, "rejected")
     if updated_request is None:
-        raise HTTPException(status_code=404, detail="フレンドリクエストが見つかりません")
+        # 同時に承認・拒否された
+        raise HTTPException(status_code=400, detail="このリクエストは既に処理済みです")
     
     return updated_request
 
 @router.get("/requests", response_model=List[FriendRequestDetail])
-def read_friend_requests(
+async def read_friend_requests(
     status: str = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """受信したフレンドリクエスト一覧を取得する"""
-    return get_friend_requests(db, current_user.id, status)
+    return await db.run_sync(get_friend_requests, current_user.id, status)
 
 @router.get("/requests/sent", response_model=List[FriendRequestDetail])
-def read_sent_friend_requests(
+async def read_sent_friend_requests(
     status: str = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """送信したフレンドリクエスト一覧を取得する"""
-    return get_sent_friend_requests(db, current_user.id, status)
+    return await db.run_sync(get_sent_friend_requests, current_user.id, status)
 
 @router.get("/list", response_model=List[UserResponse])
-def read_friends(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+async def read_friends(
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """フレンド一覧を取得する"""
-    return get_friends(db, current_user.id)
+    return await db.run_sync(get_friends, current_user.id)
 
-@router.get("/{user_id}/diaries", response_model=List[DiaryResponse])
-def read_friend_diaries(
+@router.get("/{user_id}/diaries", response_model=DiaryPage)
+async def read_friend_diaries(
     user_id: int,
-    skip: int = 0,
-    limit: int = 20,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """フレンドの公開日記一覧を取得する"""
-    # フレンドリストを取得
-    friends = get_friends(db, current_user.id)
-    friend_ids = [friend.id for friend in friends]
-    
-    # 指定されたユーザーがフレンドリストに含まれているか確認
-    if user_id not in friend_ids and user_id != current_user.id:
+    # 指定されたユーザーがフレンドか確認
+    if user_id != current_user.id and not await db.run_sync(are_friends, current_user.id, user_id):
         raise HTTPException(status_code=403, detail="このユーザーの日記を閲覧する権限がありません")
     
-    # 自分自身の場合は全ての日記を返す
-    if user_id == current_user.id:
-        return get_user_diaries(db, user_id, skip, limit)
-    
-    # フレンドの場合は公開中の日記のみ返す
-    diaries = get_user_diaries(db, user_id, skip, limit)
-    # 閲覧可能な日記のみフィルタリング
-    viewable_diaries = [diary for diary in diaries if diary.is_viewable]
-    
-    return viewable_diaries
+    try:
+        # 自分自身の場合は全ての日記を返す
+        if user_id == current_user.id:
+            diaries, next_cursor = await db.run_sync(get_user_diaries, user_id, cursor, limit)
+        # フレンドの場合は公開中の日記のみ返す（閲覧期限とページネーションはDB側で処理）
+        else:
+            diaries, next_cursor = await db.run_sync(get_specific_friend_diaries, user_id, cursor, limit, viewer_id=current_user.id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="カーソルが不正です")
+    return {"items": diaries, "next_cursor": next_cursor}
 
 # 通知API
-@router.get("/notifications", response_model=List[NotificationResponse])
-def read_notifications(
+@router.get("/notifications", response_model=NotificationPage)
+async def read_notifications(
     unread_only: bool = False,
-    skip: int = 0,
-    limit: int = 20,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """通知一覧を取得する"""
-    return get_notifications(db, current_user.id, skip, limit, unread_only)
+    try:
+        notifications, next_cursor = await db.run_sync(get_notifications, current_user.id, cursor, limit, unread_only)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="カーソルが不正です")
+    return {"items": notifications, "next_cursor": next_cursor}
+
+@router.get("/notifications/count", response_model=NotificationCount)
+async def read_unread_notification_count(
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """未読の通知の件数を取得する（バッジ表示用）"""
+    return {"count": await db.run_sync(get_unread_notification_count, current_user.id)}
 
 @router.post("/notifications/{notification_id}/read", response_model=NotificationResponse)
-def mark_notification_read(
+async def mark_notification_read(
     notification_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """通知を既読にする"""
-    notification = mark_notification_as_read(db, notification_id)
-    if notification is None or notification.user_id != current_user.id:
+    notification = await db.run_sync(mark_notification_as_read, notification_id, current_user.id)
+    if notification is None:
         raise HTTPException(status_code=404, detail="通知が見つかりません")
     
     return notification
 
 @router.post("/notifications/read-all", status_code=204)
-def mark_all_notifications_read(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+async def mark_all_notifications_read(
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """すべての通知を既読にする"""
-    mark_all_notifications_as_read(db, current_user.id)
+    await db.run_sync(mark_all_notifications_as_read, current_user.id)
+
+@router.websocket("/notifications/ws")
+async def notifications_socket(websocket: WebSocket, token: str = Query(...)):
+    """通知・未読件数・フレンドリクエスト数・いいね数の変化をリアルタイムで受け取る
+
+    ブラウザのWebSocketはヘッダーを付けられないため、アクセストークンはクエリで渡す。
+    接続直後に現在の件数（snapshot）を送り、以降は変化があるたびにイベントを送る。
+    DBセッションは接続直後の認証と件数の取得の間だけ使い、接続中は保持しない。
+    """
+    broker = get_broker()
+    async with asynccontextmanager(get_async_db)() as db:
+        try:
+            current_user = await get_current_user(token, db)
+        except HTTPException:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        # 件数を読んでから登録するまでの間のイベントを取りこぼさないよう、先に登録する
+        subscription = broker.subscribe(current_user.id)
+        try:
+            unread_count = await db.run_sync(get_unread_notification_count, current_user.id)
+            pending_count = await db.run_sync(count_pending_friend_requests, current_user.id)
+        except Exception:
+            broker.unsubscribe(subscription)
+            raise
+    
+    try:
+        await websocket.accept()
+        await websocket.send_json({"type": "snapshot", "unread_count": unread_count, "pending_count": pending_count})
+        await _forward_events(websocket, subscription)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        broker.unsubscribe(subscription)
+
+async def _forward_events(websocket: WebSocket, subscription: Subscription):
+    """ブローカーからのイベントを送り続ける（クライアントが切断したら終了する）"""
+    async def send():
+        while True:
+            await websocket.send_text(await subscription.get())
+    
+    async def receive():
+        # クライアントからのメッセージは使わず、切断の検知だけに使う
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    
+    tasks = [asyncio.create_task(send()), asyncio.create_task(receive())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
 
 # フィードバックAPI
 @router.get("/feedback/{period}", response_model=FeedbackResponse)
-def get_feedback(
+async def get_feedback(
     period: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """特定の期間のフィードバックを取得する"""
     if period not in ["weekly", "monthly"]:
         raise HTTPException(status_code=400, detail="期間は'weekly'または'monthly'を指定してください")
     
-    feedback = get_latest_feedback(db, current_user.id, period)
+    feedback = await db.run_sync(get_latest_feedback, current_user.id, period)
     if feedback is None:
         raise HTTPException(status_code=404, detail="フィードバックが見つかりません")
     
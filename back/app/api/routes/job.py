@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends, HTTPException
+
+from ...core.database import get_async_db
+from ...core.security import get_current_user
+from ...schemas.job import JobResponse
+from ...schemas.user import CurrentUser
+from ...crud.job import get_user_job
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["ジョブ"],
+    responses={404: {"description": "Not found"}},
+)
+
+@router.get("/{job_id}", response_model=JobResponse, summary="ジョブの状態を取得")
+async def read_job(
+    job_id: int,
+    db = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """フィードバックの生成などのジョブの状態（pending, running, done, failed）を取得する"""
+    job = await db.run_sync(get_user_job, job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+    return job
@@ -19,4 +19,85 @@ class Settings(BaseSettings):
     CHAR_LIMIT_OPTIONS: list = [100, 200, 500, 0]  # 0は無制限
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY")
 
+    # Gemini APIの呼び出しの制御
+    GEMINI_FAKE_MODEL: bool = os.getenv("GEMINI_FAKE_MODEL", "false").lower() in ("1", "true", "yes")  # trueの場合はAPIを呼ばずにローカルの偽のモデルを使う
+    GEMINI_FAKE_LATENCY_SEC: float = float(os.getenv("GEMINI_FAKE_LATENCY_SEC", "0"))  # 偽のモデルが応答するまでの時間
+    GEMINI_FAKE_RESPONSE: str = os.getenv("GEMINI_FAKE_RESPONSE", "normal")  # 偽のモデルが返すテキスト
+    GEMINI_RATE_LIMIT_RPM: float = float(os.getenv("GEMINI_RATE_LIMIT_RPM", "60"))  # 1分あたりのリクエスト数の上限
+    GEMINI_RATE_LIMIT_BURST: int = int(os.getenv("GEMINI_RATE_LIMIT_BURST", "10"))  # 一度に送れるリクエスト数
+    GEMINI_MAX_QUEUE: int = 100  # レート制限で待てる呼び出しの数（超えたらすぐに失敗させる）
+    GEMINI_QUEUE_TIMEOUT_SEC: float = 30.0  # レート制限で待つ時間の上限
+    GEMINI_TIMEOUT_SEC: float = float(os.getenv("GEMINI_TIMEOUT_SEC", "30"))  # 1回の呼び出しのタイムアウト
+    GEMINI_MAX_RETRIES: int = 3  # 一時的なエラーの再試行回数
+    GEMINI_RETRY_BASE_SEC: float = 1.0  # 再試行までの待ち時間の基準（失敗するたびに倍にし、ランダムにずらす）
+    GEMINI_RETRY_MAX_SEC: float = 20.0
+    GEMINI_CIRCUIT_FAILURE_THRESHOLD: int = 5  # この回数連続で失敗したらAPIの呼び出しを止める
+    GEMINI_CIRCUIT_RESET_SEC: float = 30.0  # 呼び出しを止めてから試しに再開するまでの時間
+
+    # Gemini APIの応答キャッシュの設定
+    GEMINI_CACHE_MAX_ENTRIES: int = 10000  # メモリに保持する応答の件数
+    GEMINI_CACHE_PATH: str = os.getenv("GEMINI_CACHE_PATH", "")  # 指定するとSQLiteファイルにも保存する（空なら保存しない）
+
+    # フレンドタイムラインの設定
+    TIMELINE_BACKEND: str = os.getenv("TIMELINE_BACKEND", "database")  # 'database' または 'memory'
+    TIMELINE_MAX_ENTRIES_PER_USER: int = 1000  # memoryバックエンドで1ユーザーあたり保持する件数
+    # 公開期限が切れた日記の整理（python -m app.services.timeline_service で定期的に実行する）
+    TIMELINE_PURGE_BATCH_SIZE: int = int(os.getenv("TIMELINE_PURGE_BATCH_SIZE", "500"))  # 1回のトランザクションで削除する日記の件数
+    TIMELINE_PURGE_PAUSE_SEC: float = float(os.getenv("TIMELINE_PURGE_PAUSE_SEC", "0.1"))  # バッチの間に空ける時間（他の書き込みを待たせない）
+
+    # フレンドIDキャッシュの設定
+    FRIEND_CACHE_MAX_USERS: int = 10000  # キャッシュするユーザー数の上限
+    FRIEND_CACHE_TTL_SEC: int = 300  # キャッシュの有効期間（5分）
+
+    # パスワードハッシュ化の設定（bcryptはCPUを使うため、イベントループとは別のプールで実行する）
+    PASSWORD_HASH_EXECUTOR: str = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")  # 'thread', 'process' または 'inline'
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+
+    # 認証ユーザーキャッシュの設定
+    AUTH_CACHE_MAX_ENTRIES: int = 10000  # キャッシュするトークン数の上限
+    AUTH_CACHE_TTL_SEC: int = 60  # キャッシュの有効期間
+
+    # 閲覧回数の書き込みバッファの設定
+    VIEW_COUNT_FLUSH_INTERVAL_SEC: float = 5.0  # DBへまとめて書き込む間隔
+    VIEW_COUNT_FLUSH_THRESHOLD: int = 1000  # この件数の閲覧が貯まったら間隔を待たずに書き込む
+
+    # バックグラウンドジョブ（感情分析など）のワーカーの設定
+    JOB_WORKER_IN_PROCESS: bool = os.getenv("JOB_WORKER_IN_PROCESS", "true").lower() in ("1", "true", "yes")  # falseの場合は別プロセスで実行する
+    JOB_WORKER_CONCURRENCY: int = int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))  # 同時に実行するジョブ数
+    JOB_POLL_INTERVAL_SEC: float = 1.0  # 実行待ちのジョブを確認する間隔
+    JOB_MAX_ATTEMPTS: int = 5  # この回数失敗したらfailedにする
+    JOB_RETRY_BASE_SEC: float = 2.0  # リトライまでの待ち時間（失敗するたびに倍にする）
+    JOB_LOCK_TIMEOUT_SEC: int = 300  # これより長く実行中のジョブはワーカーが落ちたとみなして再実行する
+    # 感情分析の方法: 'remote'（Gemini APIのみ）, 'local'（ローカルの辞書のみ）,
+    # 'local_first'（投稿時にローカルで分類し、ワーカーがGemini APIで精度を上げる）
+    EMOTION_ANALYZER_MODE: str = os.getenv("EMOTION_ANALYZER_MODE", "local_first")
+    EMOTION_BATCH_SIZE: int = int(os.getenv("EMOTION_BATCH_SIZE", "10"))  # 1回のAPI呼び出しで感情分析する日記の件数
+
+    # フィードバックのストリーミング（SSE）の設定
+    FEEDBACK_STREAM_WAIT_SEC: float = 120.0  # 他で生成中のフィードバックの完了を待つ時間の上限
+    FEEDBACK_STREAM_CHECK_INTERVAL_SEC: float = 0.5  # 他で生成中のフィードバックの完了を確認する間隔
+    FEEDBACK_STREAM_KEEPALIVE_SEC: float = 15.0  # 待っている間に接続を保つコメントを送る間隔
+
+    # 通知のリアルタイム配信（WebSocket）の設定
+    NOTIFICATION_BROKER: str = os.getenv("NOTIFICATION_BROKER", "memory")  # 'memory'（1プロセス）または 'postgres'（複数ワーカー）
+    NOTIFICATION_QUEUE_SIZE: int = 100  # 1接続あたり送信待ちにできるイベント数（超えたら古いものから捨てる）
+
+    # いいねの通知をまとめる設定（同じ日記への未読のいいねは、この時間ごとに1件の通知にまとめる）
+    LIKE_NOTIFICATION_WINDOW_SEC: int = int(os.getenv("LIKE_NOTIFICATION_WINDOW_SEC", "3600"))
+
+    # 通知の保存期間の設定（python -m app.services.notification_retention で古い既読の通知を整理する）
+    NOTIFICATION_RETENTION_DAYS: int = int(os.getenv("NOTIFICATION_RETENTION_DAYS", "90"))  # 既読の通知を残す日数
+    NOTIFICATION_RETENTION_MODE: str = os.getenv("NOTIFICATION_RETENTION_MODE", "delete")  # 'delete'（削除）または 'archive'（保管用のテーブルへ移す）
+    NOTIFICATION_RETENTION_BATCH_SIZE: int = 1000  # 1回のトランザクションで削除する件数（長いロックを避ける）
+    NOTIFICATION_RETENTION_PAUSE_SEC: float = 0.1  # バッチの間に空ける時間（他の書き込みを待たせない）
+    NOTIFICATION_ARCHIVE_RETENTION_MONTHS: int = int(os.getenv("NOTIFICATION_ARCHIVE_RETENTION_MONTHS", "12"))  # 保管用のテーブルに残す月数（0なら削除しない）
+    NOTIFICATION_ARCHIVE_PARTITIONED: bool = os.getenv("NOTIFICATION_ARCHIVE_PARTITIONED", "false").lower() in ("1", "true", "yes")  # PostgreSQLで保管用のテーブルを月ごとのパーティションに分ける
+
+    # 月ごとフィードバックの設定（日記ごとの要約から作る）
+    DIARY_SUMMARY_MIN_CHARS: int = 200  # これ以下の長さの日記は要約せずそのまま使う
+    MONTHLY_FEEDBACK_TOKEN_BUDGET: int = int(os.getenv("MONTHLY_FEEDBACK_TOKEN_BUDGET", "8000"))  # 1回のプロンプトに含める要約のトークン数の上限
+
+    # 統計情報（/metrics）の設定（キャッシュやキューの内部の情報のため、トークンを設定した場合だけ公開する）
+    METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")  # Authorization: Bearer で渡すトークン（空なら /metrics は404）
+
 settings = Settings()
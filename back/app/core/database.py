@@ -1,6 +1,9 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, DateTime
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
 import os
 from dotenv import load_dotenv
 
@@ -11,15 +14,126 @@ DATABASE_URL = os.getenv(
     "DATABASE_URL", "sqlite:///./diary_app.db"
 )
 
+def _env_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+# コネクションプールの設定
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))  # 常に保持する接続数
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))  # 一時的に追加できる接続数
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))  # 空き接続を待つ秒数
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # この秒数より古い接続は作り直す
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", "true")  # 使用前に接続が生きているか確認する
+
+# SQLiteのチューニング設定（接続ごとにPRAGMAで設定する）
+SQLITE_TUNED = _env_bool("SQLITE_TUNED", "true")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))  # ロック解除を待つ時間
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # メモリマップI/Oのサイズ（バイト）
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024)))  # ページキャッシュのサイズ
+
+
+def _is_sqlite_memory(url: str) -> bool:
+    return url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith("sqlite:"))
+
+
+def _engine_options(url: str) -> dict:
+    """create_engine / create_async_engine に渡すプールの設定"""
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    # インメモリのSQLiteは接続ごとに別のDBになるため、プールの設定は変えない
+    if not _is_sqlite_memory(url):
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    return options
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """SQLiteの接続ごとの設定
+
+    WALモードでは読み込みと書き込みが互いをブロックしないため、いいね・閲覧・通知などの
+    同時書き込み中もフィードの読み込みが待たされない。synchronous=NORMALはWALでは安全で、
+    コミットごとのfsyncを減らす。busy_timeoutを設定すると、ロック中はすぐに
+    "database is locked" にならず解除を待つ。
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")  # 負の値はKB単位
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+
+def _configure_engine(sync_engine, url: str):
+    if url.startswith("sqlite") and SQLITE_TUNED and not _is_sqlite_memory(url):
+        event.listen(sync_engine, "connect", _set_sqlite_pragmas)
+
+
+# 対応しているDBとON CONFLICTを使えるINSERT文の関数
+# いいね・通知・未読件数の更新はON CONFLICTとRETURNINGを使うため、他のDBでは動かない
+_UPSERT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def _check_dialect(sync_engine):
+    if sync_engine.dialect.name not in _UPSERT_INSERTS:
+        raise ValueError(
+            f"Unsupported database: {sync_engine.dialect.name} "
+            "(SQLite or PostgreSQL is required for ON CONFLICT and RETURNING)"
+        )
+
+
+def upsert_insert(db):
+    """セッションのDBに合わせた、ON CONFLICTを指定できるINSERT文の関数を返す"""
+    return _UPSERT_INSERTS[db.get_bind().dialect.name]
+
+
 connect_args = {}
 if DATABASE_URL.startswith("sqlite"):
     connect_args = {"check_same_thread": False}
 
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
+engine = create_engine(DATABASE_URL, connect_args=connect_args, **_engine_options(DATABASE_URL))
+_check_dialect(engine)
+_configure_engine(engine, DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 非同期ドライバを使うかどうか（falseの場合は同期セッションをスレッドプールで実行する）
+ASYNC_DATABASE = _env_bool("ASYNC_DATABASE", "true")
+
+
+def to_async_database_url(url: str) -> str:
+    """DBのURLを非同期ドライバ用に変換する（SQLiteはaiosqlite、PostgreSQLはasyncpg）"""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    for prefix in ("postgresql+psycopg2:", "postgresql:", "postgres:"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg:" + url[len(prefix):]
+    return url
+
+
+async_engine = None
+AsyncSessionLocal = None
+if ASYNC_DATABASE:
+    async_engine = create_async_engine(to_async_database_url(DATABASE_URL), **_engine_options(DATABASE_URL))
+    _configure_engine(async_engine.sync_engine, DATABASE_URL)
+    # レスポンスの生成時に属性の再読み込み（遅延ロード）が起きないよう、コミット後も値を保持する
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
+# 作成時刻用の日時型
+# SQLiteのCURRENT_TIMESTAMPは秒単位の文字列で保存されるため、比較時のパラメータも同じ形式にそろえる
+# （キーセットページネーションで同じ時刻の行を正しく比較するため）
+Timestamp = DateTime().with_variant(
+    sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite",
+)
+
 # 依存性注入用のDBセッション
 def get_db():
     db = SessionLocal()
@@ -27,3 +141,31 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+class ThreadedSession:
+    """同期セッションをAsyncSessionと同じ使い方で扱うアダプタ（ASYNC_DATABASE=falseの場合）
+
+    run_syncに渡した関数はスレッドプール上で同期セッションを使って実行される。
+    """
+
+    def __init__(self, session):
+        self.sync_session = session
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+
+# 非同期ルート用のDBセッション
+# crudの関数は await db.run_sync(crud関数, 引数...) の形で呼び出す
+async def get_async_db():
+    if ASYNC_DATABASE:
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        # AsyncSessionLocalと同じく、コミット後も属性の値を保持する
+        db = SessionLocal(expire_on_commit=False)
+        try:
+            yield ThreadedSession(db)
+        finally:
+            await run_in_threadpool(db.close)
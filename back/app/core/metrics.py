@@ -0,0 +1,15 @@
+from typing import Callable, Dict
+
+# 各サブシステムの統計情報を集めるレジストリ
+# /metrics エンドポイントで一覧として返す
+_collectors: Dict[str, Callable[[], dict]] = {}
+
+
+def register_metrics(name: str, collector: Callable[[], dict]):
+    """統計情報を返す関数を登録する"""
+    _collectors[name] = collector
+
+
+def collect_metrics() -> dict:
+    """登録された全ての統計情報を取得する"""
+    return {name: collector() for name, collector in _collectors.items()}
@@ -0,0 +1,271 @@
+from datetime import timedelta
+from sqlalchemy import Column, DateTime, Integer, String, Table, Text, MetaData, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.sql import func
+
+# 既存DB向けの簡易マイグレーション
+# create_allは既存テーブルへの列追加やデータ移行を行わないため、ここで順番に適用する
+# 適用済みのマイグレーションはschema_migrationsテーブルに記録する
+
+_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("name", String, primary_key=True),
+    Column("applied_at", DateTime, default=func.now()),
+)
+
+MIGRATIONS = []
+
+# バックフィル時に1回で更新する行数
+BACKFILL_BATCH_SIZE = 1000
+
+
+def migration(name: str):
+    """マイグレーション関数を登録するデコレータ"""
+    def decorator(fn):
+        MIGRATIONS.append((name, fn))
+        return fn
+    return decorator
+
+
+def _has_column(conn: Connection, table: str, column: str) -> bool:
+    return column in {c["name"] for c in inspect(conn).get_columns(table)}
+
+
+def _add_column(conn: Connection, table: str, column: Column):
+    """列が存在しなければ追加する（server_defaultとnullable=Falseも反映する）"""
+    if _has_column(conn, table, column.name):
+        return
+    column_type = column.type.compile(dialect=conn.dialect)
+    ddl = f"ALTER TABLE {table} ADD COLUMN {column.name} {column_type}"
+    if column.server_default is not None:
+        default = column.server_default.arg
+        ddl += f" DEFAULT {default.text if hasattr(default, 'text') else repr(str(default))}"
+    if not column.nullable:
+        # 既存の行は上のDEFAULTで埋まる
+        ddl += " NOT NULL"
+    conn.execute(text(ddl))
+
+
+def _create_index(conn: Connection, table, index_name: str):
+    """モデルに定義されたインデックスが存在しなければ作成する"""
+    for index in table.indexes:
+        if index.name == index_name:
+            index.create(bind=conn, checkfirst=True)
+            return
+
+
+@migration("0001_diary_view_end_at")
+def add_diary_view_end_at(conn: Connection):
+    """日記に公開終了時刻の列を追加し、既存の日記をバックフィルする"""
+    from ..models.diary import Diary, to_naive_jst
+
+    _add_column(conn, "diaries", Column("view_end_at", DateTime))
+
+    diaries = Diary.__table__
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(diaries.c.id, diaries.c.created_at, diaries.c.view_limit_duration_sec)
+            .where(diaries.c.view_end_at.is_(None), diaries.c.id > last_id)
+            .order_by(diaries.c.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        for row in rows:
+            if row.created_at is None:
+                continue
+            view_end_at = to_naive_jst(row.created_at) + timedelta(seconds=row.view_limit_duration_sec or 0)
+            conn.execute(
+                diaries.update().where(diaries.c.id == row.id).values(view_end_at=view_end_at)
+            )
+        last_id = rows[-1].id
+
+    _create_index(conn, diaries, "ix_diaries_user_view_end_created")
+
+
+@migration("0002_timeline_entries")
+def backfill_timeline_entries(conn: Connection):
+    """既存のフレンド関係から、公開中の日記をタイムラインに書き込む"""
+    from ..models.diary import Diary, now_jst
+    from ..models.friend import FriendRequest
+    from ..models.timeline import TimelineEntry
+
+    diaries = Diary.__table__
+    requests = FriendRequest.__table__
+    timeline_entries = TimelineEntry.__table__
+
+    pairs = conn.execute(
+        select(requests.c.from_user_id, requests.c.to_user_id).where(requests.c.status == "accepted")
+    ).all()
+    friends = {}
+    for from_user_id, to_user_id in pairs:
+        friends.setdefault(from_user_id, set()).add(to_user_id)
+        friends.setdefault(to_user_id, set()).add(from_user_id)
+
+    viewable = conn.execute(
+        select(diaries.c.id, diaries.c.user_id, diaries.c.created_at, diaries.c.view_end_at)
+        .where(diaries.c.view_end_at >= now_jst())
+    ).all()
+    existing = set(conn.execute(select(timeline_entries.c.user_id, timeline_entries.c.diary_id)).all())
+
+    rows = []
+    for diary in viewable:
+        for user_id in friends.get(diary.user_id, ()):
+            if (user_id, diary.id) in existing:
+                continue
+            rows.append({
+                "user_id": user_id,
+                "diary_id": diary.id,
+                "author_id": diary.user_id,
+                "created_at": diary.created_at,
+                "view_end_at": diary.view_end_at,
+            })
+    for start in range(0, len(rows), BACKFILL_BATCH_SIZE):
+        conn.execute(timeline_entries.insert(), rows[start:start + BACKFILL_BATCH_SIZE])
+
+
+@migration("0003_friendships")
+def backfill_friendships(conn: Connection):
+    """承認済みのフレンドリクエストから、双方向のフレンド関係を作成する"""
+    from ..models.friend import FriendRequest, Friendship
+
+    requests = FriendRequest.__table__
+    friendships = Friendship.__table__
+
+    existing = set(conn.execute(select(friendships.c.user_id, friendships.c.friend_id)).all())
+    rows = []
+    pairs = conn.execute(
+        select(requests.c.from_user_id, requests.c.to_user_id).where(requests.c.status == "accepted")
+    ).all()
+    for from_user_id, to_user_id in pairs:
+        for pair in ((from_user_id, to_user_id), (to_user_id, from_user_id)):
+            if pair in existing:
+                continue
+            existing.add(pair)
+            rows.append({"user_id": pair[0], "friend_id": pair[1]})
+    for start in range(0, len(rows), BACKFILL_BATCH_SIZE):
+        conn.execute(friendships.insert(), rows[start:start + BACKFILL_BATCH_SIZE])
+
+
+@migration("0004_diary_likes_unique")
+def add_diary_likes_unique(conn: Connection):
+    """重複したいいねを削除し、(diary_id, user_id) の一意インデックスを作成する"""
+    from ..models.diary import Diary, DiaryLike
+
+    likes = DiaryLike.__table__
+    diaries = Diary.__table__
+
+    # 同時クリックなどで重複したいいねは、最初の1件だけ残す
+    keep_ids = select(func.min(likes.c.id)).group_by(likes.c.diary_id, likes.c.user_id)
+    conn.execute(likes.delete().where(likes.c.id.not_in(keep_ids)))
+
+    # いいね数を実際のいいねの件数に合わせる
+    like_count = (
+        select(func.count(likes.c.id))
+        .where(likes.c.diary_id == diaries.c.id)
+        .scalar_subquery()
+    )
+    conn.execute(diaries.update().values(like_count=like_count))
+
+    _create_index(conn, likes, "uq_diary_likes_diary_user")
+
+
+@migration("0005_diary_summary")
+def add_diary_summary(conn: Connection):
+    """日記に要約の列を追加する（既存の日記は月ごとフィードバックの生成時に要約する）"""
+    _add_column(conn, "diaries", Column("summary", Text))
+
+
+@migration("0006_job_dedupe")
+def add_job_dedupe(conn: Connection):
+    """ジョブに期間・重複防止キー・完了時刻の列と、重複防止キーの一意インデックスを追加する"""
+    from ..models.job import Job
+
+    _add_column(conn, "jobs", Column("period", String))
+    _add_column(conn, "jobs", Column("dedupe_key", String))
+    _add_column(conn, "jobs", Column("finished_at", DateTime))
+    _create_index(conn, Job.__table__, "uq_jobs_active_dedupe_key")
+
+
+@migration("0007_notification_counters")
+def add_notification_counters(conn: Connection):
+    """通知の複合インデックスを作成し、未読通知の件数をバックフィルする"""
+    from ..models.friend import Notification, NotificationCounter
+
+    notifications = Notification.__table__
+    counters = NotificationCounter.__table__
+    _create_index(conn, notifications, "ix_notifications_user_read_created")
+
+    conn.execute(counters.delete())
+    unread = (
+        select(notifications.c.user_id, func.count(notifications.c.id))
+        .where(notifications.c.is_read.is_(False), notifications.c.user_id.is_not(None))
+        .group_by(notifications.c.user_id)
+    )
+    conn.execute(counters.insert().from_select(["user_id", "unread_count"], unread))
+
+
+@migration("0008_notification_groups")
+def add_notification_groups(conn: Connection):
+    """通知にまとめるためのキー・件数・最後のユーザーの列と、キーの一意インデックスを追加する"""
+    from ..models.friend import Notification
+
+    notifications = Notification.__table__
+    _add_column(conn, "notifications", Column("group_key", String))
+    _add_column(conn, "notifications", Column("actor_count", Integer, nullable=False, server_default="1"))
+    _add_column(conn, "notifications", Column("last_actor_id", Integer))
+    _create_index(conn, notifications, "uq_notifications_unread_group")
+
+
+@migration("0009_notifications_user_created")
+def add_notifications_user_created_index(conn: Connection):
+    """既読も含めた通知の一覧用のインデックスを作成する"""
+    from ..models.friend import Notification
+
+    _create_index(conn, Notification.__table__, "ix_notifications_user_created")
+
+
+@migration("0010_notification_actors")
+def add_notification_actors(conn: Connection):
+    """まとめた通知の最後の更新時刻の列を追加し、まとめたユーザーの表をバックフィルする
+
+    以前の行はまとめたユーザーを記録していないため、最後のユーザーだけを登録する。
+    """
+    from ..models.friend import Notification, NotificationActor
+
+    notifications = Notification.__table__
+    _add_column(conn, "notifications", Column("updated_at", DateTime))
+    NotificationActor.__table__.create(bind=conn, checkfirst=True)
+    conn.execute(NotificationActor.__table__.insert().from_select(
+        ["notification_id", "user_id"],
+        select(notifications.c.id, notifications.c.last_actor_id).where(
+            notifications.c.group_key.is_not(None),
+            notifications.c.last_actor_id.is_not(None),
+        ),
+    ))
+
+
+@migration("0011_timeline_entries_view_end")
+def add_timeline_entries_view_end_index(conn: Connection):
+    """タイムラインの公開期限切れの削除用のインデックスを作成する"""
+    from ..models.timeline import TimelineEntry
+
+    _create_index(conn, TimelineEntry.__table__, "ix_timeline_entries_view_end")
+
+
+def run_migrations(engine: Engine):
+    """未適用のマイグレーションを順番に適用する"""
+    _metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        applied = set(conn.execute(select(schema_migrations.c.name)).scalars())
+
+    for name, fn in MIGRATIONS:
+        if name in applied:
+            continue
+        with engine.begin() as conn:
+            fn(conn)
+            conn.execute(schema_migrations.insert().values(name=name))
+        print(f"マイグレーションを適用しました: {name}")
@@ -1,3 +1,6 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -5,8 +8,12 @@ from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from .database import get_db
+from .config import settings
+from .database import get_async_db
+from .metrics import register_metrics
 from ..models.user import User
+from ..schemas.user import CurrentUser
+from ..utils.cache import TTLCache
 import os
 from dotenv import load_dotenv
 
@@ -23,13 +30,76 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 # OAuth2認証用のスキーマ
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
+# トークンから認証済みユーザーへのキャッシュ
+# 値は (読み込みを始めた時刻, トークンの有効期限, ユーザーのスナップショット)
+user_cache = TTLCache(maxsize=settings.AUTH_CACHE_MAX_ENTRIES, ttl=settings.AUTH_CACHE_TTL_SEC)
+register_metrics("auth_user_cache", user_cache.stats)
+
+# ユーザーごとにキャッシュを無効にした時刻（これより前に読み込んだキャッシュは使わない）
+# キャッシュは読み込みを始めてからAUTH_CACHE_TTL_SEC秒で使わなくなるため、同じ期間だけ保持すればよい
+# プロセス内のキャッシュのため、複数のプロセスで動かす場合は他のプロセスのキャッシュは
+# AUTH_CACHE_TTL_SEC秒が過ぎるまで古いまま残る
+_user_invalidations = TTLCache(maxsize=settings.AUTH_CACHE_MAX_ENTRIES, ttl=settings.AUTH_CACHE_TTL_SEC)
+
+def invalidate_user_cache(user_id: int):
+    """ユーザーのキャッシュを無効にする（ユーザー情報の更新・削除時に呼ぶ）"""
+    if _user_invalidations.stats()["size"] >= _user_invalidations.maxsize:
+        # 記録があふれて古い無効化が消えないよう、キャッシュごと捨てる
+        user_cache.clear()
+        _user_invalidations.clear()
+    _user_invalidations.set(user_id, time.monotonic())
+
+def _is_fresh(user_id: int, loaded_at: float) -> bool:
+    """loaded_atに読み込みを始めたキャッシュがまだ使えるか"""
+    if time.monotonic() - loaded_at >= settings.AUTH_CACHE_TTL_SEC:
+        return False
+    invalidated_at = _user_invalidations.get(user_id)
+    return invalidated_at is None or loaded_at > invalidated_at
+
+def _verify(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+def _hash(password):
+    return pwd_context.hash(password)
+
+def _create_hash_executor() -> Optional[Executor]:
+    """パスワードハッシュ化専用のプールを作成する（inlineの場合は呼び出し元で実行）"""
+    if settings.PASSWORD_HASH_EXECUTOR == "inline":
+        return None
+    if settings.PASSWORD_HASH_EXECUTOR == "process":
+        return ProcessPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS)
+    if settings.PASSWORD_HASH_EXECUTOR == "thread":
+        # bcryptはハッシュ計算中にGILを解放するため、スレッドでも並列に動く
+        return ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+    raise ValueError(f"Unknown PASSWORD_HASH_EXECUTOR: {settings.PASSWORD_HASH_EXECUTOR}")
+
+hash_executor = _create_hash_executor()
+
 def verify_password(plain_password, hashed_password):
     """パスワードを検証する"""
-    return pwd_context.verify(plain_password, hashed_password)
+    if hash_executor is None:
+        return _verify(plain_password, hashed_password)
+    return hash_executor.submit(_verify, plain_password, hashed_password).result()
 
 def get_password_hash(password):
     """パスワードをハッシュ化する"""
-    return pwd_context.hash(password)
+    if hash_executor is None:
+        return _hash(password)
+    return hash_executor.submit(_hash, password).result()
+
+async def verify_password_async(plain_password, hashed_password):
+    """パスワードを検証する（イベントループをブロックしない）"""
+    if hash_executor is None:
+        return _verify(plain_password, hashed_password)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(hash_executor, _verify, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    """パスワードをハッシュ化する（イベントループをブロックしない）"""
+    if hash_executor is None:
+        return _hash(password)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(hash_executor, _hash, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """JWTアクセストークンを作成する"""
@@ -42,22 +112,44 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def _load_current_user(db: Session, user_id: Optional[int], username: str) -> Optional[CurrentUser]:
+    """トークンの内容からユーザーを取得する（ユーザーIDがあれば主キーで、古いトークンはユーザー名で取得）"""
+    if user_id is not None:
+        db_user = db.get(User, user_id)
+    else:
+        db_user = db.query(User).filter(User.username == username).first()
+    return CurrentUser.model_validate(db_user) if db_user is not None else None
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db = Depends(get_async_db)) -> CurrentUser:
     """現在のユーザーを取得する"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    
+    # キャッシュにあれば、DBにアクセスせずに返す
+    cached = user_cache.get(token)
+    if cached is not None:
+        loaded_at, expire, user = cached
+        if _is_fresh(user.id, loaded_at) and datetime.utcnow().timestamp() < expire:
+            return user
+        user_cache.delete(token)
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
+        user_id: Optional[int] = payload.get("uid")
         if username is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.username == username).first()
+    # 読み込み中に無効にされた場合は、読み込んだ内容をキャッシュから使わない
+    loaded_at = time.monotonic()
+    user = await db.run_sync(_load_current_user, user_id, username)
     if user is None:
         raise credentials_exception
+    
+    user_cache.set(token, (loaded_at, payload.get("exp", float("inf")), user))
     return user
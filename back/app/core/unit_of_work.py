@@ -0,0 +1,32 @@
+from typing import Callable
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# 1つのユーザー操作（リクエスト）の変更は1つのトランザクションにまとめ、crudの関数の最後で1回だけコミットする。
+# 途中の処理（通知の追加など）はコミットせず、DBの外に伝える処理（WebSocketでの配信など）は
+# after_commitで登録して、コミットが成功した後にだけ実行する（トランザクショナルアウトボックス）。
+
+_CALLBACKS_KEY = "after_commit_callbacks"
+
+
+def after_commit(db: Session, callback: Callable[[], None]):
+    """コミットが成功した後に呼ぶ処理を登録する（ロールバックした場合は呼ばずに捨てる）
+
+    コミット後のセッションではSQLを実行できないため、必要な値はコミット前に読んでおく。
+    """
+    db.info.setdefault(_CALLBACKS_KEY, []).append(callback)
+
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit(session: Session):
+    for callback in session.info.pop(_CALLBACKS_KEY, ()):
+        try:
+            callback()
+        except Exception as e:
+            # コミット済みの変更は取り消せないため、ログだけ残して続ける
+            print(f"コミット後の処理に失敗しました: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_commit(session: Session):
+    session.info.pop(_CALLBACKS_KEY, None)
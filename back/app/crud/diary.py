@@ -1,12 +1,22 @@
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_, or_, func
+from sqlalchemy.orm import Session, joinedload, with_expression
+from sqlalchemy import and_, or_, func, update, delete, exists
 from datetime import datetime, timedelta
-from typing import List, Optional
-from ..models.diary import Diary, DiaryLike, Feedback
+from typing import Dict, List, Optional
+from ..core.config import settings
+from ..core.database import upsert_insert
+from ..core.unit_of_work import after_commit
+from ..models.diary import Diary, DiaryLike, Feedback, now_jst
 from ..models.user import User
 from ..schemas.diary import DiaryCreate
-from .user import update_streak
-from ..services.gemini_service import analyze_emotion_from_diary
+from .user import apply_streak
+from .friend import load_friend_ids, add_like_notification
+from .job import enqueue_job, delete_diary_jobs
+from ..services.timeline_service import get_timeline
+from ..services.job_worker import job_worker, EMOTION_ANALYSIS
+from ..services.local_emotion import classify_emotion_local
+from ..services.notification_broker import get_broker
+from ..services.view_counter import view_counter
+from ..utils.pagination import paginate
 
 def get_diary(db: Session, diary_id: int):
     """日記IDで日記を取得する"""
@@ -16,172 +26,135 @@ def get_diary_by_user(db: Session, user_id: int, diary_id: int):
     """特定のユーザーの特定の日記を取得する"""
     return db.query(Diary).filter(Diary.user_id == user_id, Diary.id == diary_id).first()
 
-def get_user_diaries(db: Session, user_id: int, skip: int = 0, limit: int = 100):
+def with_liked(query, viewer_id: Optional[int]):
+    """閲覧者がいいね済みかどうかを、一覧と同じクエリ内で読み込む"""
+    if viewer_id is None:
+        return query
+    liked = exists().where(DiaryLike.diary_id == Diary.id, DiaryLike.user_id == viewer_id)
+    return query.options(with_expression(Diary.is_liked_by_me, liked))
+
+def get_user_diaries(db: Session, user_id: int, cursor: Optional[str] = None, limit: int = 100):
     """ユーザーの全日記を取得する（自分用）"""
-    return db.query(Diary).filter(Diary.user_id == user_id).order_by(
-        Diary.created_at.desc()
-    ).offset(skip).limit(limit).all()
+    query = db.query(Diary).filter(Diary.user_id == user_id)
+    return paginate(db, query, Diary, cursor, limit)
 
-def get_public_diaries(db: Session, skip: int = 0, limit: int = 20):
+def get_public_diaries(db: Session, cursor: Optional[str] = None, limit: int = 20, viewer_id: Optional[int] = None):
     """公開中の日記一覧を取得する（閲覧期限内のもの）"""
-    now = datetime.now()
-    return db.query(Diary).filter(
-        # SQLiteでは単純な日時計算を使用
-        Diary.is_viewable == True
-    ).order_by(Diary.created_at.desc()).offset(skip).limit(limit).all()
-
-def get_friend_diaries(db: Session, user_id: int, friend_ids: List[int], skip: int = 0, limit: int = 20):
-    """フレンドの公開中の日記一覧を取得する"""
-    print(f"get_friend_diaries - ユーザーID: {user_id}, フレンドID: {friend_ids}")
-    
-    if not friend_ids:
-        print("フレンドIDが空のため、空のリストを返します")
-        return []
-    
-    now = datetime.now()
-    print(f"現在時刻: {now}")
-    
-    # 全フレンドの日記を取得（is_viewableフィルタなし）、ユーザー情報も一緒に取得
-    all_friend_diaries = db.query(Diary).options(joinedload(Diary.user)).filter(
-        Diary.user_id.in_(friend_ids)
-    ).order_by(Diary.created_at.desc()).all()
-    
-    print(f"フレンドの全日記数: {len(all_friend_diaries)}")
-    
-    # is_viewableでフィルタリング
-    viewable_diaries = []
-    for diary in all_friend_diaries:
-        is_viewable = diary.is_viewable
-        print(f"日記ID: {diary.id}, ユーザーID: {diary.user_id}, is_viewable: {is_viewable}, created_at: {diary.created_at}, view_limit_duration: {diary.view_limit_duration_sec}")
-        if is_viewable:
-            # ユーザー情報が読み込まれているか確認
-            if diary.user:
-                print(f"日記詳細 - ID: {diary.id}, ユーザー: {diary.user.username}, タイトル: {diary.title}, is_viewable: {is_viewable}")
-            else:
-                print(f"警告: 日記ID {diary.id} のユーザー情報が取得できませんでした")
-            viewable_diaries.append(diary)
-    
-    print(f"閲覧可能な日記数: {len(viewable_diaries)}")
-    
-    # ページネーション
-    result = viewable_diaries[skip:skip + limit]
-    print(f"ページネーション後: {len(result)}件")
-    
-    return result
+    query = db.query(Diary).options(joinedload(Diary.user)).filter(
+        Diary.view_end_at >= now_jst()
+    )
+    return paginate(db, with_liked(query, viewer_id), Diary, cursor, limit)
 
-def get_specific_friend_diaries(db: Session, friend_id: int, skip: int = 0, limit: int = 20):
+def get_specific_friend_diaries(db: Session, friend_id: int, cursor: Optional[str] = None, limit: int = 20, viewer_id: Optional[int] = None):
     """特定のフレンドの公開中の日記一覧を取得する"""
-    print(f"get_specific_friend_diaries - フレンドID: {friend_id}")
-    
-    # 全日記を取得（is_viewableフィルタなし）、ユーザー情報も一緒に取得
-    all_diaries = db.query(Diary).options(joinedload(Diary.user)).filter(
-        Diary.user_id == friend_id
-    ).order_by(Diary.created_at.desc()).all()
-    
-    print(f"フレンドの全日記数: {len(all_diaries)}")
-    
-    # is_viewableでフィルタリング
-    viewable_diaries = []
-    for diary in all_diaries:
-        is_viewable = diary.is_viewable
-        print(f"日記ID: {diary.id}, is_viewable: {is_viewable}, created_at: {diary.created_at}, view_limit_duration: {diary.view_limit_duration_sec}")
-        if is_viewable:
-            # ユーザー情報が読み込まれているか確認
-            if diary.user:
-                print(f"日記詳細 - ID: {diary.id}, ユーザー: {diary.user.username}, タイトル: {diary.title}, is_viewable: {is_viewable}")
-            else:
-                print(f"警告: 日記ID {diary.id} のユーザー情報が取得できませんでした")
-            viewable_diaries.append(diary)
-    
-    print(f"閲覧可能な日記数: {len(viewable_diaries)}")
-    
-    # ページネーション
-    result = viewable_diaries[skip:skip + limit]
-    print(f"ページネーション後: {len(result)}件")
-    
-    return result
+    # 閲覧期限とページネーションはDB側で処理する（ユーザー情報も一緒に取得）
+    query = db.query(Diary).options(joinedload(Diary.user)).filter(
+        Diary.user_id == friend_id,
+        Diary.view_end_at >= now_jst()
+    )
+    return paginate(db, with_liked(query, viewer_id), Diary, cursor, limit)
 
 def create_diary(db: Session, diary: DiaryCreate, user_id: int):
-    """新しい日記を作成する"""
-    # 感情分析を実行
-    emotion_result = analyze_emotion_from_diary(diary.content)
-    
+    """新しい日記を作成する（Gemini APIでの感情分析はジョブとして登録し、ワーカーが後から書き込む）"""
+    # ストリークの更新とレスポンスで使うため、投稿者を先に読み込んで日記に設定する
+    user = db.get(User, user_id)
     db_diary = Diary(
         user_id=user_id,
+        user=user,
         title=diary.title,
         content=diary.content,
         time_limit_sec=diary.time_limit_sec,
         char_limit=diary.char_limit,
         view_limit_duration_sec=diary.view_limit_duration_sec,
-        emotion_analysis=emotion_result
+        # ローカルで分類する設定なら投稿時に設定し、それ以外はワーカーの分析が終わるまでnull
+        emotion_analysis=classify_emotion_local(diary.content) if settings.EMOTION_ANALYZER_MODE != "remote" else None
     )
     db.add(db_diary)
+    # タイムラインとジョブに日記のIDが必要なため、先にINSERTする（RETURNINGに対応したDBではIDと作成時刻も同時に受け取る）
+    db.flush()
+    
+    # 公開終了時刻を保存する（作成時刻はDB側で決まるため、flush後に計算）
+    db_diary.view_end_at = db_diary.view_end_time
+    
+    # フレンドのタイムラインに書き込む（直前に承認されたフレンドも含めるため、キャッシュを通さずに読む）
+    get_timeline().push(db, db_diary, load_friend_ids(db, user_id))
+    # 感情分析（ローカルの分類の精度向上）のジョブを日記と同じトランザクションで登録する
+    if settings.EMOTION_ANALYZER_MODE != "local":
+        enqueue_job(db, EMOTION_ANALYSIS, diary_id=db_diary.id, user_id=user_id)
+        after_commit(db, job_worker.notify)
+    # ストリークも同じトランザクションで更新する
+    apply_streak(user)
     db.commit()
-    db.refresh(db_diary)
-    
-    # ストリークを更新する
-    update_streak(db, user_id)
     
     return db_diary
 
 def increment_view_count(db: Session, diary_id: int):
-    """日記の閲覧回数をインクリメントする"""
-    diary = get_diary(db, diary_id)
+    """日記の閲覧回数をインクリメントする（DBへはview_counterがまとめて書き込む）"""
+    diary = db.get(Diary, diary_id)
     if not diary:
         return None
     
-    diary.view_count += 1
-    db.commit()
-    db.refresh(diary)
+    view_counter.increment(diary_id)
     return diary
 
-def like_diary(db: Session, diary_id: int, user_id: int):
-    """日記にいいねを付ける"""
-    # すでにいいね済みかチェック
-    existing_like = db.query(DiaryLike).filter(
-        DiaryLike.diary_id == diary_id,
-        DiaryLike.user_id == user_id
+def _insert_like(db: Session, diary_id: int, user_id: int):
+    """いいねを作成して返す（すでにいいね済みの場合はNone）"""
+    # 一意制約に違反する場合は何も挿入しない（1回のINSERTで確認と作成を行う）
+    return db.scalars(
+        upsert_insert(db)(DiaryLike).values(diary_id=diary_id, user_id=user_id)
+        .on_conflict_do_nothing()
+        .returning(DiaryLike)
     ).first()
-    
-    if existing_like:
+
+def like_diary(db: Session, diary_id: int, user_id: int):
+    """日記にいいねを付け、(いいね, 日記の作成者ID) を返す
+
+    作成者へのいいねの通知（自分の日記でない場合）も同じトランザクションで作成する。
+    """
+    # いいねを作成（すでにいいね済みの場合は何も挿入されない）
+    db_like = _insert_like(db, diary_id, user_id)
+    if db_like is None:
         return None
     
-    # 日記が存在するかチェック
-    diary = get_diary(db, diary_id)
-    if not diary:
+    # いいね数をインクリメント（日記が存在しなければ取り消す）
+    row = db.execute(
+        update(Diary).where(Diary.id == diary_id)
+        .values(like_count=func.coalesce(Diary.like_count, 0) + 1)
+        .returning(Diary.user_id, Diary.like_count)
+    ).first()
+    if row is None:
+        db.rollback()
         return None
     
-    # いいねを作成
-    db_like = DiaryLike(diary_id=diary_id, user_id=user_id)
-    db.add(db_like)
-    
-    # いいね数をインクリメント
-    diary.like_count += 1
-    
+    diary_user_id, like_count = row
+    _publish_like_count(db, diary_user_id, diary_id, like_count)
+    if diary_user_id != user_id:
+        add_like_notification(db, diary_user_id, diary_id, user_id)
     db.commit()
-    db.refresh(db_like)
-    return db_like
+    return db_like, diary_user_id
+
+def _publish_like_count(db: Session, diary_user_id: int, diary_id: int, like_count: int):
+    """コミット後に、日記のいいね数を接続中の作成者に送る"""
+    event = {"type": "like", "diary_id": diary_id, "like_count": like_count}
+    after_commit(db, lambda: get_broker().publish(diary_user_id, event))
 
 def unlike_diary(db: Session, diary_id: int, user_id: int):
     """日記のいいねを取り消す"""
-    like = db.query(DiaryLike).filter(
-        DiaryLike.diary_id == diary_id,
-        DiaryLike.user_id == user_id
-    ).first()
-    
-    if not like:
-        return False
-    
-    diary = get_diary(db, diary_id)
-    if not diary:
+    result = db.execute(
+        delete(DiaryLike).where(DiaryLike.diary_id == diary_id, DiaryLike.user_id == user_id)
+    )
+    if result.rowcount == 0:
+        db.rollback()
         return False
     
-    db.delete(like)
-    
     # いいね数をデクリメント
-    if diary.like_count > 0:
-        diary.like_count -= 1
-    
+    row = db.execute(
+        update(Diary).where(Diary.id == diary_id, Diary.like_count > 0)
+        .values(like_count=Diary.like_count - 1)
+        .returning(Diary.user_id, Diary.like_count)
+    ).first()
+    if row is not None:
+        _publish_like_count(db, row.user_id, diary_id, row.like_count)
     db.commit()
     return True
 
@@ -197,6 +170,12 @@ def delete_diary(db: Session, diary_id: int, user_id: int):
     # 関連するいいねも削除
     db.query(DiaryLike).filter(DiaryLike.diary_id == diary_id).delete()
     
+    # フレンドのタイムラインからも削除
+    get_timeline().remove_diary(db, diary_id)
+    
+    # 未実行のジョブも削除
+    delete_diary_jobs(db, diary_id)
+    
     # 日記を削除
     db.delete(diary)
     db.commit()
@@ -217,3 +196,56 @@ def check_user_liked_diary(db: Session, diary_id: int, user_id: int):
         DiaryLike.user_id == user_id
     ).first()
     return like is not None
+
+def get_liked_diary_ids(db: Session, user_id: int, diary_ids: List[int]):
+    """指定した日記のうち、ユーザーがいいねしている日記IDの集合を取得する"""
+    if not diary_ids:
+        return set()
+    return {
+        diary_id for (diary_id,) in db.query(DiaryLike.diary_id).filter(
+            DiaryLike.diary_id.in_(diary_ids),
+            DiaryLike.user_id == user_id
+        )
+    }
+
+def get_diary_feedback(db: Session, diary_id: int, user_id: Optional[int] = None):
+    """日記のフィードバックを取得する"""
+    query = db.query(Feedback).filter(Feedback.diary_id == diary_id)
+    if user_id is not None:
+        query = query.filter(Feedback.user_id == user_id)
+    return query.first()
+
+def get_monthly_feedback(db: Session, user_id: int, period: str):
+    """月ごとのフィードバックを取得する（月ごとフィードバックはdiary_idがnull）"""
+    return db.query(Feedback).filter(
+        Feedback.user_id == user_id,
+        Feedback.period == period,
+        Feedback.diary_id.is_(None)
+    ).first()
+
+def save_diary_summaries(db: Session, summaries: Dict[int, str]):
+    """日記の要約を保存する"""
+    for diary_id, summary in summaries.items():
+        db.query(Diary).filter(Diary.id == diary_id).update({Diary.summary: summary}, synchronize_session=False)
+    db.commit()
+
+def save_feedback(db: Session, user_id: int, content: str, diary_id: Optional[int] = None, period: Optional[str] = None):
+    """フィードバックを保存する（月ごとフィードバックを作り直した場合は既存のものを置き換える）
+
+    コミットは呼び出し側でジョブの完了と一緒に行う（保存とジョブの完了を1回のコミットにまとめる）。
+    """
+    if diary_id is None and period is not None:
+        existing = get_monthly_feedback(db, user_id, period)
+        if existing:
+            existing.content = content
+            db.flush()
+            return existing
+    db_feedback = Feedback(
+        diary_id=diary_id,
+        user_id=user_id,
+        period=period,
+        content=content
+    )
+    db.add(db_feedback)
+    db.flush()
+    return db_feedback
@@ -1,10 +1,29 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func
+import time
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import and_, or_, func, update, text
 from datetime import datetime
 from typing import List, Optional
-from ..models.friend import FriendRequest, Notification
+from ..models.friend import FriendRequest, Friendship, Notification, NotificationActor, NotificationCounter
 from ..models.diary import Feedback
 from ..models.user import User
+from ..schemas.friend import NotificationResponse
+from ..core.config import settings
+from ..core.database import upsert_insert
+from ..core.metrics import register_metrics
+from ..core.unit_of_work import after_commit
+from ..services.notification_broker import get_broker
+from ..services.timeline_service import get_timeline
+from ..utils.cache import TTLCache
+from ..utils.pagination import paginate
+
+# ユーザーごとのフレンドID集合のキャッシュ
+friend_ids_cache = TTLCache(maxsize=settings.FRIEND_CACHE_MAX_USERS, ttl=settings.FRIEND_CACHE_TTL_SEC)
+register_metrics("friend_ids_cache", friend_ids_cache.stats)
+
+def invalidate_friend_cache(*user_ids: int):
+    """フレンドIDキャッシュを破棄する（フレンド関係が変わった時に呼ぶ）"""
+    for user_id in user_ids:
+        friend_ids_cache.delete(user_id)
 
 def get_friend_request(db: Session, request_id: int):
     """フレンドリクエストをIDで取得"""
@@ -22,38 +41,68 @@ def get_friend_requests(db: Session, user_id: int, status: Optional[str] = None)
     query = db.query(FriendRequest).filter(FriendRequest.to_user_id == user_id)
     if status:
         query = query.filter(FriendRequest.status == status)
-    # 関連するユーザー情報も一緒に取得
-    requests = query.all()
-    
-    # 各リクエストに関連するユーザー情報を明示的に読み込む
-    for request in requests:
-        if not hasattr(request, '_from_user_loaded'):
-            request.from_user = db.query(User).filter(User.id == request.from_user_id).first()
-            request._from_user_loaded = True
-        if not hasattr(request, '_to_user_loaded'):
-            request.to_user = db.query(User).filter(User.id == request.to_user_id).first()
-            request._to_user_loaded = True
-    
-    return requests
+    # 関連するユーザー情報も一緒に取得（レスポンス生成時に遅延ロードが起きないようにする）
+    return query.options(
+        joinedload(FriendRequest.from_user),
+        joinedload(FriendRequest.to_user)
+    ).all()
 
 def get_sent_friend_requests(db: Session, user_id: int, status: Optional[str] = None):
     """ユーザーの送信したフレンドリクエスト一覧を取得"""
     query = db.query(FriendRequest).filter(FriendRequest.from_user_id == user_id)
     if status:
         query = query.filter(FriendRequest.status == status)
-    # 関連するユーザー情報も一緒に取得
-    requests = query.all()
-    
-    # 各リクエストに関連するユーザー情報を明示的に読み込む
-    for request in requests:
-        if not hasattr(request, '_from_user_loaded'):
-            request.from_user = db.query(User).filter(User.id == request.from_user_id).first()
-            request._from_user_loaded = True
-        if not hasattr(request, '_to_user_loaded'):
-            request.to_user = db.query(User).filter(User.id == request.to_user_id).first()
-            request._to_user_loaded = True
+    # 関連するユーザー情報も一緒に取得（レスポンス生成時に遅延ロードが起きないようにする）
+    return query.options(
+        joinedload(FriendRequest.from_user),
+        joinedload(FriendRequest.to_user)
+    ).all()
+
+def _add_friendship(db: Session, user_id_1: int, user_id_2: int):
+    """2人をフレンドとして登録し、お互いの公開中の日記をタイムラインに追加する"""
+    # すでにフレンドの場合は何も挿入しない
+    db.execute(
+        upsert_insert(db)(Friendship)
+        .values([
+            {"user_id": user_id_1, "friend_id": user_id_2},
+            {"user_id": user_id_2, "friend_id": user_id_1},
+        ])
+        .on_conflict_do_nothing()
+    )
     
-    return requests
+    timeline = get_timeline()
+    timeline.backfill(db, user_id_1, user_id_2)
+    timeline.backfill(db, user_id_2, user_id_1)
+
+def count_pending_friend_requests(db: Session, user_id: int) -> int:
+    """ユーザーが受信した未処理のフレンドリクエストの件数を取得"""
+    return db.query(func.count(FriendRequest.id)).filter(
+        FriendRequest.to_user_id == user_id,
+        FriendRequest.status == "pending"
+    ).scalar()
+
+def _publish(db: Session, user_id: int, event: dict):
+    """コミットが成功した後で、接続中のユーザーにイベントを送る"""
+    after_commit(db, lambda: get_broker().publish(user_id, event))
+
+def _publish_pending_requests(db: Session, user_id: int):
+    """未処理のフレンドリクエストの件数を接続中のユーザーに送る（変更をflushした後に呼ぶ）"""
+    _publish(db, user_id, {
+        "type": "friend_requests",
+        "pending_count": count_pending_friend_requests(db, user_id),
+    })
+
+def _change_pending_status(db: Session, request_id: int, status: str) -> bool:
+    """未処理のリクエストのステータスを変更し、変更できた場合はTrueを返す
+
+    同時に承認・拒否された場合は、先に変更した1つのリクエストだけがTrueになる。
+    """
+    result = db.execute(
+        update(FriendRequest)
+        .where(FriendRequest.id == request_id, FriendRequest.status == "pending")
+        .values(status=status)
+    )
+    return result.rowcount == 1
 
 def create_friend_request(db: Session, from_user_id: int, to_user_id: int):
     """フレンドリクエストを作成"""
@@ -70,24 +119,27 @@ def create_friend_request(db: Session, from_user_id: int, to_user_id: int):
     # 相手からのリクエストが存在するか確認
     reverse_request = get_friend_request_by_users(db, to_user_id, from_user_id)
     if reverse_request:
-        if reverse_request.status == "pending":
-            # 相手からのリクエストがある場合は自動的に承認
-            reverse_request.status = "accepted"
-            db.commit()
-            db.refresh(reverse_request)
-            
-            # 承認通知を作成
-            create_notification(
+        # 相手からの未処理のリクエストがある場合は自動的に承認し、承認通知と同じトランザクションでコミットする
+        accepted = reverse_request.status == "pending" and _change_pending_status(db, reverse_request.id, "accepted")
+        if accepted:
+            _add_friendship(db, from_user_id, to_user_id)
+            _add_notification(
                 db, 
                 to_user_id, 
                 f"フレンドリクエストが承認されました", 
                 "friend", 
                 from_user_id
             )
+            _publish_pending_requests(db, from_user_id)
+            db.commit()
+            db.refresh(reverse_request)
+            invalidate_friend_cache(from_user_id, to_user_id)
             
             return reverse_request
         else:
-            # 既に処理済みのリクエストがある場合は、そのまま返す
+            # 既に処理済みのリクエスト（同時に処理された場合を含む）は、処理後のステータスで返す
+            db.rollback()
+            db.refresh(reverse_request)
             return reverse_request
     
     # 新しいリクエストを作成
@@ -97,63 +149,70 @@ def create_friend_request(db: Session, from_user_id: int, to_user_id: int):
         status="pending"
     )
     db.add(db_request)
-    db.commit()
-    db.refresh(db_request)
     
-    # 通知を作成
-    create_notification(
+    # 通知もリクエストと同じトランザクションで作成する
+    _add_notification(
         db, 
         to_user_id, 
         f"新しいフレンドリクエストが届きました", 
         "friend", 
         from_user_id
     )
+    _publish_pending_requests(db, to_user_id)
+    db.commit()
+    db.refresh(db_request)
+    invalidate_friend_cache(from_user_id, to_user_id)
     
     return db_request
 
 def update_friend_request(db: Session, request_id: int, status: str):
-    """フレンドリクエストのステータスを更新"""
+    """未処理のフレンドリクエストのステータスを更新（存在しないか、既に処理済みの場合はNone）"""
     db_request = get_friend_request(db, request_id)
     if not db_request:
         return None
     
-    db_request.status = status
-    db.commit()
-    db.refresh(db_request)
-    
+    if not _change_pending_status(db, request_id, status):
+        # 他のリクエストで先に承認・拒否された（フレンドの登録や通知は先に処理した側で行う）
+        db.rollback()
+        return None
     if status == "accepted":
-        # フレンド承認の通知を作成
-        create_notification(
+        _add_friendship(db, db_request.from_user_id, db_request.to_user_id)
+        # フレンド承認の通知もステータスの更新と同じトランザクションで作成する
+        _add_notification(
             db, 
             db_request.from_user_id, 
             f"フレンドリクエストが承認されました", 
             "friend", 
             db_request.to_user_id
         )
+    _publish_pending_requests(db, db_request.to_user_id)
+    db.commit()
+    db.refresh(db_request)
+    invalidate_friend_cache(db_request.from_user_id, db_request.to_user_id)
     
     return db_request
 
 def get_friends(db: Session, user_id: int):
     """ユーザーのフレンド一覧を取得"""
-    # 承認済みのリクエストを取得
-    sent_requests = db.query(FriendRequest).filter(
-        FriendRequest.from_user_id == user_id,
-        FriendRequest.status == "accepted"
+    return db.query(User).join(Friendship, Friendship.friend_id == User.id).filter(
+        Friendship.user_id == user_id
     ).all()
-    
-    received_requests = db.query(FriendRequest).filter(
-        FriendRequest.to_user_id == user_id,
-        FriendRequest.status == "accepted"
-    ).all()
-    
-    friend_ids = [req.to_user_id for req in sent_requests] + [req.from_user_id for req in received_requests]
-    
-    return db.query(User).filter(User.id.in_(friend_ids)).all()
 
-def get_friend_ids(db: Session, user_id: int):
-    """ユーザーのフレンドIDリストを取得"""
-    friends = get_friends(db, user_id)
-    return [friend.id for friend in friends]
+def load_friend_ids(db: Session, user_id: int) -> List[int]:
+    """ユーザーのフレンドIDリストをキャッシュを通さずにDBから取得
+
+    タイムラインへの書き込みなど、書き込み処理ではこちらを使う。
+    キャッシュはプロセスごとのため、他のプロセスで承認されたフレンドが含まれていないことがある。
+    """
+    return [friend_id for (friend_id,) in db.query(Friendship.friend_id).filter(Friendship.user_id == user_id)]
+
+def get_friend_id_set(db: Session, user_id: int):
+    """ユーザーのフレンドIDの集合を取得（キャッシュ付き。読み込みと権限の確認用）"""
+    friend_ids = friend_ids_cache.get(user_id)
+    if friend_ids is None:
+        friend_ids = frozenset(load_friend_ids(db, user_id))
+        friend_ids_cache.set(user_id, friend_ids)
+    return friend_ids
 
 def are_friends(db: Session, user_id_1: int, user_id_2: int):
     """2人のユーザーがフレンド関係にあるかをチェック"""
@@ -161,21 +220,47 @@ def are_friends(db: Session, user_id_1: int, user_id_2: int):
     if user_id_1 == user_id_2:
         return False
     
-    # 承認済みのリクエストが存在するかチェック
-    request = db.query(FriendRequest).filter(
-        and_(
-            or_(
-                and_(FriendRequest.from_user_id == user_id_1, FriendRequest.to_user_id == user_id_2),
-                and_(FriendRequest.from_user_id == user_id_2, FriendRequest.to_user_id == user_id_1)
-            ),
-            FriendRequest.status == "accepted"
+    return user_id_2 in get_friend_id_set(db, user_id_1)
+
+def _increment_unread_count(db: Session, user_id: int) -> int:
+    """未読通知の件数を1増やし、増やした後の件数を返す（行が無ければ作成する。コミットは呼び出し側で行う）"""
+    return db.execute(
+        upsert_insert(db)(NotificationCounter)
+        .values(user_id=user_id, unread_count=1)
+        .on_conflict_do_update(
+            index_elements=[NotificationCounter.user_id],
+            set_={"unread_count": NotificationCounter.unread_count + 1}
         )
-    ).first()
-    
-    return request is not None
+        .returning(NotificationCounter.unread_count)
+    ).scalar()
 
-def create_notification(db: Session, user_id: int, message: str, type: str, related_id: Optional[int] = None):
-    """通知を作成"""
+def _get_or_create_group_notification(db: Session, values: dict) -> int:
+    """同じキーの未読の通知があればそのID、無ければ作成した通知のIDを返す"""
+    statement = upsert_insert(db)(Notification).values(**values)
+    # 既存の行があれば何も変えずにその行を返す
+    return db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[Notification.user_id, Notification.group_key],
+            index_where=text("is_read = false"),
+            set_={"group_key": statement.excluded.group_key},
+        ).returning(Notification.id)
+    ).scalar()
+
+def _add_actor(db: Session, notification_id: int, actor_id: int) -> bool:
+    """まとめた通知にユーザーを記録し、新しく記録した場合はTrueを返す"""
+    return db.execute(
+        upsert_insert(db)(NotificationActor)
+        .values(notification_id=notification_id, user_id=actor_id)
+        .on_conflict_do_nothing()
+        .returning(NotificationActor.user_id)
+    ).first() is not None
+
+def _publish_unread_count(db: Session, user_id: int, unread_count: int):
+    """未読件数を接続中のユーザーに送る"""
+    _publish(db, user_id, {"type": "unread_count", "unread_count": unread_count})
+
+def _add_notification(db: Session, user_id: int, message: str, type: str, related_id: Optional[int] = None):
+    """通知を追加して未読件数を増やす（コミットは呼び出し側で行い、コミット後に接続中のユーザーへ送る）"""
     db_notification = Notification(
         user_id=user_id,
         message=message,
@@ -183,29 +268,98 @@ def create_notification(db: Session, user_id: int, message: str, type: str, rela
         related_id=related_id
     )
     db.add(db_notification)
+    # 呼び出し側の変更もまとめてflushする（配信する内容にIDと作成時刻が必要なため）
+    db.flush()
+    # 未読件数も同じトランザクションで更新する
+    unread_count = _increment_unread_count(db, user_id)
+    _publish_notification(db, db_notification, unread_count)
+    return db_notification
+
+def create_notification(db: Session, user_id: int, message: str, type: str, related_id: Optional[int] = None):
+    """通知を作成"""
+    db_notification = _add_notification(db, user_id, message, type, related_id)
     db.commit()
-    db.refresh(db_notification)
     return db_notification
 
-def get_notifications(db: Session, user_id: int, skip: int = 0, limit: int = 20, unread_only: bool = False):
+def add_like_notification(db: Session, user_id: int, diary_id: int, actor_id: int):
+    """日記へのいいねの通知を追加する（コミットは呼び出し側で行う）
+
+    同じ日記への未読のいいねの通知が同じ時間帯にあれば、新しい行は作らずにまとめる。
+    まとめたユーザーはnotification_actorsに記録し、いいねを取り消して付け直した場合など
+    同じユーザーは2回数えない。作成時刻は変えず（一覧のページングの順序を保つ）、updated_atを更新する。
+    未読件数は新しい行を作った場合だけ増やす。
+    """
+    window = int(time.time() // settings.LIKE_NOTIFICATION_WINDOW_SEC)
+    notification_id = _get_or_create_group_notification(db, {
+        "user_id": user_id,
+        "message": "あなたの日記にいいねがつきました",
+        "type": "like",
+        "related_id": diary_id,
+        "is_read": False,
+        "group_key": f"like:{diary_id}:{window}",
+        "actor_count": 0,
+    })
+    if not _add_actor(db, notification_id, actor_id):
+        # すでに数えたユーザー
+        return db.get(Notification, notification_id)
+    
+    db_notification = db.scalars(
+        update(Notification)
+        .where(Notification.id == notification_id)
+        .values(actor_count=Notification.actor_count + 1, last_actor_id=actor_id, updated_at=func.now())
+        .returning(Notification),
+        execution_options={"populate_existing": True},
+    ).one()
+    if db_notification.actor_count == 1:
+        unread_count = _increment_unread_count(db, user_id)
+    else:
+        unread_count = get_unread_notification_count(db, user_id)
+    _publish_notification(db, db_notification, unread_count)
+    return db_notification
+
+def _publish_notification(db: Session, db_notification: Notification, unread_count: int):
+    """作成（更新）した通知と未読件数を接続中のユーザーに送る"""
+    _publish(db, db_notification.user_id, {
+        "type": "notification",
+        "unread_count": unread_count,
+        "notification": NotificationResponse.model_validate(db_notification).model_dump(mode="json"),
+    })
+
+def get_notifications(db: Session, user_id: int, cursor: Optional[str] = None, limit: int = 20, unread_only: bool = False):
     """ユーザーの通知一覧を取得"""
     query = db.query(Notification).filter(Notification.user_id == user_id)
     
     if unread_only:
         query = query.filter(Notification.is_read == False)
     
-    return query.order_by(Notification.created_at.desc()).offset(skip).limit(limit).all()
+    return paginate(db, query, Notification, cursor, limit)
 
-def mark_notification_as_read(db: Session, notification_id: int):
-    """通知を既読にする"""
-    notification = db.query(Notification).filter(Notification.id == notification_id).first()
-    if not notification:
-        return None
-    
-    notification.is_read = True
+def get_unread_notification_count(db: Session, user_id: int) -> int:
+    """ユーザーの未読通知の件数を取得"""
+    count = db.query(NotificationCounter.unread_count).filter(NotificationCounter.user_id == user_id).scalar()
+    return count or 0
+
+def mark_notification_as_read(db: Session, notification_id: int, user_id: int):
+    """自分の通知を既読にする（他のユーザーの通知や存在しない通知ならNone）"""
+    result = db.execute(
+        update(Notification)
+        .where(Notification.id == notification_id, Notification.user_id == user_id, Notification.is_read == False)
+        .values(is_read=True)
+    )
+    # 未読から既読に変わった場合だけ未読件数を減らす
+    if result.rowcount == 1:
+        unread_count = db.execute(
+            update(NotificationCounter)
+            .where(NotificationCounter.user_id == user_id, NotificationCounter.unread_count > 0)
+            .values(unread_count=NotificationCounter.unread_count - 1)
+            .returning(NotificationCounter.unread_count)
+        ).scalar() or 0
+        _publish_unread_count(db, user_id, unread_count)
     db.commit()
-    db.refresh(notification)
-    return notification
+    return db.query(Notification).filter(
+        Notification.id == notification_id,
+        Notification.user_id == user_id
+    ).first()
 
 def mark_all_notifications_as_read(db: Session, user_id: int):
     """ユーザーの全通知を既読にする"""
@@ -213,6 +367,10 @@ def mark_all_notifications_as_read(db: Session, user_id: int):
         Notification.user_id == user_id,
         Notification.is_read == False
     ).update({"is_read": True})
+    db.query(NotificationCounter).filter(
+        NotificationCounter.user_id == user_id
+    ).update({"unread_count": 0})
+    _publish_unread_count(db, user_id, 0)
     
     db.commit()
     return True
@@ -225,11 +383,11 @@ def create_feedback(db: Session, user_id: int, period: str, content: str):
         content=content
     )
     db.add(db_feedback)
-    db.commit()
-    db.refresh(db_feedback)
+    # IDを通知に含めるためにflushし、通知と同じトランザクションでコミットする
+    db.flush()
     
     # 通知も作成
-    create_notification(
+    _add_notification(
         db,
         user_id,
         f"新しい{period}フィードバックが届きました",
@@ -237,6 +395,8 @@ def create_feedback(db: Session, user_id: int, period: str, content: str):
         db_feedback.id
     )
     
+    db.commit()
+    db.refresh(db_feedback)
     return db_feedback
 
 def get_latest_feedback(db: Session, user_id: int, period: str):
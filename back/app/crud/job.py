@@ -0,0 +1,152 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+from datetime import timedelta
+from typing import List, Optional, Tuple
+from ..models.diary import now_jst
+from ..models.job import Job
+
+def enqueue_job(db: Session, kind: str, diary_id: Optional[int] = None, user_id: Optional[int] = None):
+    """ジョブを追加する（コミットは呼び出し側で行い、元のデータと同じトランザクションで保存する）"""
+    job = Job(kind=kind, status="pending", diary_id=diary_id, user_id=user_id, attempts=0, run_after=now_jst())
+    db.add(job)
+    return job
+
+def get_active_job(db: Session, dedupe_key: str) -> Optional[Job]:
+    """同じキーの実行待ち・実行中のジョブを取得する"""
+    return db.query(Job).filter(
+        Job.dedupe_key == dedupe_key,
+        Job.status.in_(["pending", "running"])
+    ).first()
+
+def enqueue_unique_job(db: Session, kind: str, dedupe_key: str, diary_id: Optional[int] = None,
+                       user_id: Optional[int] = None, period: Optional[str] = None) -> Job:
+    """同じキーのジョブが実行待ち・実行中でなければ追加してコミットし、あれば既存のジョブを返す
+
+    同時に追加しようとした場合も一意インデックスで1件だけが追加される。
+    """
+    existing = get_active_job(db, dedupe_key)
+    if existing:
+        return existing
+    job = Job(kind=kind, status="pending", diary_id=diary_id, user_id=user_id, period=period,
+              dedupe_key=dedupe_key, attempts=0, run_after=now_jst())
+    db.add(job)
+    try:
+        db.commit()
+    except IntegrityError:
+        # 他のリクエストが先に追加した
+        db.rollback()
+        existing = get_active_job(db, dedupe_key)
+        if existing is None:
+            raise
+        return existing
+    db.refresh(job)
+    return job
+
+def claim_unique_job(db: Session, kind: str, dedupe_key: str, diary_id: Optional[int] = None,
+                     user_id: Optional[int] = None, period: Optional[str] = None) -> Tuple[Job, bool]:
+    """ワーカーを通さずにその場で実行するため、同じキーのジョブを実行中にして (ジョブ, 取得できたか) を返す
+
+    実行待ちのジョブがあればそれを実行中にし、無ければ実行中のジョブを追加する。
+    他で実行中の場合は取得できず、そのジョブとFalseを返す。
+    """
+    existing = get_active_job(db, dedupe_key)
+    if existing:
+        now = now_jst()
+        result = db.execute(
+            update(Job)
+            .where(Job.id == existing.id, Job.status == "pending")
+            .values(status="running", locked_at=now, attempts=Job.attempts + 1)
+        )
+        db.commit()
+        db.refresh(existing)
+        return existing, result.rowcount == 1
+    job = Job(kind=kind, status="running", diary_id=diary_id, user_id=user_id, period=period,
+              dedupe_key=dedupe_key, attempts=1, run_after=now_jst(), locked_at=now_jst())
+    db.add(job)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        existing = get_active_job(db, dedupe_key)
+        if existing is None:
+            raise
+        return existing, False
+    db.refresh(job)
+    return job, True
+
+def release_job(db: Session, job: Job):
+    """実行中のジョブを実行待ちに戻す（途中でやめた処理をワーカーに引き継ぐ）"""
+    job.status = "pending"
+    job.locked_at = None
+    job.run_after = now_jst()
+    db.commit()
+
+def get_user_job(db: Session, job_id: int, user_id: int) -> Optional[Job]:
+    """ユーザーのジョブを取得する"""
+    return db.query(Job).filter(Job.id == job_id, Job.user_id == user_id).first()
+
+def claim_jobs(db: Session, limit: int, kinds: Optional[List[str]] = None) -> List[int]:
+    """実行待ちのジョブを最大limit件取得し、実行中にしてIDを返す
+
+    複数のワーカー（プロセス）が同時に取得しても、status='pending' を条件にした更新で
+    1つのジョブは1つのワーカーにしか渡らない。
+    """
+    if limit <= 0:
+        return []
+    now = now_jst()
+    query = db.query(Job.id).filter(
+        Job.status == "pending",
+        or_(Job.run_after.is_(None), Job.run_after <= now)
+    )
+    if kinds is not None:
+        query = query.filter(Job.kind.in_(kinds))
+    candidates = [job_id for (job_id,) in query.order_by(Job.id).limit(limit)]
+
+    claimed = []
+    for job_id in candidates:
+        result = db.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == "pending")
+            .values(status="running", locked_at=now, attempts=Job.attempts + 1)
+        )
+        if result.rowcount == 1:
+            claimed.append(job_id)
+    db.commit()
+    return claimed
+
+def release_stale_jobs(db: Session, timeout_sec: int) -> int:
+    """一定時間以上実行中のままのジョブ（ワーカーの異常終了など）を実行待ちに戻す"""
+    result = db.execute(
+        update(Job)
+        .where(Job.status == "running", Job.locked_at < now_jst() - timedelta(seconds=timeout_sec))
+        .values(status="pending", locked_at=None)
+    )
+    db.commit()
+    return result.rowcount
+
+def complete_jobs(db: Session, jobs: List[Job]):
+    """ジョブを完了にする（ハンドラの変更と一緒にコミットする）"""
+    for job in jobs:
+        job.status = "done"
+        job.locked_at = None
+        job.last_error = None
+        job.finished_at = now_jst()
+    db.commit()
+
+def fail_jobs(db: Session, jobs: List[Job], error: str, max_attempts: int, retry_base_sec: float):
+    """ジョブの失敗を記録する（上限回数までは待ち時間を倍にしながらリトライする）"""
+    for job in jobs:
+        job.locked_at = None
+        job.last_error = error[:1000]
+        if job.attempts >= max_attempts:
+            job.status = "failed"
+            job.finished_at = now_jst()
+        else:
+            job.status = "pending"
+            job.run_after = now_jst() + timedelta(seconds=retry_base_sec * 2 ** (job.attempts - 1))
+    db.commit()
+
+def delete_diary_jobs(db: Session, diary_id: int):
+    """日記に関連するジョブを削除する（コミットは呼び出し側で行う）"""
+    db.query(Job).filter(Job.diary_id == diary_id).delete(synchronize_session=False)
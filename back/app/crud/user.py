@@ -1,7 +1,11 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import or_
 from ..models.user import User
+from ..models.friend import Friendship, NotificationActor, NotificationArchive, NotificationCounter
 from ..schemas.user import UserCreate
-from ..core.security import get_password_hash, verify_password
+from ..core.security import get_password_hash, verify_password, verify_password_async, invalidate_user_cache
+from ..services.timeline_service import get_timeline
+from .friend import load_friend_ids, invalidate_friend_cache
 from typing import Optional, List
 from datetime import datetime, date
 
@@ -21,9 +25,10 @@ def get_users(db: Session, skip: int = 0, limit: int = 100):
     """ユーザー一覧を取得する"""
     return db.query(User).offset(skip).limit(limit).all()
 
-def create_user(db: Session, user: UserCreate):
-    """新しいユーザーを作成する"""
-    hashed_password = get_password_hash(user.password)
+def create_user(db: Session, user: UserCreate, hashed_password: Optional[str] = None):
+    """新しいユーザーを作成する（ハッシュ化済みのパスワードがあればそれを使う）"""
+    if hashed_password is None:
+        hashed_password = get_password_hash(user.password)
     db_user = User(
         username=user.username,
         email=user.email,
@@ -43,15 +48,34 @@ def authenticate_user(db: Session, username: str, password: str):
         return False
     return user
 
+async def authenticate_user_async(db, username: str, password: str):
+    """ユーザー認証を行う（パスワード検証はハッシュ化用のプールで実行）
+
+    dbはget_async_dbが返す非同期セッション
+    """
+    user = await db.run_sync(get_user_by_username, username)
+    if not user:
+        return False
+    if not await verify_password_async(password, user.hashed_password):
+        return False
+    return user
+
 def update_streak(db: Session, user_id: int, today: Optional[date] = None):
     """ユーザーのストリークを更新する"""
-    if today is None:
-        today = date.today()
-    
     user = get_user(db, user_id)
     if not user:
         return None
     
+    apply_streak(user, today)
+    db.commit()
+    db.refresh(user)
+    return user
+
+def apply_streak(user: User, today: Optional[date] = None):
+    """投稿した日に合わせてユーザーのストリークを更新する（コミットは呼び出し側で行う）"""
+    if today is None:
+        today = date.today()
+    
     # 最後のストリーク日がない場合は初めての投稿
     if user.last_streak_date is None:
         user.streak_count = 1
@@ -71,31 +95,43 @@ def update_streak(db: Session, user_id: int, today: Optional[date] = None):
         elif (today - last_date).days > 1:
             user.streak_count = 1
             user.last_streak_date = today
-    
-    db.commit()
-    db.refresh(user)
-    return user
 
-def update_user(db: Session, db_user: User, user_update):
-    """ユーザー情報を更新する"""
+def update_user(db: Session, db_user: User, user_update, hashed_password: Optional[str] = None):
+    """ユーザー情報を更新する（ハッシュ化済みのパスワードがあればそれを使う）"""
     # 更新が必要なフィールドのみ処理
     if user_update.username is not None:
         db_user.username = user_update.username
     if user_update.email is not None:
         db_user.email = user_update.email
-    if user_update.password is not None:
+    if hashed_password is not None:
+        db_user.hashed_password = hashed_password
+    elif user_update.password is not None:
         db_user.hashed_password = get_password_hash(user_update.password)
     
     db.commit()
     db.refresh(db_user)
+    invalidate_user_cache(db_user.id)
     return db_user
 
 def delete_user(db: Session, user_id: int):
     """ユーザーを削除する"""
     db_user = get_user(db, user_id)
     if db_user:
+        # フレンドのキャッシュにも含まれているため、先にフレンドIDを取得しておく
+        friend_ids = load_friend_ids(db, user_id)
+        
+        # フレンド関係とタイムラインからも削除
+        db.query(Friendship).filter(
+            or_(Friendship.user_id == user_id, Friendship.friend_id == user_id)
+        ).delete(synchronize_session=False)
+        get_timeline().remove_user(db, user_id)
+        db.query(NotificationCounter).filter(NotificationCounter.user_id == user_id).delete(synchronize_session=False)
+        db.query(NotificationArchive).filter(NotificationArchive.user_id == user_id).delete(synchronize_session=False)
+        db.query(NotificationActor).filter(NotificationActor.user_id == user_id).delete(synchronize_session=False)
         db.delete(db_user)
         db.commit()
+        invalidate_friend_cache(user_id, *friend_ids)
+        invalidate_user_cache(user_id)
     return db_user
 
 def search_users(db: Session, query: str, current_user_id: int, skip: int = 0, limit: int = 20) -> List[User]:
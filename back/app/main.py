@@ -1,10 +1,20 @@
-from fastapi import FastAPI
+import secrets
+from typing import Optional
+from fastapi import FastAPI, Header, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
 from .core.database import Base, engine
-from .api.routes import auth_router, diary_router, friend_router, user_router
+from .core.migrations import run_migrations
+from .core.metrics import collect_metrics
+from .core.config import settings
+from .services.job_worker import job_worker
+from .services.notification_broker import get_broker
+from .services.view_counter import view_counter
+from .api.routes import auth_router, diary_router, friend_router, job_router, user_router
 
 # データベーステーブルの作成
 Base.metadata.create_all(bind=engine)
+# 既存データベースのマイグレーション
+run_migrations(engine)
 
 app = FastAPI(
     title="タイムリミット日記アプリ",
@@ -32,13 +42,45 @@ app.add_middleware(
     max_age=600,
 )
 
+@app.on_event("startup")
+def start_background_workers():
+    # 閲覧回数をまとめて書き込むスレッドを開始
+    view_counter.start()
+    # 感情分析やフィードバックの生成などのジョブを実行するワーカーを開始（別プロセスで動かす場合は起動しない）
+    if settings.JOB_WORKER_IN_PROCESS:
+        job_worker.start()
+    # 他のプロセスで発生した通知イベントの受信を開始（memoryバックエンドでは何もしない）
+    get_broker().start()
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    # 書き込み待ちの閲覧回数を全て反映してから終了
+    view_counter.stop()
+    job_worker.stop()
+    get_broker().stop()
+
 # ヘルスチェック用エンドポイント
 @app.get("/")
 async def root():
     return {"message": "タイムリミット日記アプリAPI"}
 
+# キャッシュなどの統計情報（METRICS_TOKENを設定した場合だけ、そのトークンを付けたリクエストに返す）
+@app.get("/metrics", include_in_schema=False)
+async def metrics(authorization: Optional[str] = Header(None)):
+    if not settings.METRICS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    expected = f"Bearer {settings.METRICS_TOKEN}"
+    if not secrets.compare_digest((authorization or "").encode(), expected.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return collect_metrics()
+
 # APIルーターの登録
 app.include_router(auth_router)
 app.include_router(diary_router)
 app.include_router(friend_router)
+app.include_router(job_router)
 app.include_router(user_router)
\ No newline at end of file
@@ -1,9 +1,25 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean, Index
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
-from ..core.database import Base
+from sqlalchemy.orm import relationship, query_expression
+from ..core.database import Base, Timestamp
+from ..services.view_counter import pending_views
 from datetime import datetime, timedelta, timezone
 
+# 日時は日本時間（タイムゾーン情報なし）として扱う
+JST = timezone(timedelta(hours=9))
+
+
+def now_jst():
+    """現在の日本時間をタイムゾーン情報なしで返す（DBの日時と比較する用）"""
+    return datetime.now(JST).replace(tzinfo=None)
+
+
+def to_naive_jst(value: datetime):
+    """日時を日本時間のタイムゾーン情報なしの値に揃える"""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(JST).replace(tzinfo=None)
+
 
 class Diary(Base):
     __tablename__ = "diaries"
@@ -18,37 +34,38 @@ class Diary(Base):
     view_count = Column(Integer, default=0)
     like_count = Column(Integer, default=0)
     emotion_analysis = Column(String, nullable=True)  # 感情分析結果: 'very_happy', 'happy', 'normal', 'unhappy', 'very_unhappy'
-    created_at = Column(DateTime, default=func.now())
+    summary = Column(Text, nullable=True)  # 月ごとフィードバック用の短い要約（感情分析と一緒に作る）
+    created_at = Column(Timestamp, default=func.now())
+    view_end_at = Column(DateTime, nullable=True)  # 公開終了時刻（作成時に保存、日本時間として扱う）
+    # 閲覧者がいいね済みかどうか（一覧取得時にwith_likedで同じクエリ内で読み込む）
+    is_liked_by_me = query_expression()
     
     # リレーションシップ
-    user = relationship("User", backref="diaries")
+    user = relationship("User", backref="diaries", lazy="joined")  # レスポンスで常に使うため一緒に読み込む
+
+    __table_args__ = (
+        # フィード・公開一覧の絞り込みとページングをDB側で行うための複合インデックス
+        Index("ix_diaries_user_view_end_created", "user_id", "view_end_at", "created_at"),
+    )
+    
+    # DBに反映済みの閲覧回数に、書き込み待ちの増分を加えたもの
+    @property
+    def current_view_count(self):
+        return (self.view_count or 0) + pending_views(self.id)
     
     # 公開終了時間を計算するプロパティ
     @property
     def view_end_time(self):
-        return self.created_at + timedelta(seconds=self.view_limit_duration_sec)
+        if self.view_end_at is not None:
+            return self.view_end_at
+        # view_end_at未設定（移行前）の日記は作成時刻から計算する
+        return to_naive_jst(self.created_at) + timedelta(seconds=self.view_limit_duration_sec)
     
     # 現在公開中かどうかを判定するプロパティ
     @property
     def is_viewable(self):
-        # 日本時間で統一して比較
-        jst = timezone(timedelta(hours=9))
-        now_jst = datetime.now(jst)
-        created_jst = self.created_at
-        
-        # created_atがタイムゾーン情報を持っていない場合は、日本時間として扱う
-        if created_jst.tzinfo is None:
-            created_jst = created_jst.replace(tzinfo=jst)
-        else:
-            # タイムゾーン情報がある場合は、日本時間に変換
-            created_jst = created_jst.astimezone(jst)
-        
-        view_end_time = created_jst + timedelta(seconds=self.view_limit_duration_sec)
-        is_viewable = now_jst <= view_end_time
-        
-        print(f"is_viewable計算 (JST): 日記ID={self.id}, 現在時刻JST={now_jst}, 作成時刻JST={created_jst}, 終了時刻JST={view_end_time}, 結果={is_viewable}")
-        
-        return is_viewable
+        # created_atがタイムゾーン情報を持っていない場合は日本時間として扱い、日本時間で統一して比較
+        return now_jst() <= self.view_end_time
 
 
 class DiaryLike(Base):
@@ -63,6 +80,11 @@ class DiaryLike(Base):
     diary = relationship("Diary", backref="likes")
     user = relationship("User", backref="diary_likes")
 
+    __table_args__ = (
+        # 同じユーザーが同じ日記に二重にいいねできないようにする
+        Index("uq_diary_likes_diary_user", "diary_id", "user_id", unique=True),
+    )
+
 
 # このFeedbackモデルが正しく存在することを確認
 class Feedback(Base):
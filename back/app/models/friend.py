@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text, Index, text
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
-from ..core.database import Base
+from ..core.config import settings
+from ..core.database import Base, Timestamp
 
 class FriendRequest(Base):
     __tablename__ = "friend_requests"
@@ -17,6 +18,15 @@ class FriendRequest(Base):
     to_user = relationship("User", foreign_keys=[to_user_id], backref="received_friend_requests")
 
 
+class Friendship(Base):
+    """フレンド関係（双方向に1行ずつ保存する）"""
+    __tablename__ = "friendships"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    friend_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    created_at = Column(DateTime, default=func.now())
+
+
 class Notification(Base):
     __tablename__ = "notifications"
 
@@ -26,10 +36,68 @@ class Notification(Base):
     type = Column(String)  # 'like', 'friend', 'streak', 'feedback'
     related_id = Column(Integer, nullable=True)  # 関連するIDを保存（日記ID、ユーザーIDなど）
     is_read = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=func.now())
+    created_at = Column(Timestamp, default=func.now())  # まとめた通知でも変えない（一覧のページングの順序を保つ）
+    updated_at = Column(Timestamp, nullable=True)  # まとめた通知で最後にまとめた時刻
+    # 同じキーの未読の通知は1行にまとめる（いいねなら日記と時間帯ごと。まとめない通知はNULL）
+    group_key = Column(String, nullable=True)
+    actor_count = Column(Integer, nullable=False, default=1, server_default="1")  # まとめたユーザーの人数
+    last_actor_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # 最後に通知のきっかけを作ったユーザー
     
     # リレーションシップ
-    user = relationship("User", backref="notifications")
+    user = relationship("User", foreign_keys=[user_id], backref="notifications")
+
+    __table_args__ = (
+        # 未読の通知の絞り込みと新しい順の一覧をインデックスだけで行う
+        Index("ix_notifications_user_read_created", "user_id", "is_read", "created_at"),
+        # 既読も含めた通知の一覧（新しい順のキーセットページネーション）用
+        Index("ix_notifications_user_created", "user_id", "created_at", "id"),
+        # まとめる通知の一意インデックス（既読にした後は、次の通知は新しい行になる）
+        Index(
+            "uq_notifications_unread_group", "user_id", "group_key", unique=True,
+            sqlite_where=text("is_read = false"),
+            postgresql_where=text("is_read = false"),
+        ),
+    )
+
+
+class NotificationActor(Base):
+    """まとめた通知のきっかけを作ったユーザー（同じユーザーを2回数えないようにする）"""
+    __tablename__ = "notification_actors"
 
+    notification_id = Column(Integer, ForeignKey("notifications.id"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
 
 
+class NotificationCounter(Base):
+    """ユーザーごとの未読通知の件数
+
+    通知の作成・既読と同じトランザクションで更新し、バッジの表示は主キーでの1行の読み込みで済ませる。
+    """
+    __tablename__ = "notification_counters"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    unread_count = Column(Integer, nullable=False, default=0)
+
+
+class NotificationArchive(Base):
+    """保存期間を過ぎた既読の通知の保管先（NOTIFICATION_RETENTION_MODE=archiveの場合）
+
+    PostgreSQLでNOTIFICATION_ARCHIVE_PARTITIONEDを有効にすると作成時刻の月ごとのパーティションに分け、
+    保管期間を過ぎた月はパーティションごと削除する。
+    """
+    __tablename__ = "notification_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)  # 元の通知のID
+    created_at = Column(Timestamp, primary_key=True)  # パーティションのキーは主キーに含める必要がある
+    user_id = Column(Integer)
+    message = Column(String)
+    type = Column(String)
+    related_id = Column(Integer, nullable=True)
+    actor_count = Column(Integer, nullable=False, default=1)
+    last_actor_id = Column(Integer, nullable=True)
+    archived_at = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        Index("ix_notification_archive_user", "user_id"),
+        {"postgresql_partition_by": "RANGE (created_at)"} if settings.NOTIFICATION_ARCHIVE_PARTITIONED else {},
+    )
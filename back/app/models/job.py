@@ -0,0 +1,39 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, text
+from ..core.database import Base, Timestamp
+from .diary import now_jst
+
+
+class Job(Base):
+    """バックグラウンドで実行する処理のキュー（感情分析、フィードバックの生成など）
+
+    リクエストの中では行を追加するだけにして、外部APIの呼び出しはワーカーが行う。
+    プロセスが再起動しても未実行のジョブは失われない。
+    """
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # ジョブの種類: 'emotion_analysis' など
+    status = Column(String, nullable=False, default="pending")  # 'pending', 'running', 'done', 'failed'
+    diary_id = Column(Integer, ForeignKey("diaries.id"), nullable=True)  # 対象の日記
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # 対象のユーザー
+    period = Column(String, nullable=True)  # 対象の期間（月ごとフィードバック用、例: "2024-06"）
+    # 同じ処理の重複実行を防ぐキー（実行待ち・実行中のジョブの中で一意）
+    dedupe_key = Column(String, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)  # 実行した回数
+    run_after = Column(DateTime, nullable=True)  # この時刻以降に実行する（リトライの待ち時間）
+    locked_at = Column(DateTime, nullable=True)  # ワーカーが実行を開始した時刻
+    last_error = Column(String, nullable=True)
+    # ジョブの時刻はどれも日本時間で保存する（run_afterなどと比べるため、DBの時計は使わない）
+    created_at = Column(Timestamp, default=now_jst)
+    finished_at = Column(DateTime, nullable=True)  # 完了または失敗が確定した時刻
+
+    __table_args__ = (
+        # ワーカーが実行待ちのジョブを探すためのインデックス
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+        # 同じキーのジョブは実行待ち・実行中のものが1件だけ存在できる（ダブルクリックなどで二重に生成しない）
+        Index(
+            "uq_jobs_active_dedupe_key", "dedupe_key", unique=True,
+            sqlite_where=text("status IN ('pending', 'running')"),
+            postgresql_where=text("status IN ('pending', 'running')"),
+        ),
+    )
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, Index
+from ..core.database import Base, Timestamp
+
+
+class TimelineEntry(Base):
+    """フレンドのホームフィード用タイムライン（日記作成時に各フレンドへ書き込む）"""
+    __tablename__ = "timeline_entries"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)  # タイムラインの持ち主
+    diary_id = Column(Integer, ForeignKey("diaries.id"), primary_key=True)
+    author_id = Column(Integer, ForeignKey("users.id"))  # 日記を書いたユーザー（ユーザー削除時の削除用）
+    created_at = Column(Timestamp)  # 日記の作成時刻
+    view_end_at = Column(DateTime)  # 日記の公開終了時刻
+
+    __table_args__ = (
+        # フィードの範囲読み込み用インデックス
+        Index("ix_timeline_entries_user_created", "user_id", "created_at", "diary_id"),
+        # 公開期限が切れた日記の定期的な削除用
+        Index("ix_timeline_entries_view_end", "view_end_at"),
+    )
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, AliasChoices
 from datetime import datetime
 from typing import Optional, List
 
@@ -22,13 +22,14 @@ class DiaryResponse(DiaryBase):
     id: int
     user_id: int
     user: Optional[UserInfo] = None
-    view_count: int
+    view_count: int = Field(validation_alias=AliasChoices("current_view_count", "view_count"))  # 書き込み待ちの閲覧回数を含む
     like_count: int
     time_limit_sec: int
     char_limit: int
     emotion_analysis: Optional[str] = None  # 感情分析結果
     created_at: datetime
     is_viewable: bool
+    is_liked_by_me: Optional[bool] = None  # 一覧取得時のみ設定される
     
     class Config:
         from_attributes = True
@@ -37,7 +38,7 @@ class OwnDiaryResponse(DiaryBase):
     id: int
     user_id: int
     user: Optional[UserInfo] = None
-    view_count: int
+    view_count: int = Field(validation_alias=AliasChoices("current_view_count", "view_count"))  # 書き込み待ちの閲覧回数を含む
     like_count: int
     time_limit_sec: int
     char_limit: int
@@ -48,6 +49,14 @@ class OwnDiaryResponse(DiaryBase):
     class Config:
         from_attributes = True
 
+class DiaryPage(BaseModel):
+    items: List[DiaryResponse]
+    next_cursor: Optional[str] = None  # 次のページのカーソル（最後のページならnull）
+
+class OwnDiaryPage(BaseModel):
+    items: List[OwnDiaryResponse]
+    next_cursor: Optional[str] = None  # 次のページのカーソル（最後のページならnull）
+
 class DiaryDetail(DiaryResponse):
     # 追加のフィールドがあれば追加
     pass
@@ -63,6 +72,9 @@ class DiaryRules(BaseModel):
 class DiaryLikeCreate(BaseModel):
     diary_id: int
 
+class DiaryLikeStatusRequest(BaseModel):
+    diary_ids: List[int] = Field(..., max_length=100)
+
 class DiaryLikeResponse(BaseModel):
     id: int
     diary_id: int
@@ -36,10 +36,20 @@ class NotificationResponse(NotificationBase):
     user_id: int
     is_read: bool
     created_at: datetime
+    updated_at: Optional[datetime] = None  # まとめた通知で最後にまとめた時刻
+    actor_count: int = 1  # まとめた通知のユーザーの人数（いいねの通知は同じ日記の分を1件にまとめる）
+    last_actor_id: Optional[int] = None  # 最後に通知のきっかけを作ったユーザー
     
     class Config:
         from_attributes = True
 
+class NotificationPage(BaseModel):
+    items: List[NotificationResponse]
+    next_cursor: Optional[str] = None  # 次のページのカーソル（最後のページならnull）
+
+class NotificationCount(BaseModel):
+    count: int  # 未読の通知の件数
+
 class FeedbackBase(BaseModel):
     period: str  # 'weekly' or 'monthly'
     content: str
@@ -0,0 +1,17 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import Optional
+
+class JobResponse(BaseModel):
+    id: int
+    kind: str
+    status: str  # 'pending', 'running', 'done', 'failed'
+    diary_id: Optional[int] = None
+    period: Optional[str] = None
+    attempts: int
+    last_error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -27,6 +27,15 @@ class UserDetail(UserResponse):
     class Config:
         from_attributes = True
 
+class CurrentUser(BaseModel):
+    """認証済みユーザーの軽量なスナップショット（リクエスト間でキャッシュされる）"""
+    id: int
+    username: str
+    email: str
+    
+    class Config:
+        from_attributes = True
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -0,0 +1,68 @@
+"""
+感情分析がまだの日記（emotion_analysis IS NULL）をまとめて分析し直すコマンド
+
+使い方（backディレクトリで実行）:
+    python -m app.services.emotion_backfill
+    python -m app.services.emotion_backfill --batch-size 20 --limit 500
+    python -m app.services.emotion_backfill --dry-run
+"""
+import argparse
+from sqlalchemy.orm import Session
+from ..core.config import settings
+from ..core.database import SessionLocal
+from ..models.diary import Diary
+from .gemini_service import analyze_emotions_batch
+
+
+def rescore_null_emotions(db: Session, batch_size: int, limit: int = None, dry_run: bool = False) -> int:
+    """emotion_analysisがnullの日記をbatch_size件ずつ一括分析し、更新した件数を返す"""
+    updated = 0
+    last_id = 0
+    while limit is None or updated < limit:
+        size = batch_size if limit is None else min(batch_size, limit - updated)
+        diaries = db.query(Diary).filter(
+            Diary.emotion_analysis.is_(None),
+            Diary.id > last_id
+        ).order_by(Diary.id).limit(size).all()
+        if not diaries:
+            break
+        last_id = diaries[-1].id
+        if dry_run:
+            updated += len(diaries)
+            continue
+
+        contents = {diary.id: diary.content for diary in diaries}
+        # APIの応答を待つ間、読み込みのトランザクションを開いたままにしない
+        db.commit()
+        results = analyze_emotions_batch(contents)
+        for diary in diaries:
+            diary.emotion_analysis = results[diary.id]
+        db.commit()
+        updated += len(diaries)
+        print(f"{updated}件の日記を分析しました（最後のID: {last_id}）")
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=settings.EMOTION_BATCH_SIZE, help="1回のAPI呼び出しで分析する件数")
+    parser.add_argument("--limit", type=int, default=None, help="分析する日記の最大件数")
+    parser.add_argument("--dry-run", action="store_true", help="対象の件数だけを表示する")
+    args = parser.parse_args()
+
+    # 全てのモデルを読み込み、テーブルの作成とマイグレーションを行う
+    from .. import main as _app  # noqa: F401
+
+    db = SessionLocal()
+    try:
+        count = rescore_null_emotions(db, args.batch_size, args.limit, args.dry_run)
+    finally:
+        db.close()
+    if args.dry_run:
+        print(f"分析対象の日記: {count}件")
+    else:
+        print(f"完了しました: {count}件")
+
+
+if __name__ == "__main__":
+    main()
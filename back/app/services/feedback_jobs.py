@@ -0,0 +1,62 @@
+from sqlalchemy.orm import Session
+from ..crud.diary import get_diary, get_diary_feedback, save_feedback
+from ..crud.job import enqueue_unique_job
+from ..models.job import Job
+from .gemini_service import generate_feedback_from_diary
+from .job_worker import job_handler, job_worker
+from .monthly_feedback import build_monthly_feedback
+
+# ジョブの種類
+DIARY_FEEDBACK = "diary_feedback"
+MONTHLY_FEEDBACK = "monthly_feedback"
+
+
+def diary_feedback_key(diary_id: int) -> str:
+    """日記のフィードバックの生成を1件にまとめるためのキー"""
+    return f"{DIARY_FEEDBACK}:{diary_id}"
+
+
+def monthly_feedback_key(user_id: int, period: str) -> str:
+    """月ごとフィードバックの生成を1件にまとめるためのキー"""
+    return f"{MONTHLY_FEEDBACK}:{user_id}:{period}"
+
+
+def enqueue_diary_feedback(db: Session, diary_id: int, user_id: int) -> Job:
+    """日記のフィードバックの生成ジョブを追加する（生成中のジョブがあればそれを返す）"""
+    job = enqueue_unique_job(db, DIARY_FEEDBACK, diary_feedback_key(diary_id), diary_id=diary_id, user_id=user_id)
+    job_worker.notify()
+    return job
+
+
+def enqueue_monthly_feedback(db: Session, user_id: int, period: str) -> Job:
+    """月ごとフィードバックの生成ジョブを追加する（生成中のジョブがあればそれを返す）"""
+    job = enqueue_unique_job(db, MONTHLY_FEEDBACK, monthly_feedback_key(user_id, period), user_id=user_id, period=period)
+    job_worker.notify()
+    return job
+
+
+@job_handler(DIARY_FEEDBACK)
+def run_diary_feedback(db: Session, job: Job):
+    """日記のフィードバックを生成して保存する"""
+    diary_id, user_id = job.diary_id, job.user_id
+    # 前回の実行でフィードバックの保存後にジョブの完了を記録できなかった場合は生成し直さない
+    if get_diary_feedback(db, diary_id):
+        return
+    diary = get_diary(db, diary_id)
+    if not diary:
+        return
+    content = diary.content
+    # APIの応答を待つ間、読み込みのトランザクションを開いたままにしない
+    db.commit()
+    feedback_content = generate_feedback_from_diary(content, raise_on_error=True)
+    save_feedback(db, user_id, feedback_content, diary_id=diary_id)
+
+
+@job_handler(MONTHLY_FEEDBACK)
+def run_monthly_feedback(db: Session, job: Job):
+    """日記ごとの要約から月ごとのフィードバックを生成して保存する"""
+    user_id, period = job.user_id, job.period
+    year, month = (int(value) for value in period.split("-"))
+    feedback_content = build_monthly_feedback(db, user_id, year, month, raise_on_error=True)
+    # 月ごとフィードバックは既存のものを置き換える
+    save_feedback(db, user_id, feedback_content, period=period)
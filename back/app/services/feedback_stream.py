@@ -0,0 +1,203 @@
+import asyncio
+import time
+from contextlib import aclosing
+from typing import AsyncIterator, Callable, Iterator, Optional, Tuple
+import anyio
+from sqlalchemy.orm import Session
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from ..core.config import settings
+from ..core.database import SessionLocal
+from ..crud.diary import get_diary, get_diary_feedback, get_monthly_feedback, get_user_diaries_by_period, save_feedback
+from ..crud.job import claim_unique_job, complete_jobs, fail_jobs, release_job
+from ..models.job import Job
+from ..utils.sse import SSE_KEEPALIVE, format_sse
+from .feedback_jobs import DIARY_FEEDBACK, MONTHLY_FEEDBACK, diary_feedback_key, monthly_feedback_key
+from .gemini_service import stream_feedback_from_diary, stream_monthly_feedback_from_summaries
+from .job_worker import job_worker
+from .monthly_feedback import month_range, summarize_missing_diaries
+
+# フィードバックを生成しながらServer-Sent Eventsとして返す
+# イベント: start（ジョブID）, delta（生成されたテキストの続き）, done（保存した全文）, error
+# 同じ日記・同じ月の生成はジョブ（dedupe_key）で1件にまとめ、他で生成中の場合はその完了を待って全文を返す
+# DBの読み書きとGemini APIの呼び出しはスレッドで行い、完了を待つ間はイベントループで待つ
+
+
+def _job_result(db: Session, job_id: int, load_result: Callable[[], Optional[str]]) -> Tuple[Optional[str], Optional[str]]:
+    """ジョブの状態と、完了していれば保存されたフィードバックを返す"""
+    try:
+        status = db.query(Job.status).filter(Job.id == job_id).scalar()
+        return status, load_result() if status == "done" else None
+    finally:
+        # 待つ間は接続をプールに返し、次の確認では最新の状態を読む
+        db.rollback()
+
+
+async def _wait_for_job(db: Session, job_id: int, load_result: Callable[[], Optional[str]]) -> AsyncIterator[str]:
+    """他で実行中のジョブの完了を待ち、保存されたフィードバックを返す
+
+    待つ間はスレッドもDBの接続も使わずにイベントループで待ち、状態の確認（短い読み込み）だけをスレッドで行う。
+    """
+    deadline = time.monotonic() + settings.FEEDBACK_STREAM_WAIT_SEC
+    last_sent = time.monotonic()
+    while time.monotonic() < deadline:
+        await asyncio.sleep(settings.FEEDBACK_STREAM_CHECK_INTERVAL_SEC)
+        status, content = await run_in_threadpool(_job_result, db, job_id, load_result)
+        if status == "done" and content is not None:
+            yield format_sse("done", {"content": content})
+            return
+        if status in ("failed", None):
+            yield format_sse("error", {"message": "フィードバックの生成に失敗しました。", "job_id": job_id})
+            return
+        if time.monotonic() - last_sent >= settings.FEEDBACK_STREAM_KEEPALIVE_SEC:
+            last_sent = time.monotonic()
+            yield SSE_KEEPALIVE
+    yield format_sse("error", {"message": "フィードバックの生成に時間がかかっています。", "job_id": job_id})
+
+
+def _generate_job(db: Session, job: Job, generate: Callable[[], Iterator[str]],
+                  save: Callable[[str], None]) -> Iterator[str]:
+    """取得したジョブのフィードバックを生成しながら返し、最後に保存する（スレッドで実行する）"""
+    job_id = job.id
+    # APIの応答を待つ間、読み込みのトランザクションを開いたままにしない
+    db.commit()
+    finished = False
+    try:
+        chunks = []
+        for text in generate():
+            chunks.append(text)
+            yield format_sse("delta", {"text": text})
+        content = "".join(chunks)
+        save(content)
+        complete_jobs(db, [job])
+        finished = True
+        yield format_sse("done", {"content": content})
+    except Exception as e:
+        db.rollback()
+        print(f"フィードバックのストリーミングに失敗しました: job={job_id}: {e}")
+        # リトライ回数が残っていればワーカーが引き続き生成する
+        fail_jobs(db, [job], str(e), settings.JOB_MAX_ATTEMPTS, settings.JOB_RETRY_BASE_SEC)
+        finished = True
+        job_worker.notify()
+        yield format_sse("error", {
+            "message": "フィードバックの生成中にエラーが発生しました。",
+            "job_id": job_id,
+            "retrying": job.status == "pending",
+        })
+    finally:
+        if not finished:
+            # クライアントが途中で切断した場合は、残りの生成をワーカーに引き継ぐ
+            db.rollback()
+            release_job(db, job)
+            job_worker.notify()
+
+
+def _claim(db: Session, claim: Callable[[], Tuple[Job, bool]]) -> Tuple[Job, int, bool]:
+    """ジョブを取得し、(ジョブ, ジョブID, 取得できたか) を返す
+
+    取得できなかった場合は完了を待つ間に接続を持たないよう、トランザクションを終えておく。
+    """
+    job, owned = claim()
+    job_id = job.id
+    if not owned:
+        db.rollback()
+    return job, job_id, owned
+
+
+async def _stream_job(db: Session, job: Job, job_id: int, owned: bool, generate: Callable[[], Iterator[str]],
+                      save: Callable[[str], None], load_result: Callable[[], Optional[str]]) -> AsyncIterator[str]:
+    """ジョブを取得できた場合は生成しながら返して最後に保存し、できなかった場合は完了を待つ"""
+    yield format_sse("start", {"job_id": job_id})
+    if not owned:
+        async for event in _wait_for_job(db, job_id, load_result):
+            yield event
+        return
+
+    events = _generate_job(db, job, generate, save)
+    try:
+        async for event in iterate_in_threadpool(events):
+            yield event
+    finally:
+        # 切断された場合もジョブを引き継げるよう、生成側のfinallyを確実に実行する（キャンセル中でも待つ）
+        with anyio.CancelScope(shield=True):
+            await run_in_threadpool(events.close)
+
+
+def _content(feedback) -> Optional[str]:
+    return feedback.content if feedback else None
+
+
+def _claim_diary_feedback(db: Session, diary_id: int, user_id: int):
+    """保存済みのフィードバックの本文、または (日記の本文, ジョブ, ジョブID, 取得できたか) を返す"""
+    existing = get_diary_feedback(db, diary_id)
+    if existing:
+        return existing.content, None
+    diary = get_diary(db, diary_id)
+    content = diary.content if diary else ""
+    return None, (content, *_claim(db, lambda: claim_unique_job(
+        db, DIARY_FEEDBACK, diary_feedback_key(diary_id), diary_id=diary_id, user_id=user_id
+    )))
+
+
+async def stream_diary_feedback_events(diary_id: int, user_id: int) -> AsyncIterator[str]:
+    """日記のフィードバックを生成しながらSSEのイベントとして返す（保存済みならその全文を返す）"""
+    db = SessionLocal()
+    try:
+        existing, claimed = await run_in_threadpool(_claim_diary_feedback, db, diary_id, user_id)
+        if existing is not None:
+            yield format_sse("done", {"content": existing})
+            return
+        content, job, job_id, owned = claimed
+        # 接続が閉じられたら、このジェネレータと一緒にジョブの処理も閉じる
+        async with aclosing(_stream_job(
+            db, job, job_id, owned,
+            generate=lambda: stream_feedback_from_diary(content),
+            save=lambda text: save_feedback(db, user_id, text, diary_id=diary_id),
+            load_result=lambda: _content(get_diary_feedback(db, diary_id)),
+        )) as events:
+            async for event in events:
+                yield event
+    finally:
+        with anyio.CancelScope(shield=True):
+            await run_in_threadpool(db.close)
+
+
+def _claim_monthly_feedback(db: Session, user_id: int, period: str, regenerate: bool):
+    """保存済みのフィードバックの本文、または (ジョブ, ジョブID, 取得できたか) を返す"""
+    existing = get_monthly_feedback(db, user_id, period)
+    if existing and not regenerate:
+        return existing.content, None
+    return None, _claim(db, lambda: claim_unique_job(
+        db, MONTHLY_FEEDBACK, monthly_feedback_key(user_id, period), user_id=user_id, period=period
+    ))
+
+
+async def stream_monthly_feedback_events(user_id: int, year: int, month: int, regenerate: bool = False) -> AsyncIterator[str]:
+    """月ごとフィードバックを生成しながらSSEのイベントとして返す（保存済みならその全文を返す）"""
+    period = f"{year}-{month:02d}"
+    db = SessionLocal()
+    try:
+        existing, claimed = await run_in_threadpool(_claim_monthly_feedback, db, user_id, period, regenerate)
+        if existing is not None:
+            yield format_sse("done", {"content": existing})
+            return
+        job, job_id, owned = claimed
+
+        def generate():
+            start_date, end_date = month_range(year, month)
+            diaries = get_user_diaries_by_period(db, user_id, start_date, end_date)
+            summaries = summarize_missing_diaries(db, diaries)
+            db.commit()
+            yield from stream_monthly_feedback_from_summaries(summaries, year, month)
+
+        # 接続が閉じられたら、このジェネレータと一緒にジョブの処理も閉じる
+        async with aclosing(_stream_job(
+            db, job, job_id, owned,
+            generate=generate,
+            save=lambda text: save_feedback(db, user_id, text, period=period),
+            load_result=lambda: _content(get_monthly_feedback(db, user_id, period)),
+        )) as events:
+            async for event in events:
+                yield event
+    finally:
+        with anyio.CancelScope(shield=True):
+            await run_in_threadpool(db.close)
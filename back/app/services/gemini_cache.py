@@ -0,0 +1,110 @@
+import hashlib
+import sqlite3
+import threading
+from typing import Callable, Optional
+from ..core.config import settings
+from ..core.metrics import register_metrics
+from ..utils.cache import TTLCache
+
+
+class ResponseCache:
+    """Gemini APIの応答のキャッシュ
+
+    (処理の種類, プロンプトのバージョン, 内容) のハッシュをキーにして、同じ内容の日記の再投稿や
+    ジョブのリトライ、削除後の月ごとフィードバックの再生成ではAPIを呼び出さない。
+    メモリ上はLRUで保持し、pathを指定した場合はSQLiteファイルにも保存して再起動後も使う。
+    """
+
+    def __init__(self, maxsize: int, path: Optional[str] = None):
+        self.memory = TTLCache(maxsize=maxsize, ttl=float("inf"))
+        self.path = path
+        self.persistent_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(task: str, version: int, content: str) -> str:
+        raw = f"{task}\0{version}\0{content}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _load(self, key: str) -> Optional[str]:
+        if self._conn is None:
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _store(self, key: str, value: str):
+        if self._conn is None:
+            return
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO responses (key, value) VALUES (?, ?)", (key, value))
+            self._conn.commit()
+
+    def get(self, task: str, version: int, content: str) -> Optional[str]:
+        """キャッシュされた応答を返す（無ければNone）"""
+        key = self.make_key(task, version, content)
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        value = self._load(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.persistent_hits += 1
+        if value is not None:
+            self.memory.set(key, value)
+        return value
+
+    def set(self, task: str, version: int, content: str, value: str):
+        key = self.make_key(task, version, content)
+        self.memory.set(key, value)
+        self._store(key, value)
+
+    def get_or_call(self, task: str, version: int, content: str, call: Callable[[], str]) -> str:
+        """キャッシュに無ければcallを呼び出して結果を保存する（例外の場合は保存しない）"""
+        value = self.get(task, version, content)
+        if value is None:
+            value = call()
+            self.set(task, version, content, value)
+        return value
+
+    def clear(self):
+        self.memory.clear()
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute("DELETE FROM responses")
+                self._conn.commit()
+
+    def stats(self) -> dict:
+        memory = self.memory.stats()
+        with self._lock:
+            hits = memory["hits"] + self.persistent_hits
+            total = hits + self.misses
+            return {
+                "size": memory["size"],
+                "maxsize": memory["maxsize"],
+                "hits": hits,
+                "memory_hits": memory["hits"],
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+                "persistent": self._conn is not None,
+            }
+
+
+response_cache = ResponseCache(
+    maxsize=settings.GEMINI_CACHE_MAX_ENTRIES,
+    path=settings.GEMINI_CACHE_PATH or None,
+)
+register_metrics("gemini_cache", response_cache.stats)
@@ -0,0 +1,226 @@
+import random
+import threading
+import time
+from typing import Iterator
+from google.api_core import exceptions as google_exceptions
+from ..utils.circuit_breaker import CircuitBreaker
+from ..utils.rate_limit import RateLimitExceeded, TokenBucket
+
+# 時間をおいて再試行すれば成功する可能性があるエラー
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    TimeoutError,
+    ConnectionError,
+)
+
+
+class GeminiClient:
+    """Gemini APIの呼び出しをまとめて制御するクライアント
+
+    - トークンバケットで1分あたりのリクエスト数を制限する（上限を超えた分は待たせる）
+    - 呼び出しごとにタイムアウトを設定する
+    - 一時的なエラーはジッター付きの指数バックオフで再試行する
+    - 失敗が続いたらサーキットブレーカーを開き、回復するまでAPIを呼ばずにすぐ例外を送出する
+      （呼び出し側はローカルの分類やエラーメッセージなどのフォールバックを使う）
+    """
+
+    def __init__(self, model, limiter: TokenBucket, breaker: CircuitBreaker, timeout: float,
+                 queue_timeout: float, max_retries: int, retry_base_sec: float, retry_max_sec: float):
+        self.model = model
+        self.limiter = limiter
+        self.breaker = breaker
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.retry_base_sec = retry_base_sec
+        self.retry_max_sec = retry_max_sec
+        self.requests = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retries = 0
+        self.timeouts = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def _backoff(self, attempt: int) -> float:
+        # フルジッター: 0〜(base * 2^attempt) の間でランダムに待つ（同時に失敗した呼び出しの再試行をずらす）
+        return random.uniform(0, min(self.retry_max_sec, self.retry_base_sec * 2 ** attempt))
+
+    def _call(self, prompt: str) -> str:
+        with self._lock:
+            self._in_flight += 1
+        try:
+            return self.model.generate_content(prompt, request_options={"timeout": self.timeout}).text
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def generate(self, prompt: str) -> str:
+        """プロンプトを送信して応答のテキストを返す
+
+        サーキットが開いている場合はCircuitOpenError、レート制限の待ち時間を超えた場合は
+        RateLimitExceededを送出する。
+        """
+        self.breaker.before_call()
+        with self._lock:
+            self.requests += 1
+        attempt = 0
+        while True:
+            try:
+                self.limiter.acquire(self.queue_timeout)
+            except RateLimitExceeded:
+                # 混雑しているだけなのでサーキットの失敗には数えない
+                self.breaker.record_skipped()
+                raise
+            try:
+                text = self._call(prompt)
+            except RETRYABLE_ERRORS as e:
+                with self._lock:
+                    if isinstance(e, (google_exceptions.DeadlineExceeded, TimeoutError)):
+                        self.timeouts += 1
+                    if attempt >= self.max_retries:
+                        self.failed += 1
+                    else:
+                        self.retries += 1
+                if attempt >= self.max_retries:
+                    self.breaker.record_failure()
+                    raise
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            except Exception:
+                # 不正なリクエストなど再試行しても変わらないエラー
+                with self._lock:
+                    self.failed += 1
+                self.breaker.record_failure()
+                raise
+            with self._lock:
+                self.succeeded += 1
+            self.breaker.record_success()
+            return text
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """プロンプトを送信し、生成されたテキストを届いた順に返す
+
+        最初のテキストが届く前のエラーはgenerateと同じように再試行する。
+        途中まで返した後のエラーは再試行せずに送出する（呼び出し側に重複したテキストを渡さない）。
+        """
+        self.breaker.before_call()
+        with self._lock:
+            self.requests += 1
+        attempt = 0
+        while True:
+            try:
+                self.limiter.acquire(self.queue_timeout)
+            except RateLimitExceeded:
+                self.breaker.record_skipped()
+                raise
+            started = False
+            with self._lock:
+                self._in_flight += 1
+            try:
+                response = self.model.generate_content(prompt, stream=True, request_options={"timeout": self.timeout})
+                for chunk in response:
+                    text = chunk.text
+                    if text:
+                        started = True
+                        yield text
+            except RETRYABLE_ERRORS as e:
+                with self._lock:
+                    if isinstance(e, (google_exceptions.DeadlineExceeded, TimeoutError)):
+                        self.timeouts += 1
+                    retry = not started and attempt < self.max_retries
+                    if retry:
+                        self.retries += 1
+                    else:
+                        self.failed += 1
+                if not retry:
+                    self.breaker.record_failure()
+                    raise
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            except GeneratorExit:
+                # 呼び出し側が途中で読むのをやめた（失敗には数えない）
+                self.breaker.record_skipped()
+                raise
+            except Exception:
+                with self._lock:
+                    self.failed += 1
+                self.breaker.record_failure()
+                raise
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+            with self._lock:
+                self.succeeded += 1
+            self.breaker.record_success()
+            return
+
+    def stats(self) -> dict:
+        limiter = self.limiter.stats()
+        breaker = self.breaker.stats()
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+                "retries": self.retries,
+                "timeouts": self.timeouts,
+                "in_flight": self._in_flight,
+                "queue_depth": limiter["queue_depth"],
+                "tokens": limiter["tokens"],
+                "rate_limited": limiter["rejected"],
+                "circuit_state": breaker["state"],
+                "circuit_opened": breaker["opened"],
+                "circuit_rejected": breaker["rejected"],
+            }
+
+
+class FakeModel:
+    """ローカルで動く偽のモデル（APIキーなしでの動作確認や負荷試験用）
+
+    latency秒待ってからresponseを返し、failure_rateの割合でServiceUnavailableを送出する。
+    stream=Trueの場合はresponseを数文字ずつに分けて返す。
+    タイムアウトより長いlatencyを指定するとDeadlineExceededを送出する。
+    """
+
+    def __init__(self, response: str = "normal", latency: float = 0.0, failure_rate: float = 0.0):
+        self.response = response
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = 0
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        self.calls += 1
+        timeout = (request_options or {}).get("timeout")
+        if stream:
+            return self._stream(timeout)
+        self._wait(timeout, self.latency)
+        response = self.response
+
+        class _Response:
+            text = response
+        return _Response()
+
+    def _wait(self, timeout, latency, may_fail=True):
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout)
+            raise google_exceptions.DeadlineExceeded("fake model timed out")
+        time.sleep(latency)
+        if may_fail and random.random() < self.failure_rate:
+            raise google_exceptions.ServiceUnavailable("fake model failure")
+
+    def _stream(self, timeout):
+        # 応答を数文字ずつに分け、latencyを分けて少しずつ返す（失敗させるのは最初のチャンクの前だけ）
+        pieces = [self.response[i:i + 8] for i in range(0, len(self.response), 8)] or [""]
+        for index, piece in enumerate(pieces):
+            self._wait(timeout, self.latency / len(pieces), may_fail=index == 0)
+
+            class _Chunk:
+                text = piece
+            yield _Chunk()
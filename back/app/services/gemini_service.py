@@ -1,18 +1,74 @@
+import json
+import re
+from typing import Dict, Iterator, List, Optional
 import google.generativeai as genai
 from ..core.config import settings
+from ..core.metrics import register_metrics
+from ..utils.circuit_breaker import CircuitBreaker
+from ..utils.rate_limit import TokenBucket
+from .gemini_cache import response_cache
+from .gemini_client import FakeModel, GeminiClient
+from .local_emotion import classify_emotion_local
 
 genai.configure(api_key=settings.GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-1.5-flash')
+MODEL_NAME = 'gemini-1.5-flash'
+if settings.GEMINI_FAKE_MODEL:
+    model = FakeModel(settings.GEMINI_FAKE_RESPONSE, latency=settings.GEMINI_FAKE_LATENCY_SEC)
+else:
+    model = genai.GenerativeModel(MODEL_NAME)
 
-def generate_feedback_from_diary(diary_content: str) -> str:
-    """
-    日記の内容からGemini APIを使ってフィードバックを生成する
-    """
-    if not diary_content:
-        return "日記の内容がありません。"
+# 全ての呼び出しで共有するクライアント（レート制限・タイムアウト・再試行・サーキットブレーカー）
+client = GeminiClient(
+    model,
+    limiter=TokenBucket(settings.GEMINI_RATE_LIMIT_RPM, settings.GEMINI_RATE_LIMIT_BURST, settings.GEMINI_MAX_QUEUE),
+    breaker=CircuitBreaker(settings.GEMINI_CIRCUIT_FAILURE_THRESHOLD, settings.GEMINI_CIRCUIT_RESET_SEC),
+    timeout=settings.GEMINI_TIMEOUT_SEC,
+    queue_timeout=settings.GEMINI_QUEUE_TIMEOUT_SEC,
+    max_retries=settings.GEMINI_MAX_RETRIES,
+    retry_base_sec=settings.GEMINI_RETRY_BASE_SEC,
+    retry_max_sec=settings.GEMINI_RETRY_MAX_SEC,
+)
+register_metrics("gemini_client", client.stats)
+
+# プロンプトのバージョン（プロンプトを変更したら上げて、古い応答のキャッシュを使わないようにする）
+FEEDBACK_PROMPT_VERSION = 1
+MONTHLY_FEEDBACK_PROMPT_VERSION = 1
+EMOTION_PROMPT_VERSION = 1
+EMOTION_BATCH_PROMPT_VERSION = 1
+SUMMARY_PROMPT_VERSION = 1
+SUMMARY_REDUCE_PROMPT_VERSION = 1
 
+# 要約をまとめ直すときの1つの要約の長さ（文字数）
+REDUCED_SUMMARY_CHARS = 400
+# 要約を切り詰めた場合に、月ごとフィードバックのプロンプトに書き添える文
+OMITTED_SUMMARIES_NOTE = "（これ以降の日記の要約は長すぎるため省略しました）"
+
+# 感情分析の5段階の評価
+EMOTION_LABELS = ['very_happy', 'happy', 'normal', 'unhappy', 'very_unhappy']
+
+def _generate(task: str, version: int, content: str, prompt: str) -> str:
+    """プロンプトを送信して応答のテキストを返す（同じ内容の応答はキャッシュから返す）"""
+    return response_cache.get_or_call(
+        f"{MODEL_NAME}:{task}", version, content,
+        lambda: client.generate(prompt)
+    )
+
+def _generate_stream(task: str, version: int, content: str, prompt: str) -> Iterator[str]:
+    """プロンプトを送信して生成されたテキストを届いた順に返す（最後まで届いたらキャッシュに保存する）"""
+    cache_task = f"{MODEL_NAME}:{task}"
+    cached = response_cache.get(cache_task, version, content)
+    if cached is not None:
+        yield cached
+        return
+    chunks = []
+    for text in client.stream(prompt):
+        chunks.append(text)
+        yield text
+    response_cache.set(cache_task, version, content, "".join(chunks))
+
+def _feedback_prompt(diary_content: str) -> str:
     # プロンプトの設計が重要です
-    prompt = f"""
+    return f"""
     あなたは、ユーザーに寄り添う優しいカウンセラーです。
     以下の日記を読んで、書いた人が少しでも前向きな気持ちになれるような、温かいフィードバックを150字以内で作成してください。
     フィードバックは、丁寧な言葉遣いで、友人のように語りかけるスタイルでお願いします。
@@ -21,22 +77,35 @@ def generate_feedback_from_diary(diary_content: str) -> str:
     {diary_content}
     """
 
+def generate_feedback_from_diary(diary_content: str, raise_on_error: bool = False) -> str:
+    """
+    日記の内容からGemini APIを使ってフィードバックを生成する
+    raise_on_errorがTrueの場合、API呼び出しの失敗時は例外を送出する（ジョブのリトライ用）
+    """
+    if not diary_content:
+        return "日記の内容がありません。"
+
     try:
-        response = model.generate_content(prompt)
-        return response.text
+        return _generate("feedback", FEEDBACK_PROMPT_VERSION, diary_content, _feedback_prompt(diary_content))
     except Exception as e:
         print(f"Gemini API Error: {e}")
+        if raise_on_error:
+            raise
         return "フィードバックの生成中にエラーが発生しました。"
 
-def generate_monthly_feedback_from_diaries(diaries_content: str, year: int, month: int) -> str:
+def stream_feedback_from_diary(diary_content: str) -> Iterator[str]:
     """
-    月の日記を全て読み込んで、月ごとのフィードバックを生成する
+    日記のフィードバックを生成しながら、届いたテキストを順に返す
+    API呼び出しに失敗した場合は例外を送出する
     """
-    if not diaries_content:
-        return f"{year}年{month}月の日記が見つかりませんでした。"
+    if not diary_content:
+        yield "日記の内容がありません。"
+        return
+    yield from _generate_stream("feedback", FEEDBACK_PROMPT_VERSION, diary_content, _feedback_prompt(diary_content))
 
+def _monthly_feedback_prompt(diaries_content: str, year: int, month: int) -> str:
     # プロンプトの設計
-    prompt = f"""
+    return f"""
     あなたは、ユーザーに寄り添う優しいカウンセラーです。
     以下の{year}年{month}月の日記を全て読んで、その月の全体を通しての振り返りとフィードバックを300字以内で作成してください。
     
@@ -53,19 +122,159 @@ def generate_monthly_feedback_from_diaries(diaries_content: str, year: int, mont
     {diaries_content}
     """
 
+def generate_monthly_feedback_from_diaries(diaries_content: str, year: int, month: int,
+                                           raise_on_error: bool = False) -> str:
+    """
+    月の日記を全て読み込んで、月ごとのフィードバックを生成する
+    """
+    if not diaries_content:
+        return f"{year}年{month}月の日記が見つかりませんでした。"
+
     try:
-        response = model.generate_content(prompt)
-        return response.text
+        return _generate(
+            "monthly_feedback", MONTHLY_FEEDBACK_PROMPT_VERSION, f"{year}-{month:02d}\n{diaries_content}",
+            _monthly_feedback_prompt(diaries_content, year, month)
+        )
     except Exception as e:
         print(f"Gemini API Error: {e}")
+        if raise_on_error:
+            raise
         return f"{year}年{month}月のフィードバックの生成中にエラーが発生しました。"
 
-def analyze_emotion_from_diary(diary_content: str) -> str:
+def estimate_tokens(text: str) -> int:
+    """プロンプトのトークン数を概算する（英数字は4文字で1トークン、日本語は1文字で1トークンとみなす）"""
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+def summarize_diary(diary_content: str, raise_on_error: bool = False) -> Optional[str]:
+    """
+    月ごとフィードバック用に日記を短く要約する
+    短い日記はAPIを呼び出さずにそのまま返す
+    API呼び出しに失敗した場合、raise_on_errorがTrueなら例外を送出し、FalseならNoneを返す
+    """
+    content = (diary_content or "").strip()
+    if len(content) <= settings.DIARY_SUMMARY_MIN_CHARS:
+        return content
+
+    prompt = f"""
+    以下の日記を、出来事と書いた人の気持ちが分かるように100字以内で要約してください。
+    要約の文章だけを出力してください。
+
+    # 日記の内容
+    {content}
+    """
+
+    try:
+        return _generate("summary", SUMMARY_PROMPT_VERSION, content, prompt).strip()
+    except Exception as e:
+        print(f"Gemini API Error in diary summary: {e}")
+        if raise_on_error:
+            raise
+        return None
+
+def _reduce_summaries(summaries: str, year: int, month: int) -> str:
+    """複数の日記の要約を1つの要約にまとめる"""
+    prompt = f"""
+    以下は{year}年{month}月の日記の要約の一部です。
+    出来事と気持ちの変化が分かるように、日付を残して{REDUCED_SUMMARY_CHARS}字以内にまとめてください。
+    まとめた文章だけを出力してください。
+
+    # 日記の要約
+    {summaries}
+    """
+    return _generate(
+        "summary_reduce", SUMMARY_REDUCE_PROMPT_VERSION, f"{year}-{month:02d}\n{summaries}", prompt
+    ).strip()
+
+def _chunk_by_tokens(entries: List[str], budget: int) -> List[List[str]]:
+    """要約の一覧を、それぞれのトークン数がbudget以下になるように先頭から区切る"""
+    chunks = []
+    current = []
+    current_tokens = 0
+    for entry in entries:
+        tokens = estimate_tokens(entry) + 1
+        if current and current_tokens + tokens > budget:
+            chunks.append(current)
+            current = []
+            current_tokens = 0
+        current.append(entry)
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _truncate_to_budget(text: str, budget: int) -> str:
+    """予算に収まる長さに切り詰め、省略したことを書き添える"""
+    keep = max(0, budget - estimate_tokens(OMITTED_SUMMARIES_NOTE) - 1)
+    return text[:keep] + "\n" + OMITTED_SUMMARIES_NOTE
+
+def _reduce_to_budget(summaries: List[str], year: int, month: int) -> List[str]:
+    """要約の合計がMONTHLY_FEEDBACK_TOKEN_BUDGETに収まるまで、区切ってまとめ直すことを繰り返す
+
+    予算では1件ずつにしか区切れない（1件が大きい）場合は、2件ずつ（最後の1件は単独で）まとめ直す。
+    まとめ直しても短くならない場合だけ切り詰め、ログに残してプロンプトにも省略したことを書く。
+    """
+    budget = settings.MONTHLY_FEEDBACK_TOKEN_BUDGET
+    entries = list(summaries)
+    tokens = estimate_tokens("\n".join(entries))
+    while tokens > budget:
+        chunks = _chunk_by_tokens(entries, budget)
+        if len(chunks) == len(entries):
+            chunks = [entries[i:i + 2] for i in range(0, len(entries), 2)]
+        reduced = [_reduce_summaries("\n".join(chunk), year, month) for chunk in chunks]
+        reduced_tokens = estimate_tokens("\n".join(reduced))
+        if reduced_tokens >= tokens:
+            print(f"月ごとフィードバックの要約が予算に収まらないため切り詰めます: "
+                  f"{year}-{month:02d} tokens={reduced_tokens} budget={budget}")
+            return [_truncate_to_budget("\n".join(reduced), budget)]
+        entries, tokens = reduced, reduced_tokens
+    return entries
+
+def generate_monthly_feedback_from_summaries(summaries: List[str], year: int, month: int,
+                                             raise_on_error: bool = False) -> str:
+    """
+    日記ごとの要約から月ごとのフィードバックを生成する
+    要約の合計がMONTHLY_FEEDBACK_TOKEN_BUDGETを超える場合は、区切ってまとめ直すことを
+    予算に収まるまで繰り返してから（階層的に要約してから）フィードバックを生成する
+    """
+    if not summaries:
+        return generate_monthly_feedback_from_diaries("", year, month, raise_on_error)
+
+    try:
+        entries = _reduce_to_budget(summaries, year, month)
+    except Exception as e:
+        print(f"Gemini API Error in summary reduction: {e}")
+        if raise_on_error:
+            raise
+        return f"{year}年{month}月のフィードバックの生成中にエラーが発生しました。"
+
+    return generate_monthly_feedback_from_diaries("\n".join(entries), year, month, raise_on_error)
+
+def stream_monthly_feedback_from_summaries(summaries: List[str], year: int, month: int) -> Iterator[str]:
+    """
+    日記ごとの要約から月ごとのフィードバックを生成しながら、届いたテキストを順に返す
+    （要約のまとめ直しは最初に行い、最後のフィードバックの生成だけを少しずつ返す）
+    API呼び出しに失敗した場合は例外を送出する
+    """
+    if not summaries:
+        yield f"{year}年{month}月の日記が見つかりませんでした。"
+        return
+    diaries_content = "\n".join(_reduce_to_budget(summaries, year, month))
+    yield from _generate_stream(
+        "monthly_feedback", MONTHLY_FEEDBACK_PROMPT_VERSION, f"{year}-{month:02d}\n{diaries_content}",
+        _monthly_feedback_prompt(diaries_content, year, month)
+    )
+
+def analyze_emotion_from_diary(diary_content: str, raise_on_error: bool = False) -> str:
     """
     日記の内容から感情を分析して5段階の評価を返す
+    raise_on_errorがTrueの場合、API呼び出しの失敗時は例外を送出する（ジョブのリトライ用）
+    Falseの場合はローカルの分類結果を返す
     """
     if not diary_content:
         return "normal"
+    if settings.EMOTION_ANALYZER_MODE == "local":
+        return classify_emotion_local(diary_content)
 
     # プロンプトの設計
     prompt = f"""
@@ -87,17 +296,94 @@ def analyze_emotion_from_diary(diary_content: str) -> str:
     """
 
     try:
-        response = model.generate_content(prompt)
-        result = response.text.strip().lower()
+        result = _generate("emotion", EMOTION_PROMPT_VERSION, diary_content, prompt).strip().lower()
         
         # 結果を検証して有効な値のみを返す
-        valid_emotions = ['very_happy', 'happy', 'normal', 'unhappy', 'very_unhappy']
-        if result in valid_emotions:
+        if result in EMOTION_LABELS:
             return result
         else:
-            print(f"Invalid emotion result: {result}, defaulting to normal")
-            return "normal"
+            print(f"Invalid emotion result: {result}, falling back to local classifier")
+            return classify_emotion_local(diary_content)
             
     except Exception as e:
         print(f"Gemini API Error in emotion analysis: {e}")
-        return "normal"
\ No newline at end of file
+        if raise_on_error:
+            raise
+        return classify_emotion_local(diary_content)
+
+def _parse_emotion_batch(text: str) -> Dict[str, str]:
+    """一括分析の応答（JSONオブジェクト）を {id: 評価} に変換する"""
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if not match:
+        return {}
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {str(key): str(value).strip().lower() for key, value in data.items()}
+
+def analyze_emotions_batch(diaries: Dict[int, str], raise_on_error: bool = False) -> Dict[int, str]:
+    """
+    複数の日記の感情を1回のAPI呼び出しでまとめて分析し、{日記ID: 評価} を返す
+    応答に含まれない日記や、5段階以外の評価が返された日記は1件ずつ分析し直す
+    """
+    if settings.EMOTION_ANALYZER_MODE == "local":
+        return {diary_id: classify_emotion_local(content) for diary_id, content in diaries.items()}
+    results = {}
+    pending = {}
+    for diary_id, content in diaries.items():
+        if not content:
+            results[diary_id] = "normal"
+            continue
+        # 1件ずつの分析と同じキャッシュを使う
+        cached = response_cache.get(f"{MODEL_NAME}:emotion", EMOTION_PROMPT_VERSION, content)
+        if cached is not None and cached.strip().lower() in EMOTION_LABELS:
+            results[diary_id] = cached.strip().lower()
+        else:
+            pending[diary_id] = content
+    if not pending:
+        return results
+
+    items = "\n\n".join(f"## id: {diary_id}\n{content}" for diary_id, content in pending.items())
+    prompt = f"""
+    あなたは感情分析の専門家です。
+    以下の複数の日記をそれぞれ読んで、書いた人の感情を5段階で評価してください。
+
+    評価基準：
+    - very_happy: 非常に幸せ、興奮、達成感、喜びに満ちている
+    - happy: 幸せ、満足、楽しい、前向き
+    - normal: 普通、平静、特に感情の起伏がない
+    - unhappy: 悲しい、不満、落ち込んでいる、心配
+    - very_unhappy: 非常に悲しい、絶望的、怒り、深い落ち込み
+
+    回答は日記のidをキー、評価を値とするJSONオブジェクトだけを出力してください。
+    評価は必ず以下の5つのうちの1つを選んでください：
+    very_happy, happy, normal, unhappy, very_unhappy
+    例: {{"12": "happy", "15": "normal"}}
+
+    # 日記の一覧
+    {items}
+    """
+
+    try:
+        batch_content = json.dumps(pending, ensure_ascii=False, sort_keys=True)
+        labels = _parse_emotion_batch(
+            _generate("emotion_batch", EMOTION_BATCH_PROMPT_VERSION, batch_content, prompt)
+        )
+    except Exception as e:
+        print(f"Gemini API Error in batch emotion analysis: {e}")
+        if raise_on_error:
+            raise
+        labels = {}
+
+    for diary_id, content in pending.items():
+        label = labels.get(str(diary_id))
+        if label in EMOTION_LABELS:
+            results[diary_id] = label
+            response_cache.set(f"{MODEL_NAME}:emotion", EMOTION_PROMPT_VERSION, content, label)
+        else:
+            # 検証に通らなかった日記は1件ずつ分析する
+            results[diary_id] = analyze_emotion_from_diary(content, raise_on_error=raise_on_error)
+    return results
@@ -0,0 +1,215 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+from sqlalchemy.orm import Session
+from ..core.config import settings
+from ..core.database import SessionLocal
+from ..core.metrics import register_metrics
+from ..crud.job import claim_jobs, complete_jobs, fail_jobs, release_stale_jobs
+from ..models.diary import Diary
+from ..models.job import Job
+from .gemini_service import analyze_emotions_batch, summarize_diary
+from .notification_broker import get_broker
+
+# ジョブの種類
+EMOTION_ANALYSIS = "emotion_analysis"
+
+# ジョブの種類ごとの処理と、1回にまとめて実行する件数
+# ハンドラは (db, job) を受け取り、結果をセッションに書き込む（コミットはワーカーがジョブの完了と一緒に行う）
+# batch_sizeが2以上のハンドラは (db, jobs) でジョブのリストを受け取る
+HANDLERS: Dict[str, Tuple[Callable, int]] = {}
+
+
+def job_handler(kind: str, batch_size: int = 1):
+    """ジョブのハンドラを登録するデコレータ"""
+    def decorator(fn):
+        HANDLERS[kind] = (fn, batch_size)
+        return fn
+    return decorator
+
+
+@job_handler(EMOTION_ANALYSIS, batch_size=settings.EMOTION_BATCH_SIZE)
+def run_emotion_analysis(db: Session, jobs: List[Job]):
+    """日記の感情分析と要約をまとめて行い、結果を保存する"""
+    diaries = db.query(Diary).filter(Diary.id.in_([job.diary_id for job in jobs])).all()
+    if not diaries:
+        return
+    contents = {diary.id: diary.content for diary in diaries}
+    # 月ごとフィードバック用の要約もここで作っておく（月ごとの生成時には要約済みの日記を読み直さない）
+    missing_summary = [diary.id for diary in diaries if diary.summary is None]
+    # APIの応答を待つ間、読み込みのトランザクションを開いたままにしない
+    db.commit()
+    results = analyze_emotions_batch(contents, raise_on_error=True)
+    summaries = {diary_id: summarize_diary(contents[diary_id], raise_on_error=True) for diary_id in missing_summary}
+    for diary in diaries:
+        diary.emotion_analysis = results[diary.id]
+        if diary.id in summaries:
+            diary.summary = summaries[diary.id]
+
+
+class JobWorker:
+    """jobsテーブルのジョブを取り出して実行するワーカー
+
+    同時に実行するジョブはconcurrency件まで。失敗したジョブは待ち時間を倍にしながら
+    max_attempts回までリトライする。APIサーバーのプロセス内でも、別プロセス
+    （python -m app.services.job_worker）でも動かせる。
+    """
+
+    def __init__(self, concurrency: int, poll_interval: float, max_attempts: int,
+                 retry_base_sec: float, lock_timeout_sec: int):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_base_sec = retry_base_sec
+        self.lock_timeout_sec = lock_timeout_sec
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self._running = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._executor = None
+        self._thread = None
+
+    def notify(self):
+        """新しいジョブが追加されたことを知らせる（次のポーリングを待たずに取り出す）"""
+        self._wakeup.set()
+
+    def _process(self, job_ids: List[int]):
+        db = SessionLocal()
+        try:
+            jobs = db.query(Job).filter(Job.id.in_(job_ids)).order_by(Job.id).all()
+            if not jobs:
+                # 対象の日記と一緒に削除された
+                return
+            kind = jobs[0].kind
+            handler, batch_size = HANDLERS.get(kind, (None, 1))
+            try:
+                if handler is None:
+                    raise ValueError(f"Unknown job kind: {kind}")
+                if batch_size > 1:
+                    handler(db, jobs)
+                else:
+                    handler(db, jobs[0])
+                complete_jobs(db, jobs)
+                with self._lock:
+                    self.completed += len(jobs)
+            except Exception as e:
+                db.rollback()
+                print(f"ジョブの実行に失敗しました: {kind} ids={job_ids}: {e}")
+                fail_jobs(db, jobs, str(e), self.max_attempts, self.retry_base_sec)
+                with self._lock:
+                    for job in jobs:
+                        if job.status == "failed":
+                            self.failed += 1
+                        else:
+                            self.retried += 1
+        finally:
+            db.close()
+            with self._lock:
+                self._running -= 1
+            # 空きができたので次のジョブを取り出す
+            self._wakeup.set()
+
+    def run_once(self) -> int:
+        """空いている分だけジョブを取り出して実行を開始し、開始したジョブの件数を返す
+
+        まとめて実行できる種類のジョブは、batch_size件ずつ1回の実行にまとめる。
+        """
+        started = 0
+        for kind, (_, batch_size) in HANDLERS.items():
+            with self._lock:
+                free = self.concurrency - self._running
+            if free <= 0:
+                break
+            db = SessionLocal()
+            try:
+                job_ids = claim_jobs(db, free * batch_size, kinds=[kind])
+            finally:
+                db.close()
+            for start in range(0, len(job_ids), batch_size):
+                with self._lock:
+                    self._running += 1
+                self._executor.submit(self._process, job_ids[start:start + batch_size])
+            started += len(job_ids)
+        return started
+
+    def _run(self):
+        last_release = 0.0
+        while not self._stopped.is_set():
+            try:
+                if time.monotonic() - last_release >= self.lock_timeout_sec:
+                    db = SessionLocal()
+                    try:
+                        release_stale_jobs(db, self.lock_timeout_sec)
+                    finally:
+                        db.close()
+                    last_release = time.monotonic()
+                self.run_once()
+            except Exception as e:
+                print(f"ジョブの取り出しに失敗しました: {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def start(self):
+        """ジョブを取り出すバックグラウンドスレッドを開始する"""
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="job-worker")
+        self._thread = threading.Thread(target=self._run, name="job-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """新しいジョブの取り出しを止め、実行中のジョブの完了を待つ"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "running": self._running,
+                "completed": self.completed,
+                "retried": self.retried,
+                "failed": self.failed,
+            }
+
+
+job_worker = JobWorker(
+    concurrency=settings.JOB_WORKER_CONCURRENCY,
+    poll_interval=settings.JOB_POLL_INTERVAL_SEC,
+    max_attempts=settings.JOB_MAX_ATTEMPTS,
+    retry_base_sec=settings.JOB_RETRY_BASE_SEC,
+    lock_timeout_sec=settings.JOB_LOCK_TIMEOUT_SEC,
+)
+register_metrics("job_worker", job_worker.stats)
+
+
+def main():
+    """ワーカーを単独のプロセスとして実行する（APIサーバー側はJOB_WORKER_IN_PROCESS=falseにする）"""
+    # 全てのモデルを読み込み、テーブルの作成とマイグレーションを行う
+    from .. import main as _app  # noqa: F401
+
+    print(f"ジョブワーカーを開始しました（同時実行数: {job_worker.concurrency}）")
+    job_worker.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        job_worker.stop()
+        # 送信待ちの通知イベントを送ってから終了する
+        get_broker().stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import re
+from typing import Dict
+
+# ローカルで動く簡易的な感情分析（外部APIを使わない）
+# 日本語の感情語の辞書と、否定・強調の表現だけで5段階の評価を決める。
+# 形態素解析を使わず部分一致で探すため、語幹（活用しない部分）で登録する。
+
+# 感情語と重み（正: ポジティブ、負: ネガティブ）
+LEXICON: Dict[str, float] = {
+    # 強いポジティブ
+    "最高": 2, "幸せ": 2, "しあわせ": 2, "感動": 2, "大好き": 2, "嬉しすぎ": 2, "うれしすぎ": 2,
+    "夢みたい": 2, "夢のよう": 2, "大成功": 2, "合格": 2, "優勝": 2, "感激": 2,
+    "最っ高": 2, "神回": 2, "やったー": 2,
+    # ポジティブ
+    "楽し": 1, "たのし": 1, "嬉し": 1, "うれし": 1, "良かった": 1, "よかった": 1, "ワクワク": 1,
+    "わくわく": 1, "満足": 1, "充実": 1, "ありがと": 1, "感謝": 1, "素敵": 1, "すてき": 1,
+    "美味し": 1, "おいし": 1, "好き": 1, "面白": 1, "おもしろ": 1, "安心": 1, "気持ちい": 1,
+    "成功": 1, "達成": 1, "笑": 1, "喜": 1, "頑張った": 1, "がんばった": 1, "癒": 1, "ほっと": 1,
+    "ホッと": 1, "祝": 1, "できた": 0.5, "穏やか": 0.5, "のんびり": 0.5, "すっきり": 1, "スッキリ": 1,
+    "褒め": 1, "ほめられ": 1, "元気": 1, "晴れ晴れ": 1, "うまくいった": 1, "上手くいった": 1,
+    # ネガティブ
+    "悲し": -1, "かなし": -1, "つら": -1, "辛かった": -1, "辛い": -1, "疲れ": -1, "つかれ": -1,
+    "しんど": -1, "不安": -1, "心配": -1, "寂し": -1, "さみし": -1, "落ち込": -1, "嫌": -1,
+    "イライラ": -1, "いらいら": -1, "腹が立": -1, "失敗": -1, "泣": -1, "憂鬱": -1, "ゆううつ": -1,
+    "だる": -1, "苦し": -1, "痛": -1, "ミス": -1, "後悔": -1, "怖": -1, "こわかった": -1,
+    "残念": -1, "寝不足": -1, "風邪": -1, "怒": -1, "ショック": -1, "がっかり": -1, "面倒": -1,
+    "めんどう": -1, "憂う": -1, "凹": -1, "へこ": -1, "ストレス": -1, "焦": -1, "うまくいかな": -1,
+    "上手くいかな": -1, "落ちた": -1, "中止": -1, "怒られ": -1, "孤独": -1, "退屈": -0.5, "眠い": -0.5,
+    "ばよかった": -1, "ければよかった": -1,  # 「〜すればよかった」は後悔
+    # 強いネガティブ
+    "最悪": -2, "絶望": -3, "死にたい": -3, "消えたい": -3, "号泣": -2, "ムカつ": -2, "むかつ": -2,
+    "許せな": -2, "大嫌い": -2, "もう無理": -2, "もうむり": -2, "耐えられな": -2, "限界": -2,
+    "ひどい": -2, "酷い": -2, "散々": -2, "涙が止まらな": -3, "何もしたくな": -2,
+}
+
+# 感情語の直後にあると意味が反転する表現（「楽しくなかった」「不安はない」など）
+NEGATIONS = ("くなかった", "くない", "なかった", "ない", "ません", "ず", "じゃない", "ではない")
+NEGATION_WINDOW = 5
+
+# 「〜しかない」は否定ではない
+NOT_NEGATION_PREFIXES = ("しか",)
+
+# 感情語の直前にあると重みを強める表現
+INTENSIFIERS = ("とても", "すごく", "すごい", "めっちゃ", "本当に", "ほんとに", "超", "かなり", "非常に", "最高に", "めちゃくちゃ")
+INTENSIFIER_WINDOW = 6
+INTENSIFIER_WEIGHT = 1.5
+
+# 感情語の直前にあると重みを弱める表現
+DIMINISHERS = ("ちょっと", "少し", "すこし", "やや", "まあまあ", "なんとなく")
+DIMINISHER_WEIGHT = 0.5
+
+# スコアから評価への閾値
+VERY_HAPPY_THRESHOLD = 3
+HAPPY_THRESHOLD = 1
+UNHAPPY_THRESHOLD = -1
+VERY_UNHAPPY_THRESHOLD = -3
+
+# 長い語を優先して一致させる（「大好き」を「好き」より先に）
+_LEXICON_PATTERN = re.compile("|".join(re.escape(word) for word in sorted(LEXICON, key=len, reverse=True)))
+# 否定表現は語尾の「ない」が「はない」「もない」のように助詞を挟む場合も含める
+_NEGATION_PATTERN = re.compile(r"^[はもがでけど]?(?:" + "|".join(re.escape(n) for n in NEGATIONS) + ")")
+_INTENSIFIER_PATTERN = re.compile("|".join(re.escape(word) for word in INTENSIFIERS))
+_DIMINISHER_PATTERN = re.compile("|".join(re.escape(word) for word in DIMINISHERS))
+
+
+def _is_hiragana(char: str) -> bool:
+    return "\u3041" <= char <= "\u309f"
+
+
+def _is_negated(after: str) -> bool:
+    """感情語の直後（活用語尾の後）に否定表現があるかを調べる"""
+    # 活用語尾はひらがななので、漢字・カタカナ・句読点が出てきたら別の語とみなして探すのをやめる
+    for offset in range(min(3, len(after)) + 1):
+        if offset > 0 and not _is_hiragana(after[offset - 1]):
+            return False
+        if _NEGATION_PATTERN.match(after[offset:]):
+            return not after[:offset].endswith(NOT_NEGATION_PREFIXES)
+    return False
+
+
+def score_emotion(text: str) -> float:
+    """テキストの感情スコアを計算する（正ならポジティブ、負ならネガティブ）"""
+    score = 0.0
+    for match in _LEXICON_PATTERN.finditer(text):
+        weight = LEXICON[match.group(0)]
+        # 直後の数文字に否定表現があれば反転する（活用語尾の分だけ先を見る）
+        if _is_negated(text[match.end():match.end() + NEGATION_WINDOW]):
+            weight = -weight
+        # 直前に強調表現があれば重みを強め、控えめな表現があれば弱める
+        before = text[max(0, match.start() - INTENSIFIER_WINDOW):match.start()]
+        if _INTENSIFIER_PATTERN.search(before):
+            weight *= INTENSIFIER_WEIGHT
+        elif _DIMINISHER_PATTERN.search(before):
+            weight *= DIMINISHER_WEIGHT
+        score += weight
+    return score
+
+
+def classify_emotion_local(text: str) -> str:
+    """テキストを5段階の感情（analyze_emotion_from_diaryと同じ評価）に分類する"""
+    if not text:
+        return "normal"
+    score = score_emotion(text)
+    if score >= VERY_HAPPY_THRESHOLD:
+        return "very_happy"
+    if score >= HAPPY_THRESHOLD:
+        return "happy"
+    if score <= VERY_UNHAPPY_THRESHOLD:
+        return "very_unhappy"
+    if score <= UNHAPPY_THRESHOLD:
+        return "unhappy"
+    return "normal"
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Tuple
+from sqlalchemy.orm import Session
+from ..core.config import settings
+from ..crud.diary import get_user_diaries_by_period, save_diary_summaries
+from ..models.diary import Diary, to_naive_jst
+from .gemini_service import generate_monthly_feedback_from_summaries, summarize_diary
+
+
+def month_range(year: int, month: int) -> Tuple[datetime, datetime]:
+    """日本時間での指定された年月の開始と終了をUTCで返す（データベースのクエリに使う）"""
+    jst = timezone(timedelta(hours=9))
+    start_date = datetime(year, month, 1, tzinfo=jst)
+    if month == 12:
+        end_date = datetime(year + 1, 1, 1, tzinfo=jst)
+    else:
+        end_date = datetime(year, month + 1, 1, tzinfo=jst)
+    return start_date.astimezone(timezone.utc), end_date.astimezone(timezone.utc)
+
+
+def summarize_missing_diaries(db: Session, diaries: List[Diary]) -> List[str]:
+    """日記ごとの要約の一覧を返す（要約がまだの日記だけを要約して保存する）
+
+    感情分析のジョブで要約済みの日記や、前回の生成時に要約した日記はAPIを呼び出さない。
+    """
+    entries = {}
+    missing = {}
+    for diary in diaries:
+        emotion = f"（{diary.emotion_analysis}）" if diary.emotion_analysis else ""
+        entries[diary.id] = f"- {to_naive_jst(diary.created_at):%m/%d}{emotion}: "
+        if diary.summary is not None:
+            entries[diary.id] += diary.summary
+        else:
+            missing[diary.id] = diary.content
+
+    if missing:
+        # APIの応答を待つ間、読み込みのトランザクションを開いたままにしない
+        db.commit()
+        summaries = {}
+        for diary_id, content in missing.items():
+            summary = summarize_diary(content)
+            if summary is None:
+                # 失敗した日記は保存せず（次回の生成で要約し直す）、今回は先頭部分を使う
+                summary = (content or "").strip()[:settings.DIARY_SUMMARY_MIN_CHARS]
+            else:
+                summaries[diary_id] = summary
+            entries[diary_id] += summary
+        if summaries:
+            save_diary_summaries(db, summaries)
+
+    return list(entries.values())
+
+
+def build_monthly_feedback(db: Session, user_id: int, year: int, month: int, raise_on_error: bool = False) -> str:
+    """指定された年月の日記の要約から月ごとのフィードバックを生成する"""
+    start_date, end_date = month_range(year, month)
+    diaries = get_user_diaries_by_period(db, user_id, start_date, end_date)
+    summaries = summarize_missing_diaries(db, diaries)
+    return generate_monthly_feedback_from_summaries(summaries, year, month, raise_on_error)
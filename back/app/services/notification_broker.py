@@ -0,0 +1,247 @@
+import asyncio
+import json
+import queue
+import select
+import threading
+import time
+from typing import Dict, Set
+from sqlalchemy.engine import make_url
+from ..core.config import settings
+from ..core.database import DATABASE_URL
+from ..core.metrics import register_metrics
+
+
+class Subscription:
+    """1つの接続（WebSocket）に届けるイベントのキュー
+
+    イベントはJSONにエンコード済みの文字列で、接続のイベントループ上でキューに入れる。
+    """
+
+    def __init__(self, user_id: int, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+
+    async def get(self) -> str:
+        return await self.queue.get()
+
+
+class NotificationBroker:
+    """ユーザーごとの通知イベントを配信するpub/subのインターフェース
+
+    publishはコミット後にcrudの関数から呼ばれるため、どのスレッドからでも呼べて、
+    ブロックしないようにする。subscribe/unsubscribeはイベントループ上で呼ぶ。
+    イベントには未読件数などの最新の値を入れるため、受け取り側は途中のイベントが
+    抜けても最後のイベントだけで表示を合わせられる。
+    """
+
+    def publish(self, user_id: int, event: dict):
+        """ユーザーの全ての接続にイベントを送る"""
+        raise NotImplementedError
+
+    def subscribe(self, user_id: int) -> Subscription:
+        """ユーザー宛てのイベントを受け取るキューを登録する"""
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription: Subscription):
+        """キューの登録を解除する"""
+        raise NotImplementedError
+
+    def start(self):
+        """他のプロセスからのイベントの受信を開始する"""
+
+    def stop(self):
+        """受信を終了する"""
+
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+
+class MemoryBroker(NotificationBroker):
+    """同じプロセス内の接続にだけ配信するブローカー（1プロセスで動かす場合）
+
+    キューが一杯の接続（送信が追いつかない接続）は古いイベントから捨てる。
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self._subscriptions: Dict[int, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def publish(self, user_id: int, event: dict):
+        self._dispatch(user_id, _encode(event))
+
+    def _dispatch(self, user_id: int, message: str):
+        """このプロセスの接続にエンコード済みのイベントを配る"""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+            self.published += 1
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(self._deliver, subscription, message)
+            except RuntimeError:
+                # イベントループが終了している
+                continue
+
+    def _deliver(self, subscription: Subscription, message: str):
+        if subscription.queue.full():
+            subscription.queue.get_nowait()
+            self.dropped += 1
+        subscription.queue.put_nowait(message)
+        self.delivered += 1
+
+    def subscribe(self, user_id: int) -> Subscription:
+        subscription = Subscription(user_id, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is None:
+                return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.user_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "users": len(self._subscriptions),
+                "connections": sum(len(s) for s in self._subscriptions.values()),
+                "published": self.published,
+                "delivered": self.delivered,
+                "dropped": self.dropped,
+            }
+
+
+class PostgresBroker(MemoryBroker):
+    """PostgreSQLのLISTEN/NOTIFYで全てのプロセスの接続に配信するブローカー（複数ワーカーの場合）
+
+    publishしたイベントは送信用のスレッドがpg_notifyで送り、各プロセスの受信用のスレッドが
+    自分のプロセスの接続に配る（自分のプロセスの接続にもNOTIFY経由で届く）。
+    別プロセスのジョブワーカーは送信だけを行うため、start()を呼ばなくてよい。
+    """
+
+    CHANNEL = "notification_events"
+    RECONNECT_SEC = 1.0
+
+    def __init__(self, database_url: str, queue_size: int):
+        super().__init__(queue_size)
+        # psycopg2に渡せる形（ドライバ名なし）に変換する
+        self.dsn = make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+        self.notify_errors = 0
+        self._outbox = queue.Queue()
+        self._stopped = threading.Event()
+        self._sender = None
+        self._listener = None
+        self._start_lock = threading.Lock()
+
+    def publish(self, user_id: int, event: dict):
+        self._ensure_sender()
+        self._outbox.put(f"{user_id}:{_encode(event)}")
+
+    def _connect(self):
+        import psycopg2
+
+        conn = psycopg2.connect(self.dsn)
+        conn.autocommit = True
+        return conn
+
+    def _ensure_sender(self):
+        if self._sender is not None:
+            return
+        with self._start_lock:
+            if self._sender is None:
+                self._sender = threading.Thread(target=self._send_loop, name="notification-sender", daemon=True)
+                self._sender.start()
+
+    def _send_loop(self):
+        conn = None
+        while not self._stopped.is_set() or not self._outbox.empty():
+            try:
+                payload = self._outbox.get(timeout=self.RECONNECT_SEC)
+            except queue.Empty:
+                continue
+            try:
+                if conn is None:
+                    conn = self._connect()
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT pg_notify(%s, %s)", (self.CHANNEL, payload))
+            except Exception as e:
+                # 通知はリアルタイム表示のためのもので、DBには保存済みなので再送しない
+                self.notify_errors += 1
+                print(f"通知イベントの送信に失敗しました: {e}")
+                if conn is not None:
+                    conn.close()
+                    conn = None
+        if conn is not None:
+            conn.close()
+
+    def start(self):
+        with self._start_lock:
+            if self._listener is None:
+                self._stopped.clear()
+                self._listener = threading.Thread(target=self._listen_loop, name="notification-listener", daemon=True)
+                self._listener.start()
+
+    def _listen_loop(self):
+        while not self._stopped.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.CHANNEL}")
+                while not self._stopped.is_set():
+                    if select.select([conn], [], [], self.RECONNECT_SEC) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        user_id, _, message = notify.payload.partition(":")
+                        self._dispatch(int(user_id), message)
+            except Exception as e:
+                print(f"通知イベントの受信に失敗しました（再接続します）: {e}")
+                time.sleep(self.RECONNECT_SEC)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def stop(self):
+        self._stopped.set()
+        for thread in (self._listener, self._sender):
+            if thread is not None:
+                thread.join()
+        self._listener = None
+        self._sender = None
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats.update(backend="postgres", outbox=self._outbox.qsize(), notify_errors=self.notify_errors)
+        return stats
+
+
+def _encode(event: dict) -> str:
+    return json.dumps(event, ensure_ascii=False, default=str)
+
+
+def _create_broker() -> NotificationBroker:
+    if settings.NOTIFICATION_BROKER == "memory":
+        return MemoryBroker(settings.NOTIFICATION_QUEUE_SIZE)
+    if settings.NOTIFICATION_BROKER == "postgres":
+        return PostgresBroker(DATABASE_URL, settings.NOTIFICATION_QUEUE_SIZE)
+    raise ValueError(f"Unknown NOTIFICATION_BROKER: {settings.NOTIFICATION_BROKER}")
+
+
+broker = _create_broker()
+register_metrics("notification_broker", broker.stats)
+
+
+def get_broker() -> NotificationBroker:
+    """設定された通知のブローカーを返す"""
+    return broker
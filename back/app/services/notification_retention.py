@@ -0,0 +1,211 @@
+"""
+保存期間を過ぎた既読の通知を整理するコマンド
+
+作成（まとめた通知では最後にまとめた時刻）からNOTIFICATION_RETENTION_DAYS日を過ぎた既読の通知を、
+NOTIFICATION_RETENTION_BATCH_SIZE件ずつの短いトランザクションで削除する
+（NOTIFICATION_RETENTION_MODE=archiveの場合は保管用のテーブルへ移す）。
+保管用のテーブルはNOTIFICATION_ARCHIVE_RETENTION_MONTHSを過ぎた分を削除し、
+PostgreSQLで月ごとのパーティションに分けている場合はパーティションごと削除する。
+未読の通知は期間を過ぎても残す。
+
+cronなどから定期的に実行するか、--intervalを指定して常駐させる。
+
+使い方（backディレクトリで実行）:
+    python -m app.services.notification_retention
+    python -m app.services.notification_retention --dry-run
+    python -m app.services.notification_retention --interval 3600
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, Optional, Tuple
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.engine import Connection, Engine
+from ..core.config import settings
+from ..core.database import engine as default_engine
+from ..models.friend import Notification, NotificationActor, NotificationArchive
+
+# 保管用のテーブルへ移す列
+ARCHIVE_COLUMNS = ["id", "created_at", "user_id", "message", "type", "related_id", "actor_count", "last_actor_id"]
+
+
+def _month_start(year: int, month: int) -> datetime:
+    return datetime(year, month, 1)
+
+
+def _next_month(year: int, month: int) -> Tuple[int, int]:
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _months_ago(now: datetime, months: int) -> datetime:
+    """nowの月からmonths か月前の月初"""
+    index = now.year * 12 + (now.month - 1) - months
+    return _month_start(index // 12, index % 12 + 1)
+
+
+def _is_partitioned(engine: Engine) -> bool:
+    return settings.NOTIFICATION_ARCHIVE_PARTITIONED and engine.dialect.name == "postgresql"
+
+
+def _partition_name(year: int, month: int) -> str:
+    return f"{NotificationArchive.__tablename__}_{year:04d}{month:02d}"
+
+
+def ensure_archive_partitions(conn: Connection, months: Iterable[Tuple[int, int]]):
+    """保管用のテーブルに指定した月のパーティションが無ければ作成する（PostgreSQLのみ）"""
+    for year, month in sorted(set(months)):
+        start = _month_start(year, month)
+        end = _month_start(*_next_month(year, month))
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {_partition_name(year, month)} "
+            f"PARTITION OF {NotificationArchive.__tablename__} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        ))
+
+
+def purge_read_notifications(engine: Engine, cutoff: datetime, mode: str, batch_size: int,
+                             pause_sec: float = 0, dry_run: bool = False) -> int:
+    """cutoffより古い既読の通知を削除（または保管用のテーブルへ移動）し、件数を返す"""
+    if mode not in ("delete", "archive"):
+        raise ValueError(f"Unknown NOTIFICATION_RETENTION_MODE: {mode}")
+    notifications = Notification.__table__
+    actors = NotificationActor.__table__
+    archive = NotificationArchive.__table__
+    partitioned = _is_partitioned(engine)
+
+    purged = 0
+    last_id = 0
+    while True:
+        # 1バッチごとにコミットし、ロックを長く持たない
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(notifications.c.id, notifications.c.created_at)
+                .where(
+                    notifications.c.is_read.is_(True),
+                    func.coalesce(notifications.c.updated_at, notifications.c.created_at) < cutoff,
+                    notifications.c.id > last_id,
+                )
+                .order_by(notifications.c.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            purged += len(rows)
+            if dry_run:
+                continue
+
+            ids = [row.id for row in rows]
+            if mode == "archive":
+                if partitioned:
+                    ensure_archive_partitions(conn, ((row.created_at.year, row.created_at.month) for row in rows))
+                conn.execute(archive.insert().from_select(
+                    ARCHIVE_COLUMNS,
+                    select(*(notifications.c[column] for column in ARCHIVE_COLUMNS)).where(notifications.c.id.in_(ids)),
+                ))
+            conn.execute(delete(actors).where(actors.c.notification_id.in_(ids)))
+            conn.execute(delete(notifications).where(notifications.c.id.in_(ids)))
+        if pause_sec:
+            time.sleep(pause_sec)
+    return purged
+
+
+def drop_archive_partitions(engine: Engine, before: datetime, dry_run: bool = False) -> int:
+    """beforeより前の月のパーティションを削除し、削除したパーティション数を返す（PostgreSQLのみ）"""
+    prefix = NotificationArchive.__tablename__ + "_"
+    with engine.connect() as conn:
+        names = conn.execute(text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "WHERE parent.relname = :parent"
+        ), {"parent": NotificationArchive.__tablename__}).scalars().all()
+
+    dropped = 0
+    for name in sorted(names):
+        suffix = name[len(prefix):]
+        if not name.startswith(prefix) or len(suffix) != 6 or not suffix.isdigit():
+            continue
+        if _month_start(*_next_month(int(suffix[:4]), int(suffix[4:]))) > before:
+            continue
+        if not dry_run:
+            # 行を1件ずつ削除せず、ファイルごと削除する
+            with engine.begin() as conn:
+                conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+        dropped += 1
+    return dropped
+
+
+def purge_archive(engine: Engine, before: datetime, batch_size: int,
+                  pause_sec: float = 0, dry_run: bool = False) -> int:
+    """保管用のテーブルからbeforeより古い行をバッチごとに削除し、件数を返す（パーティションに分けていない場合）"""
+    archive = NotificationArchive.__table__
+    purged = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            ids = conn.execute(
+                select(archive.c.id)
+                .where(archive.c.created_at < before, archive.c.id > last_id)
+                .order_by(archive.c.id)
+                .limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            last_id = ids[-1]
+            purged += len(ids)
+            if not dry_run:
+                conn.execute(delete(archive).where(archive.c.id.in_(ids), archive.c.created_at < before))
+        if pause_sec:
+            time.sleep(pause_sec)
+    return purged
+
+
+def run_retention(engine: Engine = default_engine, now: Optional[datetime] = None, dry_run: bool = False) -> dict:
+    """設定に従って通知と保管用のテーブルを整理し、処理した件数を返す"""
+    now = now or datetime.utcnow()
+    result = {
+        "notifications": purge_read_notifications(
+            engine,
+            now - timedelta(days=settings.NOTIFICATION_RETENTION_DAYS),
+            settings.NOTIFICATION_RETENTION_MODE,
+            settings.NOTIFICATION_RETENTION_BATCH_SIZE,
+            settings.NOTIFICATION_RETENTION_PAUSE_SEC,
+            dry_run,
+        ),
+    }
+    if settings.NOTIFICATION_RETENTION_MODE == "archive" and settings.NOTIFICATION_ARCHIVE_RETENTION_MONTHS > 0:
+        before = _months_ago(now, settings.NOTIFICATION_ARCHIVE_RETENTION_MONTHS)
+        if _is_partitioned(engine):
+            result["archive_partitions"] = drop_archive_partitions(engine, before, dry_run)
+        else:
+            result["archive_rows"] = purge_archive(
+                engine, before, settings.NOTIFICATION_RETENTION_BATCH_SIZE,
+                settings.NOTIFICATION_RETENTION_PAUSE_SEC, dry_run,
+            )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="対象の件数だけを表示する")
+    parser.add_argument("--interval", type=float, default=0, help="指定するとこの秒数ごとに繰り返す（0なら1回だけ実行する）")
+    args = parser.parse_args()
+
+    # 全てのモデルを読み込み、テーブルの作成とマイグレーションを行う
+    from .. import main as _app  # noqa: F401
+
+    try:
+        while True:
+            result = run_retention(dry_run=args.dry_run)
+            label = "対象" if args.dry_run else "整理しました"
+            print(f"{label}: " + ", ".join(f"{name}={count}" for name, count in result.items()))
+            if not args.interval:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
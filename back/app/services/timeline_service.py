@@ -0,0 +1,362 @@
+import argparse
+import bisect
+import threading
+import time
+from collections import namedtuple
+from typing import Dict, List, Optional
+from sqlalchemy import func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, joinedload
+from ..core.config import settings
+from ..core.database import engine as default_engine
+from ..models.diary import Diary, now_jst
+from ..models.timeline import TimelineEntry
+from ..utils.pagination import paginate, decode_cursor, encode_cursor
+
+# タイムラインに保存する1件分の情報
+Entry = namedtuple("Entry", ["created_at", "diary_id", "author_id", "view_end_at"])
+
+
+def _entry_from_diary(diary: Diary) -> Entry:
+    return Entry(diary.created_at, diary.id, diary.user_id, diary.view_end_at)
+
+
+def _viewable_diaries(db: Session, author_ids: List[int], limit: Optional[int] = None):
+    """指定したユーザーの公開中の日記を新しい順に取得する"""
+    if not author_ids:
+        return []
+    query = db.query(Diary).filter(
+        Diary.user_id.in_(author_ids),
+        Diary.view_end_at >= now_jst()
+    ).order_by(Diary.created_at.desc(), Diary.id.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+class TimelineBackend:
+    """フレンドタイムラインの保存先のインターフェース
+
+    日記の作成時にフレンド全員のタイムラインへ書き込み（fan-out on write）、
+    フィードの表示はタイムラインの範囲読み込みだけで済ませる。
+    DBへの書き込みはセッションに追加するだけで、コミットは呼び出し側で行う。
+    """
+
+    def push(self, db: Session, diary: Diary, user_ids: List[int]):
+        """新しい日記をフレンドのタイムラインに追加する"""
+        raise NotImplementedError
+
+    def backfill(self, db: Session, user_id: int, author_id: int):
+        """フレンドになった相手の公開中の日記をタイムラインに追加する"""
+        raise NotImplementedError
+
+    def remove_diary(self, db: Session, diary_id: int):
+        """削除された日記を全てのタイムラインから削除する"""
+        raise NotImplementedError
+
+    def remove_user(self, db: Session, user_id: int):
+        """削除されたユーザーのタイムラインと、そのユーザーの日記を削除する"""
+        raise NotImplementedError
+
+    def purge_expired(self, db: Session, limit: Optional[int] = None) -> int:
+        """公開期限が切れた日記をタイムラインから削除し、削除した件数を返す
+
+        limitを指定すると、その件数の日記の分だけ削除する（バッチごとにコミットする場合）。
+        """
+        raise NotImplementedError
+
+    def read(self, db: Session, user_id: int, cursor: Optional[str] = None, limit: int = 20):
+        """タイムラインの公開中の日記を新しい順に取得し、(items, next_cursor) を返す"""
+        raise NotImplementedError
+
+
+class DatabaseTimelineBackend(TimelineBackend):
+    """timeline_entriesテーブルに保存するバックエンド"""
+
+    def push(self, db: Session, diary: Diary, user_ids: List[int]):
+        if not user_ids:
+            return
+        # 書き込み先のタイムラインから期限切れの日記を削除する
+        db.query(TimelineEntry).filter(
+            TimelineEntry.user_id.in_(user_ids),
+            TimelineEntry.view_end_at < now_jst()
+        ).delete(synchronize_session=False)
+        db.add_all([
+            TimelineEntry(
+                user_id=user_id,
+                diary_id=diary.id,
+                author_id=diary.user_id,
+                created_at=diary.created_at,
+                view_end_at=diary.view_end_at,
+            )
+            for user_id in user_ids
+        ])
+
+    def backfill(self, db: Session, user_id: int, author_id: int):
+        existing = {
+            diary_id for (diary_id,) in db.query(TimelineEntry.diary_id).filter(
+                TimelineEntry.user_id == user_id,
+                TimelineEntry.author_id == author_id
+            )
+        }
+        db.add_all([
+            TimelineEntry(
+                user_id=user_id,
+                diary_id=diary.id,
+                author_id=diary.user_id,
+                created_at=diary.created_at,
+                view_end_at=diary.view_end_at,
+            )
+            for diary in _viewable_diaries(db, [author_id])
+            if diary.id not in existing
+        ])
+
+    def remove_diary(self, db: Session, diary_id: int):
+        db.query(TimelineEntry).filter(
+            TimelineEntry.diary_id == diary_id
+        ).delete(synchronize_session=False)
+
+    def remove_user(self, db: Session, user_id: int):
+        db.query(TimelineEntry).filter(
+            (TimelineEntry.user_id == user_id) | (TimelineEntry.author_id == user_id)
+        ).delete(synchronize_session=False)
+
+    def purge_expired(self, db: Session, limit: Optional[int] = None) -> int:
+        now = now_jst()
+        expired = db.query(TimelineEntry).filter(TimelineEntry.view_end_at < now)
+        if limit is not None:
+            diary_ids = [
+                diary_id for (diary_id,) in db.query(TimelineEntry.diary_id).filter(
+                    TimelineEntry.view_end_at < now
+                ).distinct().order_by(TimelineEntry.diary_id).limit(limit)
+            ]
+            if not diary_ids:
+                return 0
+            expired = expired.filter(TimelineEntry.diary_id.in_(diary_ids))
+        return expired.delete(synchronize_session=False)
+
+    def read(self, db: Session, user_id: int, cursor: Optional[str] = None, limit: int = 20):
+        from ..crud.diary import with_liked
+
+        query = db.query(Diary).options(joinedload(Diary.user)).join(
+            TimelineEntry, TimelineEntry.diary_id == Diary.id
+        ).filter(
+            TimelineEntry.user_id == user_id,
+            TimelineEntry.view_end_at >= now_jst()
+        )
+        return paginate(
+            db, with_liked(query, user_id), Diary, cursor, limit,
+            created_at_column=TimelineEntry.created_at,
+            id_column=TimelineEntry.diary_id,
+        )
+
+
+class MemoryTimelineBackend(TimelineBackend):
+    """プロセス内のメモリに保存するバックエンド
+
+    ユーザーごとに最大max_entries件を (created_at, diary_id) の昇順で保持し、
+    上限を超えたら古いものから捨てる。プロセス再起動後は最初の読み込み時にDBから作り直す。
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._timelines: Dict[int, List[Entry]] = {}
+        # 読み込み中のタイムラインごとに、読み込みの間に追加された日記を記録する
+        self._loading: Dict[int, List[List[Entry]]] = {}
+        self._lock = threading.Lock()
+
+    def _insert(self, user_id: int, entry: Entry):
+        timeline = self._timelines.get(user_id)
+        if timeline is None:
+            # 読み込み中のタイムラインには、読み込みが終わった時に追加する
+            for pending in self._loading.get(user_id, ()):
+                pending.append(entry)
+            # まだ読み込まれていないタイムラインは、読み込み時にDBから作り直す
+            return
+        if any(e.diary_id == entry.diary_id for e in timeline):
+            return
+        bisect.insort(timeline, entry)
+        if len(timeline) > self.max_entries:
+            del timeline[:len(timeline) - self.max_entries]
+
+    def _drop_expired(self, timeline: List[Entry]):
+        now = now_jst()
+        timeline[:] = [e for e in timeline if e.view_end_at is not None and e.view_end_at >= now]
+
+    def _load(self, db: Session, user_id: int) -> List[Entry]:
+        """タイムラインをDBから作り直す"""
+        from ..crud.friend import load_friend_ids
+
+        # 読み込んだタイムラインは以後pushで更新するため、フレンドはキャッシュを通さずに読む
+        diaries = _viewable_diaries(db, load_friend_ids(db, user_id), limit=self.max_entries)
+        return sorted(_entry_from_diary(diary) for diary in diaries)
+
+    def _load_timeline(self, db: Session, user_id: int):
+        """タイムラインをDBから読み込んで保持する
+
+        DBの読み込みはロックの外で行う。その間にpushされた日記（まだコミットされていないものなど）は
+        読み込んだ内容に含まれないことがあるため、記録しておいた分を保持する時に追加する。
+        """
+        pending: List[Entry] = []
+        with self._lock:
+            self._loading.setdefault(user_id, []).append(pending)
+        entries = None
+        try:
+            entries = self._load(db, user_id)
+        finally:
+            with self._lock:
+                loading = [p for p in self._loading[user_id] if p is not pending]
+                if loading:
+                    self._loading[user_id] = loading
+                else:
+                    del self._loading[user_id]
+                # 同時に読み込んだ他のリクエストが先に保持した場合は、そちらを使う
+                if entries is not None and user_id not in self._timelines:
+                    self._timelines[user_id] = entries
+                    for entry in pending:
+                        self._insert(user_id, entry)
+
+    def push(self, db: Session, diary: Diary, user_ids: List[int]):
+        entry = _entry_from_diary(diary)
+        with self._lock:
+            for user_id in user_ids:
+                timeline = self._timelines.get(user_id)
+                if timeline is not None:
+                    self._drop_expired(timeline)
+                self._insert(user_id, entry)
+
+    def backfill(self, db: Session, user_id: int, author_id: int):
+        with self._lock:
+            if user_id not in self._timelines and user_id not in self._loading:
+                return
+        diaries = _viewable_diaries(db, [author_id], limit=self.max_entries)
+        with self._lock:
+            for diary in diaries:
+                self._insert(user_id, _entry_from_diary(diary))
+
+    def remove_diary(self, db: Session, diary_id: int):
+        with self._lock:
+            for timeline in self._timelines.values():
+                timeline[:] = [e for e in timeline if e.diary_id != diary_id]
+
+    def remove_user(self, db: Session, user_id: int):
+        with self._lock:
+            self._timelines.pop(user_id, None)
+            for timeline in self._timelines.values():
+                timeline[:] = [e for e in timeline if e.author_id != user_id]
+
+    def purge_expired(self, db: Session, limit: Optional[int] = None) -> int:
+        purged = 0
+        with self._lock:
+            for timeline in self._timelines.values():
+                size = len(timeline)
+                self._drop_expired(timeline)
+                purged += size - len(timeline)
+        return purged
+
+    def read(self, db: Session, user_id: int, cursor: Optional[str] = None, limit: int = 20):
+        from ..crud.diary import with_liked
+
+        if user_id not in self._timelines:
+            self._load_timeline(db, user_id)
+
+        with self._lock:
+            timeline = self._timelines[user_id]
+            self._drop_expired(timeline)
+            # カーソルより古いものを新しい順に取り出す
+            end = len(timeline)
+            if cursor:
+                created_at, diary_id = decode_cursor(cursor)
+                end = bisect.bisect_left(timeline, (created_at, diary_id))
+            page = timeline[max(0, end - limit - 1):end][::-1]
+
+        diary_ids = [e.diary_id for e in page]
+        diaries = {
+            diary.id: diary
+            for diary in with_liked(
+                db.query(Diary).options(joinedload(Diary.user)).filter(Diary.id.in_(diary_ids)), user_id
+            )
+        } if diary_ids else {}
+        items = [diaries[e.diary_id] for e in page if e.diary_id in diaries]
+
+        next_cursor = None
+        if len(page) > limit:
+            items = items[:limit]
+            last = page[limit - 1]
+            next_cursor = encode_cursor(last.created_at, last.diary_id)
+        return items, next_cursor
+
+
+def _create_backend() -> TimelineBackend:
+    if settings.TIMELINE_BACKEND == "memory":
+        return MemoryTimelineBackend(settings.TIMELINE_MAX_ENTRIES_PER_USER)
+    if settings.TIMELINE_BACKEND == "database":
+        return DatabaseTimelineBackend()
+    raise ValueError(f"Unknown TIMELINE_BACKEND: {settings.TIMELINE_BACKEND}")
+
+
+timeline = _create_backend()
+
+
+def get_timeline() -> TimelineBackend:
+    """設定されたタイムラインのバックエンドを返す"""
+    return timeline
+
+
+def purge_expired_timeline(engine: Engine = default_engine, batch_size: Optional[int] = None,
+                           pause_sec: Optional[float] = None, dry_run: bool = False) -> int:
+    """公開期限が切れた日記をタイムラインからバッチごとに削除し、削除した件数を返す
+
+    日記の投稿時には投稿先のタイムラインしか整理しないため、投稿の少ないユーザーの分はここで削除する。
+    1バッチごとにコミットし、ロックを長く持たない。
+    """
+    batch_size = batch_size or settings.TIMELINE_PURGE_BATCH_SIZE
+    pause_sec = settings.TIMELINE_PURGE_PAUSE_SEC if pause_sec is None else pause_sec
+    if dry_run:
+        with engine.connect() as conn:
+            return conn.execute(
+                select(func.count()).select_from(TimelineEntry).where(TimelineEntry.view_end_at < now_jst())
+            ).scalar()
+
+    purged = 0
+    while True:
+        with Session(engine) as db, db.begin():
+            count = timeline.purge_expired(db, batch_size)
+        if not count:
+            break
+        purged += count
+        if pause_sec:
+            time.sleep(pause_sec)
+    return purged
+
+
+def main():
+    """公開期限が切れた日記をtimeline_entriesから削除する（cronなどから定期的に実行するか、--intervalで常駐させる）
+
+    使い方（backディレクトリで実行）:
+        python -m app.services.timeline_service
+        python -m app.services.timeline_service --dry-run
+        python -m app.services.timeline_service --interval 3600
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="対象の件数だけを表示する")
+    parser.add_argument("--interval", type=float, default=0, help="指定するとこの秒数ごとに繰り返す（0なら1回だけ実行する）")
+    args = parser.parse_args()
+
+    # 全てのモデルを読み込み、テーブルの作成とマイグレーションを行う
+    from .. import main as _app  # noqa: F401
+
+    try:
+        while True:
+            count = purge_expired_timeline(dry_run=args.dry_run)
+            label = "対象" if args.dry_run else "整理しました"
+            print(f"{label}: timeline_entries={count}")
+            if not args.interval:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
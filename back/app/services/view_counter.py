@@ -0,0 +1,117 @@
+import threading
+from collections import Counter
+from sqlalchemy import text
+from ..core.config import settings
+from ..core.database import SessionLocal
+from ..core.metrics import register_metrics
+
+
+class ViewCounter:
+    """日記の閲覧回数をまとめて書き込むバッファ（write-behind）
+
+    閲覧のたびにUPDATEとCOMMITを行う代わりに、日記IDごとの増分をメモリに貯め、
+    一定間隔または一定件数に達したときにまとめてDBへ反映する。
+    """
+
+    def __init__(self, flush_interval: float, flush_threshold: int):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.flush_count = 0
+        self.flushed_views = 0
+        self._pending = Counter()
+        self._inflight = Counter()  # 書き込み中の増分（コミットされるまで読み取り時に加算する）
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def increment(self, diary_id: int, count: int = 1):
+        """閲覧回数の増分を記録する"""
+        with self._lock:
+            self._pending[diary_id] += count
+            total = sum(self._pending.values())
+        if total >= self.flush_threshold:
+            self._wakeup.set()
+
+    def pending(self, diary_id: int) -> int:
+        """まだDBに反映されていない増分を返す"""
+        with self._lock:
+            return self._pending.get(diary_id, 0) + self._inflight.get(diary_id, 0)
+
+    def flush(self):
+        """貯まった増分をまとめてDBに書き込む"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                batch = self._pending
+                self._pending = Counter()
+                self._inflight = batch
+
+            db = SessionLocal()
+            try:
+                db.execute(
+                    text("UPDATE diaries SET view_count = COALESCE(view_count, 0) + :delta WHERE id = :id"),
+                    [{"id": diary_id, "delta": delta} for diary_id, delta in batch.items()],
+                )
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                print(f"閲覧回数の書き込みに失敗しました: {e}")
+                # 失敗した増分は次回に持ち越す
+                with self._lock:
+                    self._pending.update(batch)
+                    self._inflight = Counter()
+                return
+            finally:
+                db.close()
+
+            with self._lock:
+                self._inflight = Counter()
+                self.flush_count += 1
+                self.flushed_views += sum(batch.values())
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def start(self):
+        """定期的に書き込むバックグラウンドスレッドを開始する"""
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="view-counter", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """バックグラウンドスレッドを止め、残りの増分を書き込む"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending_diaries": len(self._pending),
+                "pending_views": sum(self._pending.values()),
+                "flushes": self.flush_count,
+                "flushed_views": self.flushed_views,
+            }
+
+
+view_counter = ViewCounter(
+    flush_interval=settings.VIEW_COUNT_FLUSH_INTERVAL_SEC,
+    flush_threshold=settings.VIEW_COUNT_FLUSH_THRESHOLD,
+)
+register_metrics("view_counter", view_counter.stats)
+
+
+def pending_views(diary_id: int) -> int:
+    """まだDBに反映されていない閲覧回数を返す"""
+    return view_counter.pending(diary_id)
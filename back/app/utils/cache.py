@@ -0,0 +1,65 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """有効期限付きのLRUキャッシュ（スレッドセーフ）
+
+    最大件数を超えると最も古く使われたものから削除し、
+    ttl秒を過ぎたものは取得時に期限切れとして扱う。
+    """
+
+    _MISSING = object()
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """キャッシュから値を取得する（無いか期限切れならdefault）"""
+        with self._lock:
+            item = self._data.get(key, self._MISSING)
+            if item is not self._MISSING:
+                value, expires_at = item
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """キャッシュに値を保存する"""
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """キャッシュから値を削除する"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """キャッシュを全て削除する"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        """ヒット・ミスの統計を返す"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,73 @@
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    """サーキットブレーカーが開いているため呼び出しを行わなかった"""
+
+
+class CircuitBreaker:
+    """連続した失敗が続いたら一定時間呼び出しを止めるサーキットブレーカー（スレッドセーフ）
+
+    closed: 通常どおり呼び出す。failure_threshold回連続で失敗するとopenになる
+    open: reset_timeout秒の間は呼び出さずにCircuitOpenErrorを送出する
+    half_open: reset_timeout秒が過ぎたら1件だけ試しに呼び出し、成功すればclosed、失敗すれば再びopenになる
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.rejected = 0
+        self.opened = 0
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """呼び出してよいかを確認する（呼び出せない場合はCircuitOpenErrorを送出する）"""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return
+            self.rejected += 1
+            raise CircuitOpenError("upstream is unavailable (circuit open)")
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opened += 1
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+    def record_skipped(self):
+        """呼び出しを行わなかった（成功とも失敗とも数えない）"""
+        with self._lock:
+            self._trial_running = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self._failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,51 @@
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Query, Session
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    """(created_at, id) から不透明なカーソル文字列を作成する"""
+    raw = f"{created_at.isoformat()}|{id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """カーソル文字列を (created_at, id) に戻す（不正な場合はValueError）"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        created_at, id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def paginate(db: Session, query: Query, model, cursor: Optional[str], limit: int,
+             created_at_column=None, id_column=None):
+    """(created_at, id) の降順でキーセットページネーションを行い、(items, next_cursor) を返す
+
+    並び替えに使う列はデフォルトでmodelのcreated_atとidだが、
+    結合先のテーブルの列（タイムラインなど）で並べる場合は明示的に指定する
+    """
+    created_at_column = created_at_column if created_at_column is not None else model.created_at
+    id_column = id_column if id_column is not None else model.id
+
+    if cursor:
+        created_at, id = decode_cursor(cursor)
+        query = query.filter(
+            or_(
+                created_at_column < created_at,
+                and_(created_at_column == created_at, id_column < id),
+            )
+        )
+
+    # 次のページがあるかを判定するため1件多く取得する
+    items = query.order_by(created_at_column.desc(), id_column.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1].created_at, items[-1].id)
+    return items, next_cursor
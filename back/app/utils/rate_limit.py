@@ -0,0 +1,68 @@
+import threading
+import time
+
+
+class RateLimitExceeded(Exception):
+    """待ち時間の上限内にトークンを取得できなかった、または待ち行列がいっぱいだった"""
+
+
+class TokenBucket:
+    """トークンバケット方式のレートリミッタ（スレッドセーフ）
+
+    1分あたりrate_per_min個のトークンが補充され、最大でburst個まで貯まる。
+    トークンが無い場合は補充されるまで待ち、timeout秒を過ぎるか
+    待っている呼び出しがmax_waiters件を超える場合はRateLimitExceededを送出する。
+    """
+
+    def __init__(self, rate_per_min: float, burst: int, max_waiters: int):
+        self.rate = rate_per_min / 60.0
+        self.capacity = burst
+        self.max_waiters = max_waiters
+        self.acquired = 0
+        self.rejected = 0
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._waiters = 0
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout: float):
+        """トークンを1つ取得する（取得できるまで最大timeout秒待つ）"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._refill()
+            if self._tokens < 1 and self._waiters >= self.max_waiters:
+                self.rejected += 1
+                raise RateLimitExceeded("rate limit queue is full")
+            self._waiters += 1
+            try:
+                while True:
+                    self._refill()
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        self.acquired += 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or wait > remaining:
+                        self.rejected += 1
+                        raise RateLimitExceeded(f"no token available within {timeout}s")
+                    self._cond.wait(wait)
+            finally:
+                self._waiters -= 1
+                # 次に待っている呼び出しに補充の確認を任せる
+                self._cond.notify()
+
+    def stats(self) -> dict:
+        with self._cond:
+            self._refill()
+            return {
+                "tokens": round(self._tokens, 2),
+                "queue_depth": self._waiters,
+                "acquired": self.acquired,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,10 @@
+import json
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Server-Sent Eventsの1件のイベントの文字列を作る"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# 接続を保つためのコメント（クライアントはイベントとして扱わない）
+SSE_KEEPALIVE = ": keep-alive\n\n"
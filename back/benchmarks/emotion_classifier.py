@@ -0,0 +1,83 @@
+"""
+感情分析の精度と速度のベンチマーク
+
+ラベル付きのサンプル（benchmarks/data/emotion_samples.jsonl）で、ローカルの辞書による分類の
+正解率・1段階以内の正解率・評価ごとの混同と、1件あたりの処理時間を計測する。
+--remote を指定するとGemini APIでも同じ計測を行う（GEMINI_API_KEYが必要）。
+
+使い方（backディレクトリで実行）:
+    python -m benchmarks.emotion_classifier
+    python -m benchmarks.emotion_classifier --remote
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from collections import Counter
+
+from .login_burst import percentile
+
+SAMPLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "emotion_samples.jsonl")
+LABELS = ["very_happy", "happy", "normal", "unhappy", "very_unhappy"]
+
+
+def load_samples(path: str):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(name: str, classify, samples, repeat: int):
+    latencies = []
+    predictions = []
+    for sample in samples:
+        for i in range(repeat):
+            start = time.perf_counter()
+            label = classify(sample["text"])
+            latencies.append(time.perf_counter() - start)
+        predictions.append(label)
+
+    correct = sum(p == s["label"] for p, s in zip(predictions, samples))
+    # 1段階のずれまでを正解とみなした場合
+    near = sum(abs(LABELS.index(p) - LABELS.index(s["label"])) <= 1 for p, s in zip(predictions, samples))
+    print(f"{name}: accuracy={correct / len(samples):.1%} within-one={near / len(samples):.1%} "
+          f"(n={len(samples)})")
+    print(f"  latency: mean={statistics.mean(latencies) * 1e6:.1f}us "
+          f"p50={statistics.median(latencies) * 1e6:.1f}us "
+          f"p99={percentile(latencies, 99) * 1e6:.1f}us")
+
+    confusion = Counter((s["label"], p) for p, s in zip(predictions, samples))
+    print("  confusion (rows=expected, cols=predicted):")
+    print("  " + " " * 13 + "".join(f"{label[:12]:>13}" for label in LABELS))
+    for expected in LABELS:
+        print(f"  {expected:>13}" + "".join(f"{confusion[(expected, predicted)]:>13}" for predicted in LABELS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", default=SAMPLES_PATH)
+    parser.add_argument("--repeat", type=int, default=100, help="ローカルの分類で1件あたり繰り返す回数")
+    parser.add_argument("--remote", action="store_true", help="Gemini APIでも計測する")
+    args = parser.parse_args()
+
+    samples = load_samples(args.samples)
+
+    from app.services.local_emotion import classify_emotion_local
+    evaluate("local", classify_emotion_local, samples, args.repeat)
+
+    if args.remote:
+        # キャッシュとローカルへのフォールバックを使わず、APIの結果だけを計測する
+        os.environ["EMOTION_ANALYZER_MODE"] = "remote"
+        os.environ["GEMINI_CACHE_PATH"] = ""
+        from app.services import gemini_service
+        gemini_service.response_cache.clear()
+
+        def classify_remote(text):
+            gemini_service.response_cache.clear()
+            return gemini_service.analyze_emotion_from_diary(text, raise_on_error=True)
+
+        evaluate("remote", classify_remote, samples, 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+フィード・公開一覧のスループットのベンチマーク
+
+非同期ドライバ（ASYNC_DATABASE=true）と、同期セッションをスレッドプールで実行する場合
+（ASYNC_DATABASE=false）で、/diary/feed と /diary/public の秒間リクエスト数と応答時間を比較する。
+日記の作成はGemini APIを呼び出すため、ユーザー登録以外のデータはDBに直接書き込む。
+
+使い方（backディレクトリで実行）:
+    python -m benchmarks.feed_throughput
+    python -m benchmarks.feed_throughput --mode async --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+
+import httpx
+from sqlalchemy import create_engine
+
+from .login_burst import percentile
+from .server import running_server
+
+MODES = {"async": "true", "threadpool": "false"}
+ENDPOINTS = ["/diary/feed", "/diary/public"]
+
+
+async def register_users(base_url: str, count: int):
+    """ユーザーを登録し、(ユーザーID, 認証ヘッダー) のリストを返す"""
+    users = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        for i in range(count):
+            username = f"bench{i}"
+            await client.post("/auth/register", json={
+                "username": username, "email": f"{username}@example.com", "password": "bench-password"
+            })
+            response = await client.post("/auth/token", data={"username": username, "password": "bench-password"})
+            response.raise_for_status()
+            headers = {"Authorization": "Bearer " + response.json()["access_token"]}
+            me = await client.get("/users/me", headers=headers)
+            users.append((me.json()["id"], headers))
+    return users
+
+
+def seed(database_url: str, user_ids, diaries_per_user: int):
+    """全員を互いにフレンドにし、日記とタイムラインを書き込む"""
+    # モデルの定義（列の型）を使うためにappを読み込む。設定の必須項目だけ埋めておく
+    os.environ.setdefault("GEMINI_API_KEY", "dummy")
+    os.environ.setdefault("DATABASE_URL", database_url)
+    from app.models.diary import Diary, now_jst
+    from app.models.friend import Friendship
+    from app.models.timeline import TimelineEntry
+
+    engine = create_engine(database_url)
+    now = now_jst().replace(microsecond=0)
+    diaries = []
+    with engine.begin() as conn:
+        conn.execute(Friendship.__table__.insert(), [
+            {"user_id": a, "friend_id": b} for a in user_ids for b in user_ids if a != b
+        ])
+        for n in range(diaries_per_user):
+            for user_id in user_ids:
+                created_at = now - timedelta(seconds=len(diaries))
+                diaries.append({
+                    "user_id": user_id,
+                    "title": f"bench {n}",
+                    "content": "今日は楽しかった",
+                    "time_limit_sec": 180,
+                    "char_limit": 100,
+                    "view_limit_duration_sec": 86400,
+                    "view_count": 0,
+                    "like_count": 0,
+                    "created_at": created_at,
+                    "view_end_at": created_at + timedelta(days=1),
+                })
+        conn.execute(Diary.__table__.insert(), diaries)
+        rows = conn.execute(
+            Diary.__table__.select().with_only_columns(
+                Diary.id, Diary.user_id, Diary.created_at, Diary.view_end_at
+            )
+        ).all()
+        conn.execute(TimelineEntry.__table__.insert(), [
+            {
+                "user_id": user_id,
+                "diary_id": row.id,
+                "author_id": row.user_id,
+                "created_at": row.created_at,
+                "view_end_at": row.view_end_at,
+            }
+            for row in rows for user_id in user_ids if user_id != row.user_id
+        ])
+    engine.dispose()
+
+
+async def load(base_url: str, path: str, users, requests: int, concurrency: int):
+    """pathに同時にリクエストを送り、(秒間リクエスト数, 応答時間のリスト) を返す"""
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        async def fetch(i):
+            _, headers = users[i % len(users)]
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(path, params={"limit": 20}, headers=headers)
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(fetch(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    return requests / elapsed, latencies
+
+
+def run_mode(mode: str, args):
+    print(f"mode={mode} (ASYNC_DATABASE={MODES[mode]})")
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        env = {"ASYNC_DATABASE": MODES[mode]}
+        with running_server(env, database_url=database_url, workers=args.workers) as base_url:
+            users = asyncio.run(register_users(base_url, args.users))
+            seed(database_url, [user_id for user_id, _ in users], args.diaries)
+            for path in ENDPOINTS:
+                # ウォームアップ（キャッシュ・コネクションプールの初期化）
+                asyncio.run(load(base_url, path, users, min(args.requests, 100), args.concurrency))
+            for path in ENDPOINTS:
+                rps, latencies = asyncio.run(load(base_url, path, users, args.requests, args.concurrency))
+                print(f"  {path}: {rps:.1f} req/s "
+                      f"p50={statistics.median(latencies) * 1000:.1f}ms "
+                      f"p99={percentile(latencies, 99) * 1000:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["both", *MODES], default="both")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--diaries", type=int, default=20, help="ユーザーあたりの日記数")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    modes = list(MODES) if args.mode == "both" else [args.mode]
+    for mode in modes:
+        run_mode(mode, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+フィードバックが表示されるまでの時間のベンチマーク
+
+偽のモデル（GEMINI_FAKE_MODEL）で生成に時間がかかる状況を再現し、次の2つを比べる。
+- polling: POSTで生成を開始し、GETを一定間隔で繰り返して保存されるのを待つ（従来のフロントエンド）
+- stream: SSEのエンドポイントで生成されたテキストを少しずつ受け取る
+
+使い方（backディレクトリで実行）:
+    python -m benchmarks.feedback_latency
+    python -m benchmarks.feedback_latency --latency 5 --diaries 10 --poll-interval 3
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from .login_burst import percentile
+from .server import running_server
+
+
+async def setup(client: httpx.AsyncClient, diaries: int):
+    await client.post("/auth/register", json={
+        "username": "bench", "email": "bench@example.com", "password": "bench-password"
+    })
+    response = await client.post("/auth/token", data={"username": "bench", "password": "bench-password"})
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    diary_ids = []
+    for i in range(diaries):
+        response = await client.post("/diary", headers=headers, json={
+            "title": f"bench {i}", "content": f"ベンチマーク用の日記 {i}。今日は散歩をして楽しかった。",
+            "time_limit_sec": 180, "char_limit": 0, "view_limit_duration_sec": 86400,
+        })
+        response.raise_for_status()
+        diary_ids.append(response.json()["id"])
+    return headers, diary_ids
+
+
+async def by_polling(client, headers, diary_id, interval: float):
+    """(最初のテキストまでの時間, 全文までの時間, リクエスト数) を返す"""
+    start = time.perf_counter()
+    (await client.post(f"/diary/{diary_id}/feedback", headers=headers)).raise_for_status()
+    requests = 1
+    while True:
+        await asyncio.sleep(interval)
+        requests += 1
+        response = await client.get(f"/diary/{diary_id}/feedback", headers=headers)
+        if response.status_code == 200:
+            elapsed = time.perf_counter() - start
+            return elapsed, elapsed, requests
+
+
+async def by_stream(client, headers, diary_id, interval: float):
+    start = time.perf_counter()
+    first = None
+    async with client.stream("GET", f"/diary/{diary_id}/feedback/stream", headers=headers) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line == "event: delta" and first is None:
+                first = time.perf_counter() - start
+            if line in ("event: done", "event: error"):
+                break
+    elapsed = time.perf_counter() - start
+    return first or elapsed, elapsed, 1
+
+
+async def run(base_url: str, mode: str, diaries: int, interval: float):
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        headers, diary_ids = await setup(client, diaries)
+        measure = by_stream if mode == "stream" else by_polling
+        results = await asyncio.gather(*(measure(client, headers, diary_id, interval) for diary_id in diary_ids))
+
+    first = [r[0] for r in results]
+    total = [r[1] for r in results]
+    requests = sum(r[2] for r in results)
+    print(f"{mode}: diaries={diaries} "
+          f"first text p50={statistics.median(first) * 1000:.0f}ms p95={percentile(first, 95) * 1000:.0f}ms, "
+          f"full text p50={statistics.median(total) * 1000:.0f}ms, "
+          f"requests={requests} ({requests / diaries:.1f}/diary)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["polling", "stream", "both"], default="both")
+    parser.add_argument("--latency", type=float, default=3.0, help="偽のモデルが全文を返すまでの秒数")
+    parser.add_argument("--diaries", type=int, default=5)
+    parser.add_argument("--poll-interval", type=float, default=3.0, help="pollingでGETを繰り返す間隔（フロントエンドと同じ3秒）")
+    args = parser.parse_args()
+
+    env = {
+        "GEMINI_FAKE_MODEL": "true",
+        "GEMINI_FAKE_LATENCY_SEC": str(args.latency),
+        # 実際のフィードバックと同じくらいの長さ（ストリーミングでは数文字ずつ届く）
+        "GEMINI_FAKE_RESPONSE": "今日も一日お疲れさまでした。散歩を楽しめたこと、とても素敵ですね。"
+                                "小さな楽しみを見つけられる気持ちは、明日への力になります。無理せず、自分のペースで過ごしてくださいね。",
+        "GEMINI_RATE_LIMIT_RPM": "6000",
+        "GEMINI_RATE_LIMIT_BURST": "100",
+        "EMOTION_ANALYZER_MODE": "local",
+    }
+    modes = ["polling", "stream"] if args.mode == "both" else [args.mode]
+    for mode in modes:
+        with running_server(env) as base_url:
+            asyncio.run(run(base_url, mode, args.diaries, args.poll_interval))
+
+
+if __name__ == "__main__":
+    main()
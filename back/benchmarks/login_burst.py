@@ -0,0 +1,87 @@
+"""
+ログイン集中時のベンチマーク
+
+ログインを大量に同時実行している間に、無関係なエンドポイント（GET /）の応答時間を計測する。
+bcryptをイベントループ上で実行していると、ログイン中は他のリクエストが全て待たされる。
+
+使い方（backディレクトリで実行）:
+    python -m benchmarks.login_burst --executor inline
+    python -m benchmarks.login_burst --executor thread --workers 4
+    python -m benchmarks.login_burst --executor process --workers 4
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from .server import running_server
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def run(base_url: str, logins: int, concurrency: int):
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        await client.post("/auth/register", json={
+            "username": "bench", "email": "bench@example.com", "password": "bench-password"
+        })
+
+        done = asyncio.Event()
+        probe_latencies = []
+
+        async def probe():
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get("/")
+                probe_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.01)
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def login():
+            async with semaphore:
+                response = await client.post("/auth/token", data={
+                    "username": "bench", "password": "bench-password"
+                })
+                response.raise_for_status()
+
+        probe_task = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await probe_task
+
+    print(f"logins: {logins} in {elapsed:.2f}s ({logins / elapsed:.1f} logins/s, concurrency {concurrency})")
+    print(f"GET / during burst: n={len(probe_latencies)} "
+          f"p50={statistics.median(probe_latencies) * 1000:.1f}ms "
+          f"p99={percentile(probe_latencies, 99) * 1000:.1f}ms "
+          f"max={max(probe_latencies) * 1000:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--executor", choices=["inline", "thread", "process"], default="thread")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    env = {
+        "PASSWORD_HASH_EXECUTOR": args.executor,
+        "PASSWORD_HASH_WORKERS": str(args.workers),
+    }
+    print(f"executor={args.executor} workers={args.workers}")
+    with running_server(env) as base_url:
+        asyncio.run(run(base_url, args.logins, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
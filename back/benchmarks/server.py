@@ -0,0 +1,51 @@
+"""ベンチマーク用に一時的なDBでAPIサーバーを起動するヘルパー"""
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def running_server(env: dict = None, database_url: str = None, workers: int = 1):
+    """uvicornを別プロセスで起動し、ベースURLを返す"""
+    port = _free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        server_env = dict(os.environ)
+        server_env.setdefault("GEMINI_API_KEY", "dummy")
+        server_env["DATABASE_URL"] = database_url or f"sqlite:///{tmp}/bench.db"
+        server_env.update(env or {})
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app",
+             "--host", "127.0.0.1", "--port", str(port),
+             "--workers", str(workers), "--log-level", "warning"],
+            cwd=BACK_DIR,
+            env=server_env,
+            stdout=subprocess.DEVNULL,
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            for _ in range(100):
+                try:
+                    httpx.get(base_url + "/", timeout=1)
+                    break
+                except httpx.HTTPError:
+                    time.sleep(0.1)
+            else:
+                raise RuntimeError("server did not start")
+            yield base_url
+        finally:
+            process.terminate()
+            process.wait()
@@ -0,0 +1,118 @@
+"""
+SQLiteの同時書き込みのベンチマーク
+
+多数のユーザーが同時にいいね・いいね取り消し（いいね行・いいね数・通知の書き込み）を行いながら、
+フィードを読み込んだときのスループットと応答時間、エラー（"database is locked" による500など）の件数を
+SQLITE_TUNED=true（WAL・synchronous=NORMAL・busy_timeoutなど）とfalse（SQLiteのデフォルト）で比較する。
+
+使い方（backディレクトリで実行）:
+    python -m benchmarks.write_concurrency
+    python -m benchmarks.write_concurrency --mode tuned --writes 2000 --concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import httpx
+
+from .feed_throughput import register_users, seed
+from .login_burst import percentile
+from .server import running_server
+
+MODES = {"tuned": "true", "default": "false"}
+
+
+def summary(name: str, latencies, errors: int, elapsed: float) -> str:
+    if not latencies:
+        return f"  {name}: no requests"
+    return (f"  {name}: {len(latencies) / elapsed:.1f} req/s "
+            f"p50={statistics.median(latencies) * 1000:.1f}ms "
+            f"p99={percentile(latencies, 99) * 1000:.1f}ms "
+            f"errors={errors}")
+
+
+async def run(base_url: str, users, writes: int, concurrency: int):
+    async with httpx.AsyncClient(base_url=base_url, timeout=60,
+                                 limits=httpx.Limits(max_connections=concurrency + 4)) as client:
+        # 各ユーザーのフィードからいいね対象の日記を集める
+        targets = {}
+        for _, headers in users:
+            response = await client.get("/diary/feed", params={"limit": 50}, headers=headers)
+            response.raise_for_status()
+            targets[headers["Authorization"]] = [item["id"] for item in response.json()["items"]]
+
+        write_latencies, read_latencies = [], []
+        errors = {"write": 0, "read": 0}
+        semaphore = asyncio.Semaphore(concurrency)
+        done = asyncio.Event()
+        rng = random.Random(0)
+
+        async def write(i):
+            _, headers = users[i % len(users)]
+            diary_id = rng.choice(targets[headers["Authorization"]])
+            # いいね済みなら400、未いいねの取り消しは404になるが、どちらも書き込みを試みた上での正常な応答
+            method = client.post if rng.random() < 0.5 else client.delete
+            async with semaphore:
+                start = time.perf_counter()
+                response = await method(f"/diary/{diary_id}/like", headers=headers)
+                write_latencies.append(time.perf_counter() - start)
+            if response.status_code >= 500:
+                errors["write"] += 1
+
+        async def reader():
+            i = 0
+            while not done.is_set():
+                _, headers = users[i % len(users)]
+                i += 1
+                start = time.perf_counter()
+                response = await client.get("/diary/feed", params={"limit": 20}, headers=headers)
+                read_latencies.append(time.perf_counter() - start)
+                if response.status_code >= 500:
+                    errors["read"] += 1
+
+        readers = [asyncio.create_task(reader()) for _ in range(4)]
+        start = time.perf_counter()
+        await asyncio.gather(*(write(i) for i in range(writes)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await asyncio.gather(*readers)
+
+    print(summary("likes (write)", write_latencies, errors["write"], elapsed))
+    print(summary("feed (read during writes)", read_latencies, errors["read"], elapsed))
+
+
+def run_mode(mode: str, args):
+    print(f"mode={mode} (SQLITE_TUNED={MODES[mode]})")
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        env = {"SQLITE_TUNED": MODES[mode]}
+        # 複数ワーカーが同時にテーブル作成・マイグレーションを行わないよう、先に1プロセスで作成しておく
+        with running_server(env, database_url=database_url):
+            pass
+        with running_server(env, database_url=database_url, workers=args.workers) as base_url:
+            users = asyncio.run(register_users(base_url, args.users))
+            seed(database_url, [user_id for user_id, _ in users], args.diaries)
+            asyncio.run(run(base_url, users, args.writes, args.concurrency))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["both", *MODES], default="both")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--diaries", type=int, default=5, help="ユーザーあたりの日記数")
+    parser.add_argument("--writes", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=2, help="uvicornのワーカー数（複数プロセスからの同時書き込み）")
+    args = parser.parse_args()
+
+    modes = list(MODES) if args.mode == "both" else [args.mode]
+    for mode in modes:
+        run_mode(mode, args)
+
+
+if __name__ == "__main__":
+    main()
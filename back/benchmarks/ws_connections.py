@@ -0,0 +1,159 @@
+"""
+通知のWebSocketの同時接続数のベンチマーク
+
+1つのワーカー（uvicornの1プロセス、memoryブローカー）に接続を段階的に増やしながら、
+各段階で次の値を測る。
+- 接続: 全ての接続が確立し、最初のsnapshotを受け取るまでの時間とサーバーのメモリ使用量（RSS）
+- 配信: 別のユーザーが全員の日記にいいねをしてから、全ての接続にいいね数のイベントが届くまでの時間
+
+使い方（backディレクトリで実行）:
+    python -m benchmarks.ws_connections
+    python -m benchmarks.ws_connections --connections 1000,5000,10000 --users 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from urllib.parse import urlparse
+
+import httpx
+from websockets.asyncio.client import connect
+
+from .feed_throughput import register_users
+from .login_burst import percentile
+from .server import running_server
+
+# ベンチマーク用のサーバーで /metrics を読むためのトークン
+METRICS_TOKEN = "benchmark-metrics"
+
+
+def server_rss_mb(base_url: str):
+    """ベンチマーク用のサーバープロセスのメモリ使用量（MB）を返す（Linux以外ではNone）"""
+    port = str(urlparse(base_url).port)
+    if not os.path.isdir("/proc"):
+        return None
+    for pid in os.listdir("/proc"):
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                args = f.read().split(b"\0")
+            if b"uvicorn" not in args or port.encode() not in args:
+                continue
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except (OSError, ValueError):
+            continue
+    return None
+
+
+async def setup(base_url: str, users: int):
+    """いいねをするユーザー1人と、日記を1件ずつ書いた受信側のユーザーを登録する"""
+    registered = await register_users(base_url, users + 1)
+    sender, receivers = registered[0], registered[1:]
+    diaries = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        for user_id, headers in receivers:
+            response = await client.post("/diary", headers=headers, json={
+                "title": "bench", "content": "今日は楽しかった",
+                "time_limit_sec": 180, "char_limit": 100, "view_limit_duration_sec": 86400,
+            })
+            response.raise_for_status()
+            token = headers["Authorization"].split(" ", 1)[1]
+            diaries.append((token, response.json()["id"]))
+    return sender[1], diaries
+
+
+async def open_sockets(ws_url: str, tokens, handshakes: int):
+    """接続を開き、snapshotを受け取るまでの時間と一緒に返す"""
+    semaphore = asyncio.Semaphore(handshakes)
+
+    async def open_one(token):
+        async with semaphore:
+            start = time.perf_counter()
+            socket = await connect(f"{ws_url}?token={token}", max_queue=None)
+            assert json.loads(await socket.recv())["type"] == "snapshot"
+            return socket, time.perf_counter() - start
+
+    return await asyncio.gather(*(open_one(token) for token in tokens))
+
+
+async def wait_for_like(socket, start: float) -> float:
+    """いいね数のイベントが届くまで待ち、開始からの時間を返す（通知のイベントは読み飛ばす）"""
+    while True:
+        if json.loads(await socket.recv())["type"] == "like":
+            return time.perf_counter() - start
+
+
+async def fan_out(base_url: str, sender_headers, diaries, sockets, liked: bool):
+    """全員の日記のいいねを付ける（外す）"""
+    start = time.perf_counter()
+    waiters = [asyncio.create_task(wait_for_like(socket, start)) for socket, _ in sockets]
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        method = client.delete if liked else client.post
+        responses = await asyncio.gather(*(
+            method(f"/diary/{diary_id}/like", headers=sender_headers) for _, diary_id in diaries
+        ))
+    for response in responses:
+        response.raise_for_status()
+    return await asyncio.wait_for(asyncio.gather(*waiters), timeout=60)
+
+
+async def run(base_url: str, levels, users: int, handshakes: int):
+    ws_url = base_url.replace("http", "ws", 1) + "/friend/notifications/ws"
+    sender_headers, diaries = await setup(base_url, users)
+    idle_rss = server_rss_mb(base_url)
+    print(f"idle: rss={idle_rss:.0f}MB")
+
+    sockets = []
+    liked = False
+    try:
+        for level in levels:
+            # 受信側のユーザーに順番に割り当て、1ユーザーが複数の接続（タブ）を持つ状態にする
+            tokens = [diaries[i % len(diaries)][0] for i in range(len(sockets), level)]
+            start = time.perf_counter()
+            opened = await open_sockets(ws_url, tokens, handshakes)
+            connect_sec = time.perf_counter() - start
+            sockets.extend(opened)
+            handshake_times = [t for _, t in opened]
+            rss = server_rss_mb(base_url)
+
+            latencies = await fan_out(base_url, sender_headers, diaries, sockets, liked)
+            liked = not liked
+            async with httpx.AsyncClient(base_url=base_url) as client:
+                metrics = await client.get("/metrics", headers={"Authorization": f"Bearer {METRICS_TOKEN}"})
+                broker = metrics.json()["notification_broker"]
+
+            print(f"connections={len(sockets)}: "
+                  f"connect {connect_sec:.1f}s (handshake p50={statistics.median(handshake_times) * 1000:.0f}ms "
+                  f"p99={percentile(handshake_times, 99) * 1000:.0f}ms), "
+                  f"rss={rss:.0f}MB ({(rss - idle_rss) * 1024 / len(sockets):.0f}KB/conn), "
+                  f"fan-out p50={statistics.median(latencies) * 1000:.0f}ms "
+                  f"p99={percentile(latencies, 99) * 1000:.0f}ms max={max(latencies) * 1000:.0f}ms, "
+                  f"dropped={broker['dropped']}")
+    finally:
+        await asyncio.gather(*(socket.close() for socket, _ in sockets), return_exceptions=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", default="100,500,1000,2000", help="段階的に増やす接続数（カンマ区切り）")
+    parser.add_argument("--users", type=int, default=20, help="接続するユーザー数（接続はユーザーに均等に割り当てる）")
+    parser.add_argument("--handshakes", type=int, default=100, help="同時に行う接続の確立の数")
+    args = parser.parse_args()
+
+    levels = sorted(int(n) for n in args.connections.split(","))
+    env = {
+        "GEMINI_FAKE_MODEL": "true",
+        "EMOTION_ANALYZER_MODE": "local",
+        "NOTIFICATION_BROKER": "memory",
+        "METRICS_TOKEN": METRICS_TOKEN,
+    }
+    with running_server(env) as base_url:
+        asyncio.run(run(base_url, levels, args.users, args.handshakes))
+
+
+if __name__ == "__main__":
+    main()
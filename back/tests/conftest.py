@@ -0,0 +1,61 @@
+import os
+import tempfile
+
+# アプリを読み込む前に、一時的なSQLiteとGeminiのフェイクを設定する
+_tmpdir = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmpdir.name}/test.db"
+os.environ.setdefault("GEMINI_API_KEY", "dummy")
+os.environ.setdefault("GEMINI_FAKE_MODEL", "true")
+
+import pytest
+from collections import Counter
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.core import database
+from app.core.security import create_access_token
+from app.main import app
+from app.models.user import User
+
+
+@pytest.fixture(scope="session")
+def client():
+    """アプリのクライアント（ジョブワーカーなどがコミットしないよう、起動処理は実行しない）"""
+    return TestClient(app)
+
+
+@pytest.fixture
+def commits():
+    """テスト中にDBへコミットした回数を数える"""
+    counts = Counter()
+
+    def on_commit(conn):
+        counts["commits"] += 1
+
+    engines = [database.engine] + ([database.async_engine.sync_engine] if database.async_engine else [])
+    for engine in engines:
+        event.listen(engine, "commit", on_commit)
+    yield counts
+    for engine in engines:
+        event.remove(engine, "commit", on_commit)
+
+
+@pytest.fixture
+def create_users():
+    """ユーザーをDBに直接作成し、(ユーザーID, 認証ヘッダー) のリストを返す"""
+    def create(prefix: str, count: int):
+        db = database.SessionLocal()
+        try:
+            users = [
+                User(username=f"{prefix}{i}", email=f"{prefix}{i}@example.com", hashed_password="!")
+                for i in range(count)
+            ]
+            db.add_all(users)
+            db.commit()
+            return [
+                (user.id, {"Authorization": "Bearer " + create_access_token({"sub": user.username, "uid": user.id})})
+                for user in users
+            ]
+        finally:
+            db.close()
+    return create
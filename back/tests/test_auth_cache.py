@@ -0,0 +1,95 @@
+"""認証済みユーザーのキャッシュが、ユーザー情報の変更で無効になるかのテスト"""
+import pytest
+
+from app.core import security
+
+
+def register(client, name, password="password123"):
+    response = client.post("/auth/register", json={"username": name, "email": f"{name}@example.com", "password": password})
+    assert response.status_code == 200, response.text
+    token = client.post("/auth/token", data={"username": name, "password": password}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """ユーザーをDBから読み込んだ回数を数える（キャッシュを使わなかった回数）"""
+    calls = []
+    load = security._load_current_user
+
+    def counting_load(db, *args):
+        calls.append(args)
+        return load(db, *args)
+
+    monkeypatch.setattr(security, "_load_current_user", counting_load)
+    return calls
+
+
+def test_profile_change_is_visible_immediately(client, loads):
+    headers = register(client, "cache_profile")
+    assert client.get("/users/me", headers=headers).json()["username"] == "cache_profile"
+    before = len(loads)
+    # 2回目はキャッシュから返す
+    assert client.get("/users/me", headers=headers).json()["username"] == "cache_profile"
+    assert len(loads) == before
+
+    assert client.put("/users/me", headers=headers, json={"username": "cache_profile2"}).status_code == 200
+    # 変更前のユーザーのスナップショットは使わずに読み直す
+    before = len(loads)
+    assert client.get("/users/me", headers=headers).json()["username"] == "cache_profile2"
+    assert len(loads) == before + 1
+
+
+def test_password_change_drops_cached_user(client, loads):
+    headers = register(client, "cache_password")
+    client.get("/users/me", headers=headers)
+
+    assert client.put("/users/me", headers=headers, json={"password": "new-password456"}).status_code == 200
+    before = len(loads)
+    client.get("/users/me", headers=headers)
+    # キャッシュを使わずにDBから読み直す
+    assert len(loads) == before + 1
+    assert client.post("/auth/token", data={"username": "cache_password", "password": "password123"}).status_code == 401
+    assert client.post("/auth/token", data={"username": "cache_password", "password": "new-password456"}).status_code == 200
+
+
+def test_deleted_user_token_is_rejected(client):
+    headers = register(client, "cache_delete")
+    client.get("/users/me", headers=headers)
+
+    assert client.delete("/users/me", headers=headers).status_code == 204
+    assert client.get("/users/me", headers=headers).status_code == 401
+
+
+def test_invalidation_during_load_is_not_cached(client, loads, monkeypatch):
+    headers = register(client, "cache_race")
+    user_id = client.get("/users/me", headers=headers).json()["id"]
+    security.user_cache.clear()
+    load = security._load_current_user
+
+    def load_then_invalidate(db, *args):
+        # 読み込みの後（キャッシュに保存する前）に、他のリクエストがユーザー情報を変更する
+        user = load(db, *args)
+        security.invalidate_user_cache(user_id)
+        return user
+
+    monkeypatch.setattr(security, "_load_current_user", load_then_invalidate)
+    client.get("/users/me", headers=headers)
+    monkeypatch.setattr(security, "_load_current_user", load)
+
+    before = len(loads)
+    client.get("/users/me", headers=headers)
+    assert len(loads) == before + 1
+
+
+def test_full_invalidation_log_clears_cache(client, monkeypatch):
+    headers = register(client, "cache_overflow")
+    client.get("/users/me", headers=headers)
+    monkeypatch.setattr(security._user_invalidations, "maxsize", 2)
+    security._user_invalidations.clear()
+
+    # 無効化の記録があふれる場合は、記録を消さずにキャッシュごと捨てる
+    for user_id in range(10**6, 10**6 + 3):
+        security.invalidate_user_cache(user_id)
+    assert security.user_cache.stats()["size"] == 0
+    assert security._user_invalidations.stats()["size"] == 1
@@ -0,0 +1,64 @@
+"""フレンドリクエストを同時に承認した場合のテスト"""
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+
+from app.core.database import SessionLocal
+from app.crud.friend import update_friend_request
+from app.models.friend import Friendship, Notification
+
+
+def count_rows(model, *criteria):
+    db = SessionLocal()
+    try:
+        return db.query(model).filter(*criteria).count()
+    finally:
+        db.close()
+
+
+def send_request(client, sender, receiver):
+    response = client.post(f"/friend/request/{receiver[0]}", headers=sender[1])
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def test_second_accept_of_same_request_does_nothing(client, create_users):
+    sender, receiver = create_users("accept_twice", 2)
+    request_id = send_request(client, sender, receiver)
+
+    # ルートの未処理の確認を両方が通過した後の、2つ目の承認
+    for expected in (True, False):
+        db = SessionLocal()
+        try:
+            assert (update_friend_request(db, request_id, "accepted") is not None) is expected
+        finally:
+            db.close()
+
+    assert count_rows(Friendship, Friendship.user_id.in_([sender[0], receiver[0]])) == 2
+    assert count_rows(Notification, Notification.user_id == sender[0], Notification.type == "friend") == 1
+
+
+def test_concurrent_accepts(client, create_users):
+    sender, receiver = create_users("accept_concurrent", 2)
+    request_id = send_request(client, sender, receiver)
+    barrier = Barrier(4)
+
+    def accept(_):
+        barrier.wait()
+        return client.post(f"/friend/accept/{request_id}", headers=receiver[1]).status_code
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        statuses = sorted(executor.map(accept, range(4)))
+
+    assert statuses == [200, 400, 400, 400]
+    assert count_rows(Friendship, Friendship.user_id.in_([sender[0], receiver[0]])) == 2
+    assert count_rows(Notification, Notification.user_id == sender[0], Notification.type == "friend") == 1
+
+
+def test_reverse_request_accepts_pending_request(client, create_users):
+    first, second = create_users("reverse_request", 2)
+    request_id = send_request(client, first, second)
+
+    response = client.post(f"/friend/request/{first[0]}", headers=second[1])
+    assert response.json() == {**response.json(), "id": request_id, "status": "accepted"}
+    assert client.post(f"/friend/accept/{request_id}", headers=second[1]).status_code == 400
+    assert count_rows(Friendship, Friendship.user_id.in_([first[0], second[0]])) == 2
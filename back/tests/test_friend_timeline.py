@@ -0,0 +1,37 @@
+"""フレンドになった直後に投稿した日記がタイムラインに届くかのテスト"""
+from app.crud.friend import friend_ids_cache
+
+from .test_transaction_commits import DIARY
+
+
+def make_friends(client, a, b):
+    """aからbにフレンドリクエストを送り、bが承認する"""
+    (a_id, a_headers), (b_id, b_headers) = a, b
+    request_id = client.post(f"/friend/request/{b_id}", headers=a_headers).json()["id"]
+    response = client.post(f"/friend/accept/{request_id}", headers=b_headers)
+    assert response.status_code == 200, response.text
+
+
+def feed_ids(client, headers):
+    return [diary["id"] for diary in client.get("/diary/feed", headers=headers).json()["items"]]
+
+
+def test_accept_then_post_immediately(client, create_users):
+    author, friend = create_users("accept_post", 2)
+    make_friends(client, author, friend)
+
+    diary_id = client.post("/diary", headers=author[1], json=DIARY).json()["id"]
+    assert diary_id in feed_ids(client, friend[1])
+
+
+def test_post_reaches_friend_accepted_on_another_worker(client, create_users):
+    author, friend = create_users("accept_other", 2)
+    # 承認前のフレンド（いない）をキャッシュに載せる
+    client.get(f"/diary/friend/{friend[0]}", headers=author[1])
+    stale = friend_ids_cache.get(author[0])
+    make_friends(client, author, friend)
+    # 他のワーカーで承認された場合は、このプロセスのキャッシュは古いまま残る
+    friend_ids_cache.set(author[0], stale if stale is not None else frozenset())
+
+    diary_id = client.post("/diary", headers=author[1], json=DIARY).json()["id"]
+    assert diary_id in feed_ids(client, friend[1])
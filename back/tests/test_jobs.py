@@ -0,0 +1,28 @@
+"""ジョブの時刻のテスト"""
+from datetime import datetime, timedelta
+
+from app.core.database import SessionLocal
+from app.crud.job import complete_jobs
+from app.models.job import Job
+
+from .test_transaction_commits import DIARY
+
+
+def test_job_timestamps_use_one_clock(client, create_users):
+    (_, headers), = create_users("job_user", 1)
+    diary_id = client.post("/diary", headers=headers, json=DIARY).json()["id"]
+    job_id = client.post(f"/diary/{diary_id}/feedback", headers=headers).json()["job_id"]
+
+    db = SessionLocal()
+    try:
+        job = db.get(Job, job_id)
+        assert abs(job.run_after - job.created_at) < timedelta(seconds=5)
+        complete_jobs(db, [job])
+    finally:
+        db.close()
+
+    job = client.get(f"/jobs/{job_id}", headers=headers).json()
+    assert job["status"] == "done"
+    # 作成時刻は秒単位で保存されるため、1秒の誤差を許す
+    elapsed = datetime.fromisoformat(job["finished_at"]) - datetime.fromisoformat(job["created_at"])
+    assert timedelta(seconds=-1) < elapsed < timedelta(seconds=5)
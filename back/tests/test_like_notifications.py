@@ -0,0 +1,71 @@
+"""同じ日記へのいいねの通知を時間帯ごとに1件にまとめるテスト"""
+import time
+from types import SimpleNamespace
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.crud import friend as friend_crud
+from app.models.friend import Notification, NotificationActor
+
+from .test_transaction_commits import DIARY
+
+
+def like_notifications(diary_id):
+    db = SessionLocal()
+    try:
+        rows = db.query(Notification).filter(
+            Notification.type == "like", Notification.related_id == diary_id
+        ).order_by(Notification.id).all()
+        actors = {
+            row.id: sorted(user_id for (user_id,) in db.query(NotificationActor.user_id).filter(
+                NotificationActor.notification_id == row.id
+            ))
+            for row in rows
+        }
+        return rows, actors
+    finally:
+        db.close()
+
+
+def test_likes_coalesce_with_distinct_actors(client, create_users):
+    author, *likers = create_users("coalesce", 4)
+    diary_id = client.post("/diary", headers=author[1], json=DIARY).json()["id"]
+    # 自分の日記へのいいねは通知しない
+    client.post(f"/diary/{diary_id}/like", headers=author[1])
+
+    client.post(f"/diary/{diary_id}/like", headers=likers[0][1])
+    (first,), _ = like_notifications(diary_id)
+    for _, headers in likers[1:]:
+        client.post(f"/diary/{diary_id}/like", headers=headers)
+    # 取り消して付け直しても2回は数えない
+    client.delete(f"/diary/{diary_id}/like", headers=likers[0][1])
+    client.post(f"/diary/{diary_id}/like", headers=likers[0][1])
+
+    (row,), actors = like_notifications(diary_id)
+    assert row.id == first.id
+    assert row.actor_count == 3
+    assert actors[row.id] == sorted(user_id for user_id, _ in likers)
+    assert row.last_actor_id == likers[2][0]
+    # 作成時刻は変えず（一覧の順序を保つ）、最後にまとめた時刻だけを更新する
+    assert row.created_at == first.created_at
+    assert row.updated_at is not None and row.updated_at >= row.created_at
+
+
+def test_next_window_starts_new_notification(client, create_users, monkeypatch):
+    author, liker, other = create_users("window", 3)
+    diary_id = client.post("/diary", headers=author[1], json=DIARY).json()["id"]
+    other_diary_id = client.post("/diary", headers=author[1], json=DIARY).json()["id"]
+
+    client.post(f"/diary/{diary_id}/like", headers=liker[1])
+    client.post(f"/diary/{other_diary_id}/like", headers=liker[1])
+    # 次の時間帯のいいねは、未読の通知があっても新しい通知にする
+    later = time.time() + settings.LIKE_NOTIFICATION_WINDOW_SEC
+    monkeypatch.setattr(friend_crud, "time", SimpleNamespace(time=lambda: later))
+    client.post(f"/diary/{diary_id}/like", headers=other[1])
+
+    rows, actors = like_notifications(diary_id)
+    assert [row.actor_count for row in rows] == [1, 1]
+    assert [actors[row.id] for row in rows] == [[liker[0]], [other[0]]]
+    # 他の日記のいいねは別の通知
+    (other_row,), _ = like_notifications(other_diary_id)
+    assert other_row.id not in {row.id for row in rows}
@@ -0,0 +1,58 @@
+"""未読通知の件数（notification_counters）が実際の未読の通知の件数と一致し続けるかのテスト"""
+from app.core.database import SessionLocal
+from app.models.friend import Notification
+
+from .test_transaction_commits import DIARY
+
+
+def assert_counter_matches(client, user):
+    """APIの未読件数と、DBの未読の通知の件数が一致することを確認して返す"""
+    user_id, headers = user
+    db = SessionLocal()
+    try:
+        unread = db.query(Notification).filter(Notification.user_id == user_id, Notification.is_read == False).count()
+    finally:
+        db.close()
+    assert client.get("/friend/notifications/count", headers=headers).json()["count"] == unread
+    return unread
+
+
+def unread_ids(client, headers):
+    page = client.get("/friend/notifications?unread_only=true&limit=100", headers=headers).json()
+    return [notification["id"] for notification in page["items"]]
+
+
+def test_unread_counter_follows_unread_rows(client, create_users):
+    author, *others = create_users("counter", 4)
+    stranger = create_users("counter_stranger", 1)[0]
+
+    # フレンドリクエストの通知
+    request_ids = [client.post(f"/friend/request/{author[0]}", headers=h).json()["id"] for _, h in others]
+    assert assert_counter_matches(client, author) == 3
+    for request_id in request_ids:
+        client.post(f"/friend/accept/{request_id}", headers=author[1])
+    for other in others:
+        assert assert_counter_matches(client, other) == 1
+
+    # いいねの通知は1件にまとめ、取り消して付け直しても増やさない
+    diary_id = client.post("/diary", headers=author[1], json=DIARY).json()["id"]
+    for _, headers in others:
+        client.post(f"/diary/{diary_id}/like", headers=headers)
+    client.delete(f"/diary/{diary_id}/like", headers=others[0][1])
+    client.post(f"/diary/{diary_id}/like", headers=others[0][1])
+    assert assert_counter_matches(client, author) == 4
+
+    # 既読は1回だけ減らし、他のユーザーの通知は既読にできない
+    notification_id = unread_ids(client, author[1])[0]
+    assert client.post(f"/friend/notifications/{notification_id}/read", headers=author[1]).status_code == 200
+    assert client.post(f"/friend/notifications/{notification_id}/read", headers=author[1]).status_code == 200
+    assert client.post(f"/friend/notifications/{notification_id}/read", headers=stranger[1]).status_code == 404
+    assert assert_counter_matches(client, author) == 3
+
+    assert client.post("/friend/notifications/read-all", headers=author[1]).status_code == 204
+    assert assert_counter_matches(client, author) == 0
+
+    # まとめた通知を既読にした後のいいねは新しい通知になる
+    client.delete(f"/diary/{diary_id}/like", headers=others[1][1])
+    client.post(f"/diary/{diary_id}/like", headers=others[1][1])
+    assert assert_counter_matches(client, author) == 1
@@ -0,0 +1,97 @@
+"""作成時刻が同じ行を含むキーセットページネーションのテスト"""
+from datetime import datetime
+
+from sqlalchemy import update
+
+from app.core.database import SessionLocal
+from app.models.diary import Diary
+from app.models.friend import Notification
+from app.models.timeline import TimelineEntry
+
+from .test_friend_timeline import make_friends
+from .test_transaction_commits import DIARY
+
+SAME_TIME = datetime(2030, 1, 1, 12, 0, 0)
+EARLIER = datetime(2030, 1, 1, 11, 59, 59)
+
+
+def set_created_at(*statements):
+    db = SessionLocal()
+    try:
+        for statement in statements:
+            db.execute(statement)
+        db.commit()
+    finally:
+        db.close()
+
+
+def walk(client, path, headers, limit):
+    """カーソルをたどって全ページの (created_at, id) を集める"""
+    keys, cursor = [], None
+    # 同じページを返し続ける場合もテストが終わるよう、ページ数に上限を設ける
+    for _ in range(100):
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        page = client.get(path, headers=headers, params=params)
+        assert page.status_code == 200, page.text
+        page = page.json()
+        assert len(page["items"]) <= limit
+        keys += [(item["created_at"], item["id"]) for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return keys
+    raise AssertionError(f"{path}: pagination did not end: {keys[:10]}")
+
+
+def assert_walks_in_order(keys, expected_ids):
+    ids = [id for _, id in keys]
+    assert len(ids) == len(set(ids))
+    assert sorted(ids) == sorted(expected_ids)
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_diaries_with_equal_created_at(client, create_users):
+    author, friend = create_users("paging", 2)
+    make_friends(client, author, friend)
+    diary_ids = [client.post("/diary", headers=author[1], json=DIARY).json()["id"] for _ in range(7)]
+    # 5件は同じ時刻、2件はそれより前
+    set_created_at(
+        update(Diary).where(Diary.id.in_(diary_ids[:5])).values(created_at=SAME_TIME),
+        update(Diary).where(Diary.id.in_(diary_ids[5:])).values(created_at=EARLIER),
+        update(TimelineEntry).where(TimelineEntry.diary_id.in_(diary_ids[:5])).values(created_at=SAME_TIME),
+        update(TimelineEntry).where(TimelineEntry.diary_id.in_(diary_ids[5:])).values(created_at=EARLIER),
+    )
+
+    for limit in (1, 2, 3, 100):
+        assert_walks_in_order(walk(client, "/diary/my", author[1], limit), diary_ids)
+        assert_walks_in_order(walk(client, "/diary/feed", friend[1], limit), diary_ids)
+        assert_walks_in_order(walk(client, f"/diary/friend/{author[0]}", friend[1], limit), diary_ids)
+
+
+def test_new_rows_do_not_shift_pages(client, create_users):
+    (_, headers), = create_users("paging_insert", 1)
+    diary_ids = [client.post("/diary", headers=headers, json=DIARY).json()["id"] for _ in range(4)]
+    set_created_at(update(Diary).where(Diary.id.in_(diary_ids)).values(created_at=SAME_TIME))
+
+    first = client.get("/diary/my", headers=headers, params={"limit": 2}).json()
+    # 1ページ目を読んだ後に投稿されても、次のページで同じ日記を返したり飛ばしたりしない
+    client.post("/diary", headers=headers, json=DIARY)
+    second = client.get("/diary/my", headers=headers, params={"limit": 2, "cursor": first["next_cursor"]}).json()
+    ids = [item["id"] for item in first["items"] + second["items"]]
+    assert ids == sorted(diary_ids, reverse=True)
+
+
+def test_notifications_with_equal_created_at(client, create_users):
+    receiver, *senders = create_users("paging_notify", 6)
+    for _, headers in senders:
+        client.post(f"/friend/request/{receiver[0]}", headers=headers)
+    set_created_at(update(Notification).where(Notification.user_id == receiver[0]).values(created_at=SAME_TIME))
+
+    notification_ids = [n["id"] for n in client.get("/friend/notifications?limit=100", headers=receiver[1]).json()["items"]]
+    assert len(notification_ids) == 5
+    for limit in (1, 2, 4):
+        assert_walks_in_order(walk(client, "/friend/notifications", receiver[1], limit), notification_ids)
+
+
+def test_invalid_cursor_is_rejected(client, create_users):
+    (_, headers), = create_users("paging_invalid", 1)
+    assert client.get("/friend/notifications", headers=headers, params={"cursor": "not-a-cursor"}).status_code == 400
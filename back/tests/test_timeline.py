@@ -0,0 +1,72 @@
+"""フレンドタイムラインのテスト"""
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import update
+
+from app.core import database
+from app.core.config import settings
+from app.models.diary import Diary, now_jst
+from app.models.timeline import TimelineEntry
+from app.services.timeline_service import MemoryTimelineBackend, purge_expired_timeline
+
+from .test_friend_timeline import make_friends
+from .test_transaction_commits import DIARY
+
+
+def count_entries(*criteria):
+    db = database.SessionLocal()
+    try:
+        return db.query(TimelineEntry).filter(*criteria).count()
+    finally:
+        db.close()
+
+
+@pytest.mark.skipif(settings.TIMELINE_BACKEND != "database", reason="timeline_entries is used by the database backend")
+def test_purge_expired_timeline_in_batches(client, create_users):
+    author, *friends = create_users("purge_author", 3)
+    for friend in friends:
+        make_friends(client, author, friend)
+    diary_ids = [client.post("/diary", headers=author[1], json=DIARY).json()["id"] for _ in range(3)]
+    kept_id = client.post("/diary", headers=author[1], json=DIARY).json()["id"]
+
+    db = database.SessionLocal()
+    try:
+        db.execute(
+            update(TimelineEntry).where(TimelineEntry.diary_id.in_(diary_ids))
+            .values(view_end_at=now_jst() - timedelta(minutes=1))
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    assert purge_expired_timeline(database.engine, dry_run=True) >= 6
+    # 1バッチに日記1件分ずつ削除する
+    assert purge_expired_timeline(database.engine, batch_size=1, pause_sec=0) >= 6
+    assert count_entries(TimelineEntry.diary_id.in_(diary_ids)) == 0
+    assert count_entries(TimelineEntry.diary_id == kept_id) == 2
+
+
+def test_memory_timeline_keeps_push_during_load(client, create_users):
+    author, friend = create_users("memory_load", 2)
+    make_friends(client, author, friend)
+    diary_id = client.post("/diary", headers=author[1], json=DIARY).json()["id"]
+
+    backend = MemoryTimelineBackend(100)
+    load = backend._load
+
+    def load_then_push(db, user_id):
+        # 読み込みの後（保持する前）に、読み込んだ内容に含まれていない日記がpushされる
+        entries = [entry for entry in load(db, user_id) if entry.diary_id != diary_id]
+        backend.push(db, db.get(Diary, diary_id), [user_id])
+        return entries
+
+    backend._load = load_then_push
+    db = database.SessionLocal()
+    try:
+        items, _ = backend.read(db, friend[0])
+        assert diary_id in [diary.id for diary in items]
+        # 読み込みの記録は残さない
+        assert backend._loading == {}
+    finally:
+        db.close()
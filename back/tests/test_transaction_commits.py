@@ -0,0 +1,59 @@
+"""1つのユーザー操作（通知・ストリーク・ジョブの登録を含む）が1回のコミットで済んでいるかのテスト"""
+
+DIARY = {"title": "test", "content": "今日は楽しかった", "time_limit_sec": 180,
+         "char_limit": 100, "view_limit_duration_sec": 86400}
+
+
+def assert_one_commit_each(client, commits, method, path, headers_list):
+    """リクエストごとにコミットが1回だけであることを確認する"""
+    for headers in headers_list:
+        # 認証ユーザーのキャッシュを温めておく（初回の読み込みを数えない）
+        client.get("/friend/notifications/count", headers=headers)
+        commits.clear()
+        response = client.request(method, path, headers=headers)
+        assert response.status_code < 400, response.text
+        assert commits["commits"] == 1, f"{method} {path}: {commits['commits']} commits"
+
+
+def test_create_diary_commits_once(client, commits, create_users):
+    (_, author), = create_users("diary_author", 1)
+    friends = create_users("diary_friend", 2)
+    # フレンドがいる場合もタイムラインへの書き込みを同じトランザクションで行う
+    for friend_id, headers in friends:
+        client.post(f"/friend/request/{friend_id}", headers=author)
+    for request in client.get("/friend/requests", headers=friends[0][1]).json():
+        client.post(f"/friend/accept/{request['id']}", headers=friends[0][1])
+
+    client.get("/friend/notifications/count", headers=author)
+    for _ in range(2):
+        commits.clear()
+        response = client.post("/diary", headers=author, json=DIARY)
+        assert response.status_code == 200, response.text
+        assert commits["commits"] == 1
+    body = response.json()
+    assert body["user"]["username"] == "diary_author0"
+    assert body["is_viewable"] is True
+
+
+def test_friend_request_and_accept_commit_once(client, commits, create_users):
+    (author_id, author), = create_users("friend_author", 1)
+    others = create_users("friend_user", 3)
+
+    assert_one_commit_each(client, commits, "POST", f"/friend/request/{author_id}", [h for _, h in others])
+    request_ids = [r["id"] for r in client.get("/friend/requests", headers=author).json()]
+    assert len(request_ids) == 3
+    for request_id in request_ids:
+        assert_one_commit_each(client, commits, "POST", f"/friend/accept/{request_id}", [author])
+
+
+def test_like_and_unlike_commit_once(client, commits, create_users):
+    (author_id, author), = create_users("like_author", 1)
+    others = create_users("like_user", 3)
+    for _, headers in others:
+        client.post(f"/friend/request/{author_id}", headers=headers)
+    for request in client.get("/friend/requests", headers=author).json():
+        client.post(f"/friend/accept/{request['id']}", headers=author)
+    diary_id = client.post("/diary", headers=author, json=DIARY).json()["id"]
+
+    assert_one_commit_each(client, commits, "POST", f"/diary/{diary_id}/like", [h for _, h in others])
+    assert_one_commit_each(client, commits, "DELETE", f"/diary/{diary_id}/like", [h for _, h in others])
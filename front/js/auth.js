@@ -142,6 +142,7 @@ async function fetchUserInfo() {
 // ログアウト処理
 function logout() {
     authToken = null;
+    disconnectNotificationSocket();
     currentUser = null;
     currentUserId = null;
     localStorage.removeItem('authToken');
@@ -207,6 +208,9 @@ async function loadInitialData() {
         // フレンドリクエスト数を取得
         await checkFriendRequests();
         
+        // 以降の通知や件数の変化はWebSocketで受け取る
+        connectNotificationSocket();
+        
         console.log('初期データ読み込み完了');
     } catch (error) {
         console.error('初期データ読み込みエラー:', error);
@@ -216,7 +220,7 @@ async function loadInitialData() {
 // 通知数をチェック
 async function checkNotifications() {
     try {
-        const response = await fetch(`${API_BASE_URL}/notifications/count`, {
+        const response = await fetch(`${API_BASE_URL}/friend/notifications/count`, {
             headers: {
                 'Authorization': `Bearer ${authToken}`
             }
@@ -23,7 +23,7 @@ async function loadDiaryFeed() {
             throw new Error('日記の取得に失敗しました');
         }
         
-        const diaries = await response.json();
+        const diaries = (await response.json()).items;
         console.log('取得したフレンド日記:', diaries);
         console.log('フレンド日記数:', diaries.length);
         
@@ -68,7 +68,7 @@ async function loadMyDiaries() {
             throw new Error('日記の取得に失敗しました');
         }
         
-        const diaries = await response.json();
+        const diaries = (await response.json()).items;
         
         // 現在のカレンダー月の日記をフィルタ（日本時間で処理）
         const currentMonthDiaries = diaries.filter(diary => {
@@ -165,8 +165,12 @@ function createDiaryCard(diary) {
         toggleLikeFromCard(diary.id, likeBtn, card.querySelector('.like-count'));
     });
     
-    // いいね状態を確認して表示を更新
-    checkAndUpdateLikeStatus(diary.id, likeBtn);
+    // いいね状態を表示（一覧APIに含まれていない場合のみ個別に確認）
+    if (typeof diary.is_liked_by_me === 'boolean') {
+        setLikeButtonState(likeBtn, diary.is_liked_by_me);
+    } else {
+        checkAndUpdateLikeStatus(diary.id, likeBtn);
+    }
     
     // カードのクリックイベント（いいねボタン以外の部分）
     card.addEventListener('click', (e) => {
@@ -505,7 +509,7 @@ async function fetchAndDisplayFeedback(diaryId) {
     }
 }
 
-// フィードバック生成をリクエストする
+// フィードバックを生成しながら少しずつ表示する
 async function requestFeedback(diaryId) {
     const getFeedbackBtn = document.getElementById('get-feedback-btn');
     const feedbackLoading = document.getElementById('feedback-loading-state');
@@ -514,8 +518,7 @@ async function requestFeedback(diaryId) {
     feedbackLoading.classList.remove('hidden');
 
     try {
-        const response = await fetch(`${API_BASE_URL}/diary/${diaryId}/feedback`, {
-            method: 'POST',
+        const response = await fetch(`${API_BASE_URL}/diary/${diaryId}/feedback/stream`, {
             headers: {
                 'Authorization': `Bearer ${authToken}`
             }
@@ -525,61 +528,36 @@ async function requestFeedback(diaryId) {
             throw new Error('フィードバックの生成リクエストに失敗しました。');
         }
 
-        // 生成リクエスト後、ポーリングを開始してフィードバックを取得
-        pollForFeedback(diaryId);
+        // 生成されたテキストが届くたびに表示を更新する
+        let content = '';
+        let errorMessage = null;
+        await readEventStream(response, (event, data) => {
+            if (event === 'delta') {
+                content += data.text;
+                feedbackLoading.classList.add('hidden');
+                displayFeedback(content);
+            } else if (event === 'done') {
+                feedbackLoading.classList.add('hidden');
+                displayFeedback(data.content);
+            } else if (event === 'error') {
+                errorMessage = data.message;
+            }
+        });
+
+        if (errorMessage) {
+            throw new Error(errorMessage);
+        }
 
     } catch (error) {
         console.error('Error requesting feedback:', error);
         alert(error.message);
         // エラー発生時はボタンを再表示
+        document.getElementById('feedback-container').classList.add('hidden');
         getFeedbackBtn.classList.remove('hidden');
         feedbackLoading.classList.add('hidden');
     }
 }
 
-// フィードバックが生成されるまでポーリングする
-function pollForFeedback(diaryId) {
-    let attempts = 0;
-    const maxAttempts = 10; // 最大10回試行 (合計約30秒)
-    const interval = 3000; // 3秒間隔
-
-    const intervalId = setInterval(async () => {
-        attempts++;
-        try {
-            const response = await fetch(`${API_BASE_URL}/diary/${diaryId}/feedback`, {
-                headers: {
-                    'Authorization': `Bearer ${authToken}`
-                }
-            });
-
-            if (response.ok) {
-                const feedback = await response.json();
-                if (feedback && feedback.content) {
-                    clearInterval(intervalId);
-                    displayFeedback(feedback.content);
-                    document.getElementById('feedback-loading-state').classList.add('hidden');
-                    return;
-                }
-            } else if (response.status === 404) {
-                // フィードバックがまだ生成されていない場合は静かに処理（エラーログを出力しない）
-                return;
-            } else {
-                // その他のエラーの場合のみログを出力
-                console.error('Polling error:', response.status, response.statusText);
-            }
-        } catch (error) {
-            console.error('Network error during polling:', error);
-        }
-
-        if (attempts >= maxAttempts) {
-            clearInterval(intervalId);
-            alert('フィードバックの取得に時間がかかっています。後ほど再度お試しください。');
-            document.getElementById('get-feedback-btn').classList.remove('hidden');
-            document.getElementById('feedback-loading-state').classList.add('hidden');
-        }
-    }, interval);
-}
-
 // 取得したフィードバックを画面に表示する
 function displayFeedback(content) {
     const feedbackContainer = document.getElementById('feedback-container');
@@ -611,7 +589,7 @@ async function initMonthlyFeedbackSection() {
         });
         
         if (diariesResponse.ok) {
-            const allDiaries = await diariesResponse.json();
+            const allDiaries = (await diariesResponse.json()).items;
             
             // 現在の月の日記をフィルタ（日本時間で処理）
             const currentMonthDiaries = allDiaries.filter(diary => {
@@ -673,15 +651,16 @@ function displayMonthlyFeedback(content) {
     }
 }
 
-// 月ごとフィードバックをリクエスト
+// 月ごとフィードバックを生成しながら少しずつ表示する
 async function requestMonthlyFeedback(year, month) {
+    const loadingState = document.getElementById('monthly-feedback-loading-state');
+
     try {
         // ボタンを非表示にしてローディング状態を表示
         document.getElementById('get-monthly-feedback-btn').classList.add('hidden');
-        document.getElementById('monthly-feedback-loading-state').classList.remove('hidden');
+        loadingState.classList.remove('hidden');
         
-        const response = await fetch(`${API_BASE_URL}/diary/monthly-feedback/${year}/${month}`, {
-            method: 'POST',
+        const response = await fetch(`${API_BASE_URL}/diary/monthly-feedback/${year}/${month}/stream`, {
             headers: {
                 'Authorization': `Bearer ${authToken}`
             }
@@ -691,61 +670,37 @@ async function requestMonthlyFeedback(year, month) {
             throw new Error('月ごとフィードバックの生成に失敗しました');
         }
 
-        // フィードバックが生成されるまでポーリング
-        pollForMonthlyFeedback(year, month);
+        // 生成されたテキストが届くたびに表示を更新する
+        let content = '';
+        let failed = false;
+        await readEventStream(response, (event, data) => {
+            if (event === 'delta') {
+                content += data.text;
+                loadingState.classList.add('hidden');
+                displayMonthlyFeedback(content);
+            } else if (event === 'done') {
+                loadingState.classList.add('hidden');
+                displayMonthlyFeedback(data.content);
+            } else if (event === 'error') {
+                failed = true;
+            }
+        });
+
+        if (failed) {
+            throw new Error('月ごとフィードバックの生成に失敗しました');
+        }
 
     } catch (error) {
         console.error('Error requesting monthly feedback:', error);
         alert('月ごとフィードバックの生成に失敗しました');
         
         // エラー時はボタンを再表示
+        document.getElementById('monthly-feedback-container').classList.add('hidden');
         document.getElementById('get-monthly-feedback-btn').classList.remove('hidden');
-        document.getElementById('monthly-feedback-loading-state').classList.add('hidden');
+        loadingState.classList.add('hidden');
     }
 }
 
-// 月ごとフィードバックが生成されるまでポーリングする
-function pollForMonthlyFeedback(year, month) {
-    let attempts = 0;
-    const maxAttempts = 15; // 最大15回試行 (合計約45秒)
-    const interval = 3000; // 3秒間隔
-
-    const intervalId = setInterval(async () => {
-        attempts++;
-        try {
-            const response = await fetch(`${API_BASE_URL}/diary/monthly-feedback/${year}/${month}`, {
-                headers: {
-                    'Authorization': `Bearer ${authToken}`
-                }
-            });
-
-            if (response.ok) {
-                const feedback = await response.json();
-                if (feedback && feedback.content) {
-                    clearInterval(intervalId);
-                    displayMonthlyFeedback(feedback.content);
-                    document.getElementById('monthly-feedback-loading-state').classList.add('hidden');
-                    return;
-                }
-            } else if (response.status === 404) {
-                // フィードバックがまだ生成されていない場合は静かに処理
-                return;
-            } else {
-                console.error('Monthly feedback polling error:', response.status, response.statusText);
-            }
-        } catch (error) {
-            console.error('Network error during monthly feedback polling:', error);
-        }
-
-        if (attempts >= maxAttempts) {
-            clearInterval(intervalId);
-            alert('月ごとフィードバックの取得に時間がかかっています。後ほど再度お試しください。');
-            document.getElementById('get-monthly-feedback-btn').classList.remove('hidden');
-            document.getElementById('monthly-feedback-loading-state').classList.add('hidden');
-        }
-    }, interval);
-}
-
 // 日記を削除する
 async function deleteDiary(diaryId) {
     // 確認ダイアログを表示
@@ -791,7 +746,7 @@ async function deleteDiary(diaryId) {
         });
         
         if (diariesResponse.ok) {
-            const diaries = await diariesResponse.json();
+            const diaries = (await diariesResponse.json()).items;
             generateCalendar(currentYear, currentMonth, diaries);
         }
         
@@ -939,7 +894,7 @@ async function submitDiary() {
         });
         
         if (diariesResponse.ok) {
-            const diaries = await diariesResponse.json();
+            const diaries = (await diariesResponse.json()).items;
             generateCalendar(currentYear, currentMonth, diaries);
         }
         
@@ -1044,18 +999,8 @@ function setupDiaryListeners() {
 // いいね機能（カードから呼び出し）
 async function toggleLikeFromCard(diaryId, likeBtn, likeCountElement) {
     try {
-        // 現在のいいね状態を確認
-        const checkResponse = await fetch(`${API_BASE_URL}/diary/${diaryId}/like`, {
-            headers: {
-                'Authorization': `Bearer ${authToken}`
-            }
-        });
-        
-        if (!checkResponse.ok) {
-            throw new Error('いいね状態の確認に失敗しました');
-        }
-        
-        const { is_liked } = await checkResponse.json();
+        // 現在のいいね状態はボタンの表示から判定する
+        const is_liked = likeBtn.classList.contains('active');
         
         let response;
         if (is_liked) {
@@ -1115,6 +1060,17 @@ async function toggleLikeFromCard(diaryId, likeBtn, likeCountElement) {
     }
 }
 
+// いいねボタンの表示を更新
+function setLikeButtonState(likeBtn, isLiked) {
+    if (isLiked) {
+        likeBtn.innerHTML = '<i class="fas fa-heart"></i> いいね済み';
+        likeBtn.classList.add('active');
+    } else {
+        likeBtn.innerHTML = '<i class="far fa-heart"></i> いいね';
+        likeBtn.classList.remove('active');
+    }
+}
+
 // いいね状態を確認して表示を更新
 async function checkAndUpdateLikeStatus(diaryId, likeBtn) {
     try {
@@ -1142,18 +1098,8 @@ async function checkAndUpdateLikeStatus(diaryId, likeBtn) {
 // いいね機能（詳細画面から呼び出し）
 async function toggleLike(diaryId) {
     try {
-        // 現在のいいね状態を確認
-        const checkResponse = await fetch(`${API_BASE_URL}/diary/${diaryId}/like`, {
-            headers: {
-                'Authorization': `Bearer ${authToken}`
-            }
-        });
-        
-        if (!checkResponse.ok) {
-            throw new Error('いいね状態の確認に失敗しました');
-        }
-        
-        const { is_liked } = await checkResponse.json();
+        // 現在のいいね状態はボタンの表示から判定する
+        const is_liked = document.getElementById('like-btn').classList.contains('active');
         
         let response;
         if (is_liked) {
@@ -104,7 +104,7 @@ async function viewFriendDiaries(friendId) {
             throw new Error(errorData.detail || 'フレンドの日記取得に失敗しました');
         }
         
-        const diaries = await response.json();
+        const diaries = (await response.json()).items;
         console.log('取得した特定フレンドの日記:', diaries);
         console.log('特定フレンドの日記数:', diaries.length);
         
@@ -13,7 +13,7 @@ async function loadNotifications() {
             throw new Error('通知の取得に失敗しました');
         }
         
-        const notifications = await response.json();
+        const notifications = (await response.json()).items;
         
         const notificationsListContainer = document.getElementById('notifications-list');
         
@@ -49,9 +49,11 @@ function createNotificationItem(notification) {
         item.classList.add('unread');
     }
     
+    // まとめた通知は人数も表示する
+    const count = notification.actor_count > 1 ? `（${notification.actor_count}人）` : '';
     item.innerHTML = `
-        <div class="notification-message">${notification.message}</div>
-        <div class="notification-time">${formatDate(notification.created_at)}</div>
+        <div class="notification-message">${notification.message}${count}</div>
+        <div class="notification-time">${formatDate(notification.updated_at || notification.created_at)}</div>
     `;
     
     // クリックイベント（既読にする）
@@ -120,7 +122,7 @@ async function markAllNotificationsAsRead() {
 // 未読通知数をチェック
 async function checkNotifications() {
     try {
-        const response = await fetch(`${API_BASE_URL}/friend/notifications?unread_only=true`, {
+        const response = await fetch(`${API_BASE_URL}/friend/notifications/count`, {
             headers: {
                 'Authorization': `Bearer ${authToken}`
             }
@@ -130,22 +132,130 @@ async function checkNotifications() {
             throw new Error('通知の取得に失敗しました');
         }
         
-        const notifications = await response.json();
+        // 未読件数だけを取得する（通知の一覧は読み込まない）
+        const { count } = await response.json();
         
         // 通知バッジを更新
-        const badge = document.getElementById('notification-badge');
-        if (notifications.length > 0) {
-            badge.textContent = notifications.length;
-            badge.classList.remove('hidden');
-        } else {
-            badge.classList.add('hidden');
-        }
+        updateNotificationBadge(count);
         
     } catch (error) {
         console.error('Error checking notifications:', error);
     }
 }
 
+// 通知のリアルタイム受信（WebSocket）
+let notificationSocket = null;
+let notificationSocketRetryMs = 1000;
+let notificationSocketTimer = null;
+
+// 通知のWebSocketに接続する（切断されたら間隔を空けて再接続する）
+function connectNotificationSocket() {
+    if (!authToken || notificationSocket) {
+        return;
+    }
+    
+    // ブラウザのWebSocketはヘッダーを付けられないため、トークンはクエリで渡す
+    const url = `${API_BASE_URL.replace(/^http/, 'ws')}/friend/notifications/ws?token=${encodeURIComponent(authToken)}`;
+    const socket = new WebSocket(url);
+    notificationSocket = socket;
+    
+    socket.addEventListener('open', () => {
+        notificationSocketRetryMs = 1000;
+    });
+    
+    socket.addEventListener('message', (message) => {
+        handleNotificationEvent(JSON.parse(message.data));
+    });
+    
+    socket.addEventListener('close', () => {
+        if (notificationSocket !== socket) {
+            return;
+        }
+        notificationSocket = null;
+        // ログイン中なら再接続する（失敗が続くほど間隔を延ばす）
+        if (authToken) {
+            notificationSocketTimer = setTimeout(connectNotificationSocket, notificationSocketRetryMs);
+            notificationSocketRetryMs = Math.min(notificationSocketRetryMs * 2, 30000);
+        }
+    });
+}
+
+// 通知のWebSocketを切断する（ログアウト時）
+function disconnectNotificationSocket() {
+    clearTimeout(notificationSocketTimer);
+    const socket = notificationSocket;
+    notificationSocket = null;
+    if (socket) {
+        socket.close();
+    }
+}
+
+// サーバーから届いたイベントを画面に反映する
+function handleNotificationEvent(event) {
+    switch (event.type) {
+        case 'snapshot':
+            updateNotificationBadge(event.unread_count);
+            updateRequestBadge(event.pending_count);
+            break;
+        case 'notification': {
+            updateNotificationBadge(event.unread_count);
+            // 通知一覧を表示済みなら先頭に追加する（まとめた通知が更新された場合は古い表示を置き換える）
+            const list = document.getElementById('notifications-list');
+            if (list && list.querySelector('.notification-item, .empty-state')) {
+                list.querySelector('.empty-state')?.remove();
+                list.querySelector(`.notification-item[data-id="${event.notification.id}"]`)?.remove();
+                list.prepend(createNotificationItem(event.notification));
+            }
+            break;
+        }
+        case 'unread_count':
+            updateNotificationBadge(event.unread_count);
+            break;
+        case 'friend_requests':
+            updateRequestBadge(event.pending_count);
+            break;
+        case 'like':
+            updateLikeCount(event.diary_id, event.like_count);
+            break;
+    }
+}
+
+// 通知バッジの件数を更新
+function updateNotificationBadge(count) {
+    const badge = document.getElementById('notification-badge');
+    if (count > 0) {
+        badge.textContent = count;
+        badge.classList.remove('hidden');
+    } else {
+        badge.classList.add('hidden');
+    }
+}
+
+// フレンドリクエストのバッジの件数を更新
+function updateRequestBadge(count) {
+    const badge = document.getElementById('request-badge');
+    if (count > 0) {
+        badge.textContent = count;
+        badge.classList.remove('hidden');
+    } else {
+        badge.classList.add('hidden');
+    }
+}
+
+// 表示中の日記のいいね数を更新
+function updateLikeCount(diaryId, likeCount) {
+    document.querySelectorAll(`.like-btn-card[data-id="${diaryId}"]`).forEach(button => {
+        const count = button.closest('.diary-card')?.querySelector('.like-count');
+        if (count) {
+            count.textContent = likeCount;
+        }
+    });
+    const detailLikeBtn = document.getElementById('like-btn');
+    if (detailLikeBtn && detailLikeBtn.getAttribute('data-id') === diaryId.toString()) {
+        document.getElementById('like-count').textContent = likeCount;
+    }
+}
+
 // 通知関連のイベントリスナー設定
 function setupNotificationListeners() {
     // すべて既読にするボタン